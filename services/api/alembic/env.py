@@ -5,7 +5,7 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
-from main import Base
+from models import Base
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,29 @@
+"""add user_tokens.mappings_version for worker-side mapping caches
+
+Revision ID: add_mappings_version
+Revises: add_user_updated_at
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_mappings_version'
+down_revision = 'add_user_updated_at'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if column exists before adding
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [column['name'] for column in inspector.get_columns('user_tokens')]
+
+    if 'mappings_version' not in columns:
+        op.add_column(
+            'user_tokens',
+            sa.Column('mappings_version', sa.Integer(), nullable=False, server_default='0')
+        )
+
+def downgrade():
+    op.drop_column('user_tokens', 'mappings_version')
@@ -0,0 +1,36 @@
+"""add encrypted refresh_token and expires_at to user_tokens
+
+Revision ID: add_token_refresh
+Revises: add_user_change_notify
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_token_refresh'
+down_revision = 'add_user_change_notify'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if columns exist before adding
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [column['name'] for column in inspector.get_columns('user_tokens')]
+
+    if 'refresh_token' not in columns:
+        op.add_column('user_tokens', sa.Column('refresh_token', sa.String(), nullable=True))
+    if 'expires_at' not in columns:
+        # Epoch seconds, as in Spotify's token_info; NULL until the user logs in again
+        op.add_column('user_tokens', sa.Column('expires_at', sa.Integer(), nullable=True))
+
+    indexes = [index['name'] for index in inspector.get_indexes('user_tokens')]
+    if 'idx_user_tokens_expires_at' not in indexes:
+        # The token refresher scans for the soonest-expiring tokens
+        op.create_index('idx_user_tokens_expires_at', 'user_tokens', ['expires_at'])
+
+def downgrade():
+    op.drop_index('idx_user_tokens_expires_at', table_name='user_tokens')
+    op.drop_column('user_tokens', 'expires_at')
+    op.drop_column('user_tokens', 'refresh_token')
@@ -0,0 +1,34 @@
+"""add tracks table caching Spotify track names and URIs
+
+Revision ID: add_tracks
+Revises: add_token_refresh
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tracks'
+down_revision = 'add_token_refresh'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if table exists before creating
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'tracks' not in tables:
+        # Shared by all users; filled from search results, saved songs and /v1/tracks
+        op.create_table(
+            'tracks',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('uri', sa.String(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+def downgrade():
+    op.drop_table('tracks')
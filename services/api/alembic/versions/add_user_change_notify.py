@@ -0,0 +1,48 @@
+"""notify listeners on the user_changes channel when a user row changes
+
+Revision ID: add_user_change_notify
+Revises: drop_redundant_mapping_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_change_notify'
+down_revision = 'drop_redundant_mapping_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Every token write and mapping change touches user_tokens (mapping saves bump
+    # mappings_version), so one trigger there covers all changes workers care about.
+    # NOTIFY is delivered when the writing transaction commits.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_changes', json_build_object(
+                'user_id', NEW.user_id,
+                'kind', CASE
+                    WHEN TG_OP = 'INSERT' THEN 'user_added'
+                    WHEN NEW.mappings_version IS DISTINCT FROM OLD.mappings_version
+                        THEN 'mappings_changed'
+                    ELSE 'token_refreshed'
+                END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute('DROP TRIGGER IF EXISTS user_tokens_notify_change ON user_tokens')
+    op.execute(
+        """
+        CREATE TRIGGER user_tokens_notify_change
+        AFTER INSERT OR UPDATE ON user_tokens
+        FOR EACH ROW EXECUTE FUNCTION notify_user_change()
+        """
+    )
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS user_tokens_notify_change ON user_tokens')
+    op.execute('DROP FUNCTION IF EXISTS notify_user_change()')
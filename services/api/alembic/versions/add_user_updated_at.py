@@ -0,0 +1,34 @@
+"""add user_tokens.updated_at for incremental user sync
+
+Revision ID: add_user_updated_at
+Revises: initial_schema
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_updated_at'
+down_revision = 'initial_schema'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if column exists before adding
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [column['name'] for column in inspector.get_columns('user_tokens')]
+
+    if 'updated_at' not in columns:
+        op.add_column(
+            'user_tokens',
+            sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.func.now())
+        )
+
+    indexes = [index['name'] for index in inspector.get_indexes('user_tokens')]
+    if 'idx_user_tokens_updated_at' not in indexes:
+        op.create_index('idx_user_tokens_updated_at', 'user_tokens', ['updated_at', 'user_id'])
+
+def downgrade():
+    op.drop_index('idx_user_tokens_updated_at')
+    op.drop_column('user_tokens', 'updated_at')
@@ -0,0 +1,31 @@
+"""add worker_leases for queue manager sharding
+
+Revision ID: add_worker_leases
+Revises: add_mappings_version
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_worker_leases'
+down_revision = 'add_mappings_version'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if table exists before creating
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'worker_leases' not in tables:
+        op.create_table(
+            'worker_leases',
+            sa.Column('worker_id', sa.String(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('worker_id')
+        )
+
+def downgrade():
+    op.drop_table('worker_leases')
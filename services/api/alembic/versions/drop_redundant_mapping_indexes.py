@@ -0,0 +1,32 @@
+"""serve mapping reads from the (user, trigger, queue) unique index
+
+Revision ID: drop_redundant_mapping_indexes
+Revises: unique_song_mappings
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'drop_redundant_mapping_indexes'
+down_revision = 'unique_song_mappings'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # uq_song_mappings_user_trigger_queue already is a composite btree on
+    # (user_id, trigger_song_id, queue_song_id): it serves every per-user read as an
+    # index-only scan, so the single-column indexes only add write overhead
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    indexes = [index['name'] for index in inspector.get_indexes('song_mappings')]
+
+    if 'idx_song_mappings_user_id' in indexes:
+        op.drop_index('idx_song_mappings_user_id', table_name='song_mappings')
+    # Nothing looks mappings up by trigger alone
+    if 'idx_song_mappings_trigger_song' in indexes:
+        op.drop_index('idx_song_mappings_trigger_song', table_name='song_mappings')
+
+def downgrade():
+    op.create_index('idx_song_mappings_user_id', 'song_mappings', ['user_id'])
+    op.create_index('idx_song_mappings_trigger_song', 'song_mappings', ['trigger_song_id'])
@@ -0,0 +1,43 @@
+"""deduplicate song_mappings and make (user, trigger, queue) unique
+
+Revision ID: unique_song_mappings
+Revises: add_worker_leases
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'unique_song_mappings'
+down_revision = 'add_worker_leases'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Check if constraint exists before creating
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    constraints = [
+        constraint['name'] for constraint in inspector.get_unique_constraints('song_mappings')
+    ]
+
+    if 'uq_song_mappings_user_trigger_queue' not in constraints:
+        # Keep one row per pair; earlier saves could store the same pair many times
+        op.execute(
+            """
+            DELETE FROM song_mappings a
+            USING song_mappings b
+            WHERE a.id > b.id
+              AND a.user_id = b.user_id
+              AND a.trigger_song_id = b.trigger_song_id
+              AND a.queue_song_id = b.queue_song_id
+            """
+        )
+        op.create_unique_constraint(
+            'uq_song_mappings_user_trigger_queue',
+            'song_mappings',
+            ['user_id', 'trigger_song_id', 'queue_song_id']
+        )
+
+def downgrade():
+    op.drop_constraint('uq_song_mappings_user_trigger_queue', 'song_mappings', type_='unique')
@@ -0,0 +1,81 @@
+"""Compact signed auth cookie carrying only the user id"""
+import time
+from typing import Optional
+
+import itsdangerous
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from common.cache import TTLCache
+
+
+class AuthCookieMiddleware:
+    """Puts the signed-in user id in `scope["user_id"]`; plain ASGI like RequestMetricsMiddleware.
+
+    The cookie holds `user_id.timestamp.signature` and nothing else; token
+    material is looked up server-side. Endpoints sign users in or out by setting
+    `request.scope["user_id"]`. Unlike Starlette's SessionMiddleware, which
+    re-serializes and re-signs the whole session into Set-Cookie on every response,
+    the cookie is only re-issued when it changes or is past half its max_age, so
+    sessions still slide without a Set-Cookie per request. Verified cookie values
+    are cached, so a returning cookie costs a dict lookup rather than an HMAC.
+    """
+
+    def __init__(
+        self,
+        app,
+        secret_key,
+        cookie_name="auth",
+        max_age=3600,
+        same_site="lax",
+        https_only=True,
+        verified_cache_size=10000,
+    ):
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(secret_key)
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.verified = TTLCache(verified_cache_size, max_age)
+        flags = f"path=/; httponly; samesite={same_site}"
+        self.flags = f"{flags}; secure" if https_only else flags
+
+    def load(self, value: Optional[str]):
+        """Return (user_id, issued_at) for a valid cookie value, else (None, None)"""
+        if not value:
+            return None, None
+        verified = self.verified.get(value, None)
+        if verified is None:
+            try:
+                user_id, issued_at = self.signer.unsign(value, return_timestamp=True)
+            except itsdangerous.BadSignature:
+                return None, None
+            verified = (user_id.decode(), issued_at.timestamp())
+            self.verified.set(value, verified)
+        if time.time() - verified[1] > self.max_age:
+            return None, None
+        return verified
+
+    def dump(self, user_id: str) -> str:
+        return self.signer.sign(user_id).decode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        user_id, issued_at = self.load(HTTPConnection(scope).cookies.get(self.cookie_name))
+        scope["user_id"] = user_id
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                current = scope.get("user_id")
+                if current != user_id or (current and time.time() - issued_at > self.max_age / 2):
+                    headers = MutableHeaders(scope=message)
+                    if current:
+                        value = f"{self.dump(current)}; Max-Age={self.max_age}"
+                    else:
+                        value = "null; Max-Age=0"
+                    headers.append("Set-Cookie", f"{self.cookie_name}={value}; {self.flags}")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,129 @@
+"""Per-request cost of the auth cookie compared with Starlette's SessionMiddleware.
+
+Calls three minimal in-process ASGI apps with the same endpoint, which reads
+the caller's access token: SessionMiddleware holding the full spotipy
+token_info (as the API used to), AuthCookieMiddleware with the token in an
+in-process TTLCache (as the API does now), and no auth at all for the
+framework's own cost. No sockets are involved, so the times are CPU only.
+Reports microseconds per request and the cookie bytes sent each way.
+
+Usage: python benchmarks/auth_overhead.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI, Request
+from starlette.middleware.sessions import SessionMiddleware
+
+from harness import LOAD_TEST_USER, SESSION_SECRET, auth_cookies, session_cookie
+from auth import AuthCookieMiddleware
+from common.cache import TTLCache
+
+# Shaped like what spotipy returns; Spotify access tokens run to a few hundred characters
+TOKEN_INFO = {
+    "access_token": "BQ" + os.urandom(135).hex(),
+    "token_type": "Bearer",
+    "expires_in": 3600,
+    "refresh_token": "AQ" + os.urandom(64).hex(),
+    "scope": "user-read-playback-state user-modify-playback-state",
+    "expires_at": int(time.time()) + 3600,
+}
+
+
+def session_app():
+    app = FastAPI()
+    app.add_middleware(
+        SessionMiddleware, secret_key=SESSION_SECRET, same_site="lax", https_only=True
+    )
+
+    @app.get("/token")
+    async def token(request: Request):
+        return {"length": len(request.session["token_info"]["access_token"])}
+
+    return app
+
+
+def auth_app():
+    app = FastAPI()
+    app.add_middleware(
+        AuthCookieMiddleware, secret_key=SESSION_SECRET, same_site="lax", https_only=True
+    )
+    cache = TTLCache(10000, 300)
+    cache.set(LOAD_TEST_USER, TOKEN_INFO)
+
+    @app.get("/token")
+    async def token(request: Request):
+        return {"length": len(cache.get(request.scope["user_id"])["access_token"])}
+
+    return app
+
+
+def plain_app():
+    app = FastAPI()
+
+    @app.get("/token")
+    async def token():
+        return {"length": len(TOKEN_INFO["access_token"])}
+
+    return app
+
+
+async def measure(app, cookie, requests):
+    """Seconds per request, request Cookie bytes and response Set-Cookie bytes"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": "/token",
+        "raw_path": b"/token",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"api")] + ([(b"cookie", cookie.encode())] if cookie else []),
+        "client": ("127.0.0.1", 1234),
+        "server": ("api", 443),
+    }
+    set_cookie_bytes = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal set_cookie_bytes
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+            set_cookie_bytes = sum(len(v) for k, v in message["headers"] if k == b"set-cookie")
+
+    for _ in range(requests // 10):  # warm up
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - started
+    return elapsed / requests, len(cookie), set_cookie_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    session = session_cookie({"user_id": LOAD_TEST_USER, "token_info": TOKEN_INFO})
+    variants = [
+        ("SessionMiddleware", session_app(), f"session={session}"),
+        ("AuthCookieMiddleware", auth_app(), f"auth={auth_cookies()['auth']}"),
+        ("no auth", plain_app(), ""),
+    ]
+    print(f"{'':<22}{'us/request':>11}{'cookie B':>10}{'set-cookie B':>14}")
+    for name, app, cookie in variants:
+        per_request, cookie_bytes, set_cookie_bytes = asyncio.run(
+            measure(app, cookie, args.requests)
+        )
+        print(f"{name:<22}{per_request * 1e6:>11.1f}{cookie_bytes:>10}{set_cookie_bytes:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""How fast a saved mapping reaches a queue worker, with and without /users/events.
+
+Runs the API against DATABASE_URL (migrated with alembic, so the NOTIFY
+trigger exists) and an in-process queue worker that only syncs. Each
+trial saves a new mapping and times how long until the worker's mapping
+index has it. Also counts /users/sync and /users/mappings calls while no
+mappings change.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/change_latency.py [--trials 20]
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+from harness import (
+    ApiServer,
+    LOAD_TEST_USER,
+    SERVICES_DIR,
+    auth_cookies,
+    seed_user,
+)
+from spotify_sim import SpotifySimulator
+
+QUEUE_MANAGER_DIR = os.path.join(SERVICES_DIR, "queue_manager")
+
+
+def load_queue_manager():
+    # Both services call their entry module "main"; load the worker's under another name
+    sys.path.append(QUEUE_MANAGER_DIR)
+    spec = importlib.util.spec_from_file_location(
+        "queue_manager_main", os.path.join(QUEUE_MANAGER_DIR, "main.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.QueueManager
+
+
+async def follow(manager):
+    while True:
+        await manager.sync_if_due()
+        await manager.wait_for_tick()
+
+
+async def measure(base_url, QueueManager, use_events, trials, idle):
+    manager = QueueManager(f"{base_url}/v1")
+    cookies = auth_cookies()
+    async with manager.create_client(), httpx.AsyncClient(
+        base_url=base_url, cookies=cookies, timeout=30
+    ) as client:
+        tasks = [asyncio.create_task(follow(manager))]
+        if use_events:
+            tasks.append(asyncio.create_task(manager.watch_changes()))
+            while not manager.events_connected:
+                await asyncio.sleep(0.05)
+        await asyncio.sleep(1)
+
+        latencies = []
+        for _ in range(trials):
+            trigger = uuid.uuid4().hex
+            started = time.perf_counter()
+            songs = [{"id": trigger, "name": None, "uri": None}, {"id": "next", "name": None, "uri": None}]
+            response = await client.post("/v1/songs/relationships", json={"songs": songs})
+            response.raise_for_status()
+            while trigger not in manager.get_user_mappings(LOAD_TEST_USER):
+                await asyncio.sleep(0.001)
+            latencies.append(time.perf_counter() - started)
+
+        before = manager.call_counts.copy()
+        await asyncio.sleep(idle)
+        idle_calls = manager.call_counts - before
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, idle_calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--idle", type=float, default=20)
+    args = parser.parse_args()
+
+    QueueManager = load_queue_manager()
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    asyncio.run(seed_user(0))
+    api = ApiServer(spotify_url)
+    try:
+        api.wait_ready()
+        for use_events in (False, True):
+            latencies, idle_calls = asyncio.run(
+                measure(api.base_url, QueueManager, use_events, args.trials, args.idle)
+            )
+            latencies.sort()
+            print(
+                f"{'events' if use_events else 'polling':>8}: "
+                f"save->worker p50={statistics.median(latencies) * 1000:8.1f}ms "
+                f"max={latencies[-1] * 1000:8.1f}ms  "
+                f"in {args.idle:.0f}s idle: {idle_calls['api GET /users/sync']} syncs, "
+                f"{idle_calls['api POST /users/mappings']} mapping fetches"
+            )
+    finally:
+        api.stop()
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Shared pieces for API load tests: a seeded database and a gunicorn launcher.
+
+The fake Spotify is services/benchmarks/spotify_sim.py, put on sys.path here.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import itsdangerous
+from cryptography.fernet import Fernet
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.dirname(API_DIR)
+SESSION_SECRET = "load-test-secret"
+LOAD_TEST_USER = "load-test-user"
+
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+os.environ["JWT_SECRET"] = SESSION_SECRET
+sys.path[:0] = [API_DIR, SERVICES_DIR, os.path.join(SERVICES_DIR, "benchmarks")]
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def session_cookie(session):
+    """Sign a session the same way Starlette's SessionMiddleware does"""
+    data = base64.b64encode(json.dumps(session).encode())
+    return itsdangerous.TimestampSigner(SESSION_SECRET).sign(data).decode()
+
+
+def auth_cookies(user_id=LOAD_TEST_USER):
+    """Cookies signing `user_id` in, as the API's AuthCookieMiddleware issues them"""
+    return {"auth": itsdangerous.TimestampSigner(SESSION_SECRET).sign(user_id).decode()}
+
+
+def migrate():
+    """Bring DATABASE_URL up to the latest schema, as the container does on start"""
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=API_DIR,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([API_DIR, SERVICES_DIR])},
+        check=True,
+        capture_output=True,
+    )
+
+
+async def seed_user(mapping_count):
+    """Create the load test user with a chain of `mapping_count` mappings"""
+    from sqlalchemy import delete
+
+    from database import SessionLocal, create_engine
+    from main import encrypt_token
+    from models import SongMapping, UserToken
+
+    migrate()
+    engine = create_engine()
+    async with SessionLocal() as db:
+        # The simulator tells users apart by their "token-<user_id>" bearer token
+        access_token = encrypt_token(f"token-{LOAD_TEST_USER}")
+        await db.merge(UserToken(user_id=LOAD_TEST_USER, access_token=access_token))
+        # Start from an empty mapping table so earlier runs don't skew results
+        await db.execute(delete(SongMapping).where(SongMapping.user_id == LOAD_TEST_USER))
+        await db.commit()
+    songs = [{"id": f"track{i}", "name": None, "uri": None} for i in range(mapping_count + 1)]
+    await engine.dispose()
+    return songs
+
+
+class ApiServer:
+    """Runs the API in a subprocess with the production gunicorn settings"""
+
+    def __init__(self, spotify_base_url, workers=1, extra_env=None):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        env = {
+            **os.environ,
+            "SPOTIFY_API_BASE_URL": spotify_base_url,
+            "SPOTIFY_TOKEN_URL": spotify_base_url.removesuffix("/v1") + "/api/token",
+            "PYTHONPATH": os.pathsep.join([API_DIR, SERVICES_DIR]),
+            "BIND": f"127.0.0.1:{self.port}",
+            "WEB_CONCURRENCY": str(workers),
+            **(extra_env or {}),
+        }
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app",
+                "--log-level", "warning",
+            ],
+            cwd=API_DIR,
+            env=env,
+        )
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/v1/health").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("API did not become ready")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+async def run_clients(client, path, concurrency, duration, params=None, headers=None):
+    """Hit `path` from `concurrency` loops for `duration` seconds; return latencies.
+
+    `params` may be a callable to send different query parameters per request.
+    304 Not Modified counts as a success so conditional requests can be measured.
+    """
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    async def loop():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = await client.get(
+                path, params=params() if callable(params) else params, headers=headers
+            )
+            if response.status_code != 304:
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies
+
+
+def summarize(latencies, duration):
+    latencies = sorted(latencies)
+    if not latencies:
+        return "no requests completed"
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    return f"{len(latencies) / duration:8.1f} req/s  p50={p50:8.2f}ms  p99={p99:8.2f}ms"
@@ -0,0 +1,93 @@
+"""Stream a large mapping graph through /mappings/import and /mappings/export.
+
+Reports throughput, time to first byte, and the API process's peak RSS
+after each step (Linux only), with the buffered GET /mappings last for
+comparison since peak RSS never goes down.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/load_export_import.py [--mappings 200000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from harness import ApiServer, LOAD_TEST_USER, auth_cookies, seed_user
+from spotify_sim import SpotifySimulator
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+async def ndjson_body(count):
+    for start in range(0, count, 1000):
+        yield "".join(
+            json.dumps({"trigger_song_id": f"track{i}", "queue_song_id": f"track{i + 1}"}) + "\n"
+            for i in range(start, min(start + 1000, count))
+        ).encode()
+
+
+async def measure(api, count):
+    path = f"/v1/users/{LOAD_TEST_USER}/mappings"
+    async with httpx.AsyncClient(
+        base_url=api.base_url, cookies=auth_cookies(), timeout=600
+    ) as client:
+        started = time.perf_counter()
+        response = await client.post(f"{path}/import", content=ndjson_body(count))
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        print(
+            f"import:        {count / elapsed:9.0f} rows/s  {elapsed:7.2f}s  "
+            f"{response.json()}  peak rss {peak_rss_mb(api.process.pid):.0f}MB"
+        )
+
+        started = time.perf_counter()
+        first_byte = None
+        rows = 0
+        async with client.stream("GET", f"{path}/export") as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                rows += bool(line)
+        elapsed = time.perf_counter() - started
+        print(
+            f"export:        {rows / elapsed:9.0f} rows/s  {elapsed:7.2f}s  "
+            f"first byte {first_byte * 1000:.0f}ms  peak rss {peak_rss_mb(api.process.pid):.0f}MB"
+        )
+
+        started = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        print(
+            f"buffered GET:  {len(response.json()) / elapsed:9.0f} rows/s  {elapsed:7.2f}s  "
+            f"peak rss {peak_rss_mb(api.process.pid):.0f}MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mappings", type=int, default=200000)
+    args = parser.parse_args()
+
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    asyncio.run(seed_user(0))
+    api = ApiServer(spotify_url)
+    try:
+        api.wait_ready()
+        asyncio.run(measure(api, args.mappings))
+    finally:
+        api.stop()
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
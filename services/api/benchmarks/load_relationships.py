@@ -0,0 +1,85 @@
+"""Latency of GET /v1/songs/relationships: plain, revalidated with If-None-Match, and
+with slow /v1/search calls in flight.
+
+Seeds one user in DATABASE_URL, points the API at a fake Spotify whose
+search takes --search-delay seconds, and runs the API under uvicorn.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/load_relationships.py
+"""
+import argparse
+import asyncio
+import itertools
+
+import httpx
+
+from harness import (
+    ApiServer,
+    auth_cookies,
+    run_clients,
+    seed_user,
+    summarize,
+)
+from spotify_sim import SpotifySimulator
+
+
+async def measure(base_url, songs, args):
+    cookies = auth_cookies()
+    query_ids = itertools.count()
+    limits = httpx.Limits(max_connections=args.readers + args.searchers)
+    async with httpx.AsyncClient(
+        base_url=base_url, cookies=cookies, limits=limits, timeout=60
+    ) as client:
+        response = await client.post("/v1/songs/relationships", json={"songs": songs})
+        response.raise_for_status()
+
+        alone = await run_clients(client, "/v1/songs/relationships", args.readers, args.duration)
+        print(f"relationships alone:        {summarize(alone, args.duration)}")
+
+        etag = (await client.get("/v1/songs/relationships")).headers["etag"]
+        revalidated = await run_clients(
+            client,
+            "/v1/songs/relationships",
+            args.readers,
+            args.duration,
+            headers={"If-None-Match": etag},
+        )
+        print(f"relationships revalidated:  {summarize(revalidated, args.duration)}")
+
+        contended, searches = await asyncio.gather(
+            run_clients(client, "/v1/songs/relationships", args.readers, args.duration),
+            # Unique queries so every search misses the cache and waits on Spotify
+            run_clients(
+                client,
+                "/v1/search",
+                args.searchers,
+                args.duration,
+                params=lambda: {"q": f"slow {next(query_ids)}"},
+            ),
+        )
+        print(f"relationships under search: {summarize(contended, args.duration)}")
+        print(f"search ({args.search_delay}s upstream):    {summarize(searches, args.duration)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--searchers", type=int, default=20)
+    parser.add_argument("--search-delay", type=float, default=1.0)
+    parser.add_argument("--mappings", type=int, default=200)
+    args = parser.parse_args()
+
+    spotify = SpotifySimulator(search_latency=args.search_delay)
+    spotify_url = spotify.start()
+    songs = asyncio.run(seed_user(args.mappings))
+    api = ApiServer(spotify_url)
+    try:
+        api.wait_ready()
+        asyncio.run(measure(api.base_url, songs, args))
+    finally:
+        api.stop()
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Time POST /v1/songs/relationships for long chains, first save and re-save.
+
+Needs Postgres (the save path uses INSERT ... ON CONFLICT).
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/load_save_chain.py [--sizes 100 1000 5000]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from harness import ApiServer, auth_cookies, seed_user
+from spotify_sim import SpotifySimulator
+
+
+async def measure(base_url, sizes):
+    cookies = auth_cookies()
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, timeout=300) as client:
+        print(f"{'chain':>7} {'save ms':>9} {'inserted':>9} {'re-save ms':>11} {'skipped':>8}")
+        for size in sizes:
+            prefix = uuid.uuid4().hex[:8]
+            songs = [{"id": f"{prefix}{i}", "name": None, "uri": None} for i in range(size + 1)]
+            timings = []
+            for _ in range(2):
+                started = time.perf_counter()
+                response = await client.post("/v1/songs/relationships", json={"songs": songs})
+                response.raise_for_status()
+                timings.append(((time.perf_counter() - started) * 1000, response.json()))
+            (save_ms, first), (resave_ms, second) = timings
+            print(
+                f"{size:>7} {save_ms:>9.1f} {first['inserted']:>9} "
+                f"{resave_ms:>11.1f} {second['skipped']:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    asyncio.run(seed_user(0))
+    api = ApiServer(spotify_url)
+    try:
+        api.wait_ready()
+        asyncio.run(measure(api.base_url, args.sizes))
+    finally:
+        api.stop()
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Throughput of the API as gunicorn worker processes are added.
+
+Seeds one user with --mappings mappings and, for each worker count, drives
+GET /v1/songs/relationships (CPU-bound serialization plus one indexed
+query) and GET /v1/health (framework overhead only) from --clients
+concurrent connections. Throughput should grow with workers up to the
+number of cores.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/load_workers.py [--workers 1 2 4]
+"""
+import argparse
+import asyncio
+import os
+
+import httpx
+
+from harness import (
+    ApiServer,
+    auth_cookies,
+    run_clients,
+    seed_user,
+    summarize,
+)
+from spotify_sim import SpotifySimulator
+
+
+async def measure(base_url, songs, args):
+    cookies = auth_cookies()
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(
+        base_url=base_url, cookies=cookies, limits=limits, timeout=60
+    ) as client:
+        response = await client.post("/v1/songs/relationships", json={"songs": songs})
+        response.raise_for_status()
+        relationships = await run_clients(
+            client, "/v1/songs/relationships", args.clients, args.duration
+        )
+        health = await run_clients(client, "/v1/health", args.clients, args.duration)
+    return summarize(relationships, args.duration), summarize(health, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count()])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mappings", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    try:
+        for workers in dict.fromkeys(args.workers):
+            songs = asyncio.run(seed_user(args.mappings))
+            api = ApiServer(spotify_url, workers=workers)
+            try:
+                api.wait_ready()
+                relationships, health = asyncio.run(measure(api.base_url, songs, args))
+            finally:
+                api.stop()
+            print(f"{workers} workers  relationships {relationships}")
+            print(f"{' ' * len(str(workers))}          health        {health}")
+    finally:
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
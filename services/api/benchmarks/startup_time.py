@@ -0,0 +1,86 @@
+"""Time what a container restart waits on before the API answers health checks.
+
+Measures, as medians over --repeat runs: the no-op `alembic upgrade head`
+the container runs before starting the server, a bare `import main`, and,
+for each --workers count, the time from launching gunicorn to the first
+200 from /v1/health plus the latency of the first database-backed request.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/startup_time.py [--workers 1 2]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from harness import API_DIR, SERVICES_DIR, LOAD_TEST_USER, ApiServer, seed_user
+from spotify_sim import SpotifySimulator
+
+ENV = {**os.environ, "PYTHONPATH": os.pathsep.join([API_DIR, SERVICES_DIR])}
+
+
+def time_command(args):
+    started = time.perf_counter()
+    subprocess.run(args, cwd=API_DIR, env=ENV, check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def time_until_ready(spotify_url, workers):
+    """Seconds until /v1/health answers, and the first /v1/users/{id}/mappings latency"""
+    started = time.perf_counter()
+    api = ApiServer(spotify_url, workers=workers)
+    try:
+        with httpx.Client(base_url=api.base_url) as client:
+            while True:
+                try:
+                    if client.get("/v1/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() - started > 60:
+                    raise RuntimeError("API did not become ready")
+                time.sleep(0.01)
+            ready = time.perf_counter() - started
+            request_started = time.perf_counter()
+            client.get(f"/v1/users/{LOAD_TEST_USER}/mappings").raise_for_status()
+            first_query = time.perf_counter() - request_started
+    finally:
+        api.stop()
+    return ready, first_query
+
+
+def median_ms(samples):
+    return f"{statistics.median(samples) * 1000:8.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(seed_user(0))
+    migrate = [time_command([sys.executable, "-m", "alembic", "upgrade", "head"]) for _ in range(args.repeat)]
+    print(f"alembic upgrade head (no-op)  {median_ms(migrate)}")
+    imports = [time_command([sys.executable, "-c", "import main"]) for _ in range(args.repeat)]
+    print(f"import main                   {median_ms(imports)}")
+
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    try:
+        for workers in dict.fromkeys(args.workers):
+            runs = [time_until_ready(spotify_url, workers) for _ in range(args.repeat)]
+            print(
+                f"{workers} workers: healthy after   {median_ms([ready for ready, _ in runs])}, "
+                f"first query {median_ms([query for _, query in runs])}"
+            )
+    finally:
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Time the background refresher renewing a backlog of expiring tokens.
+
+Seeds --users users whose tokens expire in a minute, starts the API with a
+fake Spotify token endpoint taking --token-delay seconds per refresh, and
+waits until every token is good for another hour. Runs once per
+--concurrency value.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/token_refresh.py [--users 2000]
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import delete, func, insert, select
+
+from harness import ApiServer, migrate
+from spotify_sim import SpotifySimulator
+
+USER_PREFIX = "refresh-test-"
+
+
+async def seed_users(count):
+    from database import SessionLocal, create_engine
+    from main import encrypt_token
+    from models import UserToken
+
+    migrate()
+    engine = create_engine()
+    async with SessionLocal() as db:
+        await db.execute(
+            delete(UserToken).where(UserToken.user_id.like(f"{USER_PREFIX}%"))
+        )
+        expires_at = int(time.time()) + 60
+        await db.execute(
+            insert(UserToken),
+            [
+                {
+                    "user_id": f"{USER_PREFIX}{n}",
+                    "access_token": encrypt_token("expiring"),
+                    "refresh_token": encrypt_token(f"refresh-{n}"),
+                    "expires_at": expires_at,
+                    "mappings_version": 0,
+                }
+                for n in range(count)
+            ],
+        )
+        await db.commit()
+    await engine.dispose()
+
+
+async def expiring_count():
+    from database import SessionLocal, create_engine
+    from models import UserToken
+
+    engine = create_engine()
+    async with SessionLocal() as db:
+        count = await db.scalar(
+            select(func.count()).where(
+                UserToken.user_id.like(f"{USER_PREFIX}%"),
+                UserToken.expires_at < int(time.time()) + 1800,
+            )
+        )
+    await engine.dispose()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    spotify = SpotifySimulator(token_latency=args.token_delay)
+    spotify_url = spotify.start()
+    try:
+        for concurrency in args.concurrency:
+            asyncio.run(seed_users(args.users))
+            refreshes_before = spotify.calls["POST /api/token"]
+            started = time.perf_counter()
+            api = ApiServer(
+                spotify_url,
+                extra_env={
+                    "TOKEN_REFRESH_CONCURRENCY": str(concurrency),
+                    "TOKEN_REFRESH_INTERVAL": "1",
+                },
+            )
+            try:
+                api.wait_ready()
+                while asyncio.run(expiring_count()):
+                    time.sleep(0.2)
+                elapsed = time.perf_counter() - started
+            finally:
+                api.stop()
+            refreshes = spotify.calls["POST /api/token"] - refreshes_before
+            print(
+                f"concurrency {concurrency:>3}: {args.users} tokens in {elapsed:6.2f}s "
+                f"({args.users / elapsed:7.1f}/s), {refreshes} token requests"
+            )
+    finally:
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Cost of filling in track names on GET /v1/songs/relationships.
+
+Saves a chain of --mappings songs the API has never seen (ids only, as an
+NDJSON import or an old client would), then reads the relationships:
+cold (names fetched from the fake Spotify's /v1/tracks), warm (in-process
+cache), after an API restart (tracks table), and for a chain saved with
+client-supplied names (ignored, so resolved like ids only). Reports latency,
+names from Spotify and /v1/tracks requests for each.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/track_metadata.py [--mappings 1000]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from harness import ApiServer, auth_cookies, seed_user
+from spotify_sim import SpotifySimulator
+
+
+def read_relationships(base_url, spotify, label):
+    requests_before = spotify.calls["GET /v1/tracks"]
+    with httpx.Client(base_url=base_url, cookies=auth_cookies(), timeout=60) as client:
+        started = time.perf_counter()
+        response = client.get("/v1/songs/relationships")
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+    track_requests = spotify.calls["GET /v1/tracks"] - requests_before
+    items = response.json()["relationships"].values()
+    # The fake Spotify names every track "Track <id>"
+    named = sum(1 for item in items if (item["name"] or "").startswith("Track "))
+    print(
+        f"{label:<28}{elapsed * 1000:8.1f}ms  {named:>5}/{len(items)} named by Spotify  "
+        f"{track_requests:>3} /v1/tracks requests  "
+        f"etag={'yes' if 'etag' in response.headers else 'no'}"
+    )
+
+
+def save_chain(base_url, songs):
+    with httpx.Client(base_url=base_url, cookies=auth_cookies(), timeout=300) as client:
+        client.post("/v1/songs/relationships", json={"songs": songs}).raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mappings", type=int, default=1000)
+    args = parser.parse_args()
+
+    spotify = SpotifySimulator()
+    spotify_url = spotify.start()
+    asyncio.run(seed_user(0))
+    prefix = uuid.uuid4().hex[:8]
+    try:
+        api = ApiServer(spotify_url)
+        try:
+            api.wait_ready()
+            save_chain(
+                api.base_url,
+                [{"id": f"{prefix}{i}", "name": None, "uri": None} for i in range(args.mappings + 1)],
+            )
+            read_relationships(api.base_url, spotify, "ids only, cold")
+            read_relationships(api.base_url, spotify, "ids only, cached")
+        finally:
+            api.stop()
+
+        api = ApiServer(spotify_url)
+        try:
+            api.wait_ready()
+            read_relationships(api.base_url, spotify, "ids only, after restart")
+            asyncio.run(seed_user(0))
+            save_chain(
+                api.base_url,
+                [
+                    {"id": f"{prefix}n{i}", "name": f"Song {i}", "uri": f"spotify:track:{prefix}n{i}"}
+                    for i in range(args.mappings + 1)
+                ],
+            )
+            read_relationships(api.base_url, spotify, "saved with client names")
+        finally:
+            api.stop()
+    finally:
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
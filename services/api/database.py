@@ -0,0 +1,31 @@
+"""Database URLs, engine factory and the session factory the app binds on startup"""
+import os
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/spotify_queue")
+# Requests are served from the event loop, so the app talks to Postgres through asyncpg;
+# alembic keeps using the synchronous DATABASE_URL
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# Unbound until create_engine() runs in the app's lifespan (or a script binds it)
+SessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def create_engine():
+    """Build the pooled async engine and bind SessionLocal to it.
+
+    Per process: with N server workers Postgres sees up to N * (pool size + overflow)
+    connections, plus one LISTEN connection each.
+    """
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        # Replaces connections Postgres dropped (restarts, idle timeouts) before they fail a request
+        pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    )
+    SessionLocal.configure(bind=engine)
+    return engine
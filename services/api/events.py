@@ -0,0 +1,98 @@
+"""Postgres LISTEN/NOTIFY fan-out for pushing user changes to queue workers"""
+import asyncio
+import contextlib
+import json
+import logging
+from collections import Counter
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Sent when listeners may have missed notifications and should sync from their cursor
+RESYNC_EVENT = json.dumps({"kind": "resync"})
+
+
+class ChangeBroker:
+    """LISTENs on a Postgres channel and fans each NOTIFY payload out to subscribers.
+
+    One dedicated connection per API process; subscribers get an asyncio.Queue of
+    payload strings. A subscriber that falls queue_size events behind has its
+    backlog replaced by a single resync event.
+    """
+
+    def __init__(self, dsn, channel, queue_size=1000, retry_delay=1.0, max_retry_delay=30.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.queue_size = queue_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.subscribers = set()
+        self.connected = False
+        self.task = None
+        self.stats = Counter()
+
+    def start(self):
+        self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+
+    async def listen(self):
+        """Hold a LISTEN connection open, reconnecting with backoff when it drops"""
+        delay = self.retry_delay
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+            except Exception as e:
+                logger.warning(f"Cannot LISTEN on {self.channel}, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            try:
+                await connection.add_listener(self.channel, self.on_notify)
+                self.connected = True
+                delay = self.retry_delay
+                # Changes committed while nobody was listening were never delivered
+                self.publish(RESYNC_EVENT)
+                await closed.wait()
+                logger.warning(f"Lost LISTEN connection on {self.channel}, reconnecting")
+            except Exception as e:
+                logger.warning(f"Error listening on {self.channel}: {str(e)}")
+                await asyncio.sleep(delay)
+            finally:
+                self.connected = False
+                connection.terminate()
+
+    def on_notify(self, connection, pid, channel, payload):
+        self.publish(payload)
+
+    def publish(self, payload):
+        self.stats["published"] += 1
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Individual events no longer matter once a subscriber is this far behind
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+                self.stats["overflows"] += 1
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self):
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers.discard(queue)
+
+    def as_dict(self):
+        return {"connected": self.connected, "subscribers": len(self.subscribers), **self.stats}
@@ -0,0 +1,42 @@
+"""Production server settings: gunicorn managing uvicorn worker processes"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# The app is async, so one process per core is enough to use every core
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Longer than the clients' HTTP_KEEPALIVE_EXPIRY (60s) so pooled connections are
+# never reused at the moment the server closes them
+keepalive = 75
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+# Import the app once in the master and fork workers from it instead of importing it
+# in every worker. Connections and clients are opened per worker in the app's lifespan,
+# so nothing is shared across the fork. A single worker gains nothing and pays for the fork.
+preload_app = os.getenv("PRELOAD_APP", str(workers > 1)).lower() == "true"
+# Heartbeat files on tmpfs; a slow overlay filesystem can get workers killed
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-" if os.getenv("ACCESS_LOG", "false").lower() == "true" else None
+
+# Metrics from every worker are merged through files in this directory. It has to be
+# set before prometheus_client is first imported, in this process and the workers.
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Files left by a previous run would be merged into this run's metrics
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,66 @@
+"""Request and database instrumentation for the API's /metrics endpoint"""
+import time
+
+from prometheus_client import Histogram
+from sqlalchemy import event
+
+from common.metrics import CALL_BUCKETS
+
+REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+    buckets=CALL_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "api_db_query_duration_seconds",
+    "Database statement latency by operation",
+    ["operation"],
+    buckets=CALL_BUCKETS,
+)
+
+
+class RequestMetricsMiddleware:
+    """Times every HTTP request; plain ASGI so streaming responses pass straight through"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; label by its template so
+            # per-user paths don't each get their own series
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"], route.path if route else "unmatched", status
+            ).observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    """Record the duration of every statement run through `engine` (sync or async)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started)
@@ -1,57 +1,82 @@
+import asyncio
+import functools
+import json
 import logging
 import os
-from datetime import datetime
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from typing import List, Optional
 from uuid import uuid4
 
+import httpx
 import requests
 import uvicorn
 from cryptography.fernet import Fernet
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from spotipy import Spotify
+from pydantic import BaseModel, Field, ValidationError
+from requests.adapters import HTTPAdapter
 from spotipy.oauth2 import SpotifyOAuth
-from spotipy.cache_handler import FlaskSessionCacheHandler
-from sqlalchemy import Column, DateTime, ForeignKey, String, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
-from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import RedirectResponse
+from spotipy.cache_handler import MemoryCacheHandler
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+
+from auth import AuthCookieMiddleware
+from common.cache import CoalescingCache, TTLCache
+from database import DATABASE_URL, SessionLocal, create_engine
+from events import RESYNC_EVENT, ChangeBroker
+from instrumentation import RequestMetricsMiddleware, instrument_engine
+from common.http_client import HTTP_MAX_KEEPALIVE, ConnectionStats, create_async_client
+from common.metrics import register_stats, render_metrics
+from common.spotify_client import SpotifyClient, SpotifyUnavailableError
+from models import SongMapping, UserToken, WorkerLease
+from tracks import TrackMetadata
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
+# httpx logs every outbound request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
-
-# Initialize encryption
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY").encode()
-cipher_suite = Fernet(ENCRYPTION_KEY)
-
-# Database Models
-Base = declarative_base()
-
-
-class UserToken(Base):
-    __tablename__ = "user_tokens"
-    user_id = Column(String, primary_key=True)
-    access_token = Column(String, nullable=False)
-    date_added = Column(DateTime, default=datetime.utcnow)
-
-
-class SongMapping(Base):
-    __tablename__ = "song_mappings"
-    id = Column(String, primary_key=True)
-    user_id = Column(String, ForeignKey("user_tokens.user_id"))
-    trigger_song_id = Column(String, nullable=False)
-    queue_song_id = Column(String, nullable=False)
+WORKER_LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "30"))
+MAPPING_INSERT_BATCH_SIZE = 1000
+MAPPING_EXPORT_CHUNK_SIZE = 1000
+# An exported mapping line is about 70 bytes; anything far longer is not one
+MAPPING_IMPORT_MAX_LINE_BYTES = int(os.getenv("MAPPING_IMPORT_MAX_LINE_BYTES", "4096"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+TOKEN_REFRESH_INTERVAL = int(os.getenv("TOKEN_REFRESH_INTERVAL", "60"))
+TOKEN_REFRESH_AHEAD = int(os.getenv("TOKEN_REFRESH_AHEAD", "600"))
+TOKEN_REFRESH_BATCH_SIZE = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "500"))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "10"))
+TOKEN_INFO_CACHE_SIZE = int(os.getenv("TOKEN_INFO_CACHE_SIZE", "10000"))
+TOKEN_INFO_CACHE_TTL = int(os.getenv("TOKEN_INFO_CACHE_TTL", "300"))
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "100000"))
+TRACK_CACHE_TTL = int(os.getenv("TRACK_CACHE_TTL", "86400"))
+# Cached tokens are reloaded (and refreshed if needed) this long before they expire
+TOKEN_EXPIRY_MARGIN = 60
+USER_CHANGES_CHANNEL = "user_changes"
+USER_EVENTS_KEEPALIVE = int(os.getenv("USER_EVENTS_KEEPALIVE", "15"))
+# updated_at is stamped when a statement runs, not when its transaction commits, so
+# rows can appear behind a cursor. Final sync cursors never pass now minus this many
+# seconds; rows in that window are sent again, which workers handle idempotently.
+SYNC_CURSOR_OVERLAP = int(os.getenv("SYNC_CURSOR_OVERLAP", "60"))
+# Most users per /users/sync page or /users/mappings request
+SYNC_MAX_USERS = 5000
 
 
 # Pydantic Models
 class TokenInfo(BaseModel):
     access_token: str
     refresh_token: Optional[str]
-    expires_at: int
+    # Unknown for users stored before expiries were recorded
+    expires_at: Optional[int]
 
 
 class UserTokenCreate(BaseModel):
@@ -68,6 +93,10 @@ class SongMappingCreate(BaseModel):
     queue_song_id: str
 
 
+class UserMappingsRequest(BaseModel):
+    user_ids: List[str] = Field(max_length=SYNC_MAX_USERS)
+
+
 class CurrentSongRequest(BaseModel):
     song_id: str
 
@@ -87,16 +116,83 @@ class AuthStatus(BaseModel):
     token_info: Optional[TokenInfo]
 
 
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/spotify_queue")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+# Outbound request counters; the clients themselves are created in lifespan()
+http_stats = ConnectionStats()
+
+# Search results are shared between users; set SEARCH_CACHE_REDIS_URL to share across workers
+search_cache = CoalescingCache(
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    redis_url=os.getenv("SEARCH_CACHE_REDIS_URL"),
+    namespace="search",
+)
+
+# Decrypted token_info by user id, so signed-in requests skip the database and Fernet
+token_info_cache = TTLCache(TOKEN_INFO_CACHE_SIZE, TOKEN_INFO_CACHE_TTL)
+
+# Names and URIs for mapped tracks, captured from search results and saved songs
+track_metadata = TrackMetadata(TRACK_CACHE_SIZE, TRACK_CACHE_TTL)
+
+# Fed by the user_tokens NOTIFY trigger (see the add_user_change_notify migration)
+change_broker = ChangeBroker(DATABASE_URL, USER_CHANGES_CHANNEL)
+
+# Counters for the background token refresher
+token_refresh_stats = Counter()
+
+# spotipy's OAuth helper only speaks requests, so give it one pooled session
+oauth_session = requests.Session()
+oauth_session.mount(
+    "https://", HTTPAdapter(pool_connections=HTTP_MAX_KEEPALIVE, pool_maxsize=HTTP_MAX_KEEPALIVE)
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database pool and HTTP clients in the worker process that serves requests.
+
+    Nothing here runs at import, so alembic, scripts and a preloading gunicorn master
+    import the app without touching Postgres or creating event-loop-bound clients.
+    """
+    get_cipher()
+    engine = create_engine()
+    instrument_engine(engine)
+    # Pay for the first connection now rather than in the first request
+    async with engine.connect():
+        pass
+    app.state.http_client = create_async_client(stats=http_stats)
+    # A request waiting out a Retry-After block would just hang until the proxy
+    # times out, so the API answers 503 straight away instead
+    app.state.spotify_client = SpotifyClient(app.state.http_client, max_retry_after=0)
+    change_broker.start()
+    token_refresher = asyncio.create_task(refresh_expiring_tokens(app.state.http_client))
+    try:
+        yield
+    finally:
+        token_refresher.cancel()
+        await change_broker.stop()
+        await app.state.http_client.aclose()
+        await search_cache.close()
+        oauth_session.close()
+        await engine.dispose()
+
 
 # Create FastAPI app and router
-app = FastAPI(title="Spotify Queue API")
+app = FastAPI(title="Spotify Queue API", lifespan=lifespan)
 api_v1 = APIRouter(prefix="/v1")
 
+# Existing in-process counters, exported as gauges on /metrics
+register_stats("api_http_client", "Outbound HTTP requests and connection reuse", http_stats.as_dict)
+register_stats(
+    "api_spotify_client",
+    "Spotify retries, throttling and breaker trips",
+    lambda: app.state.spotify_client.stats,
+)
+register_stats("api_search_cache", "Search cache size and hit/miss counters", search_cache.as_dict)
+register_stats("api_track_metadata", "Track metadata cache and Spotify lookups", track_metadata.as_dict)
+register_stats("api_token_info_cache", "Signed-in users' token cache", token_info_cache.as_dict)
+register_stats("api_token_refresh", "Background token refresh outcomes", lambda: token_refresh_stats)
+register_stats("api_user_events", "User change LISTEN connection and subscribers", change_broker.as_dict)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -106,46 +202,356 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add session middleware
+# Signed cookie with just the user id; tokens stay server-side (see get_token_info)
 SESSION_SECRET = os.getenv("JWT_SECRET", os.urandom(24))
 app.add_middleware(
-    SessionMiddleware, secret_key=SESSION_SECRET, same_site="lax", https_only=True, max_age=3600
+    AuthCookieMiddleware, secret_key=SESSION_SECRET, same_site="lax", https_only=True, max_age=3600
 )
 
+# Added last so it is outermost and the timings include every other middleware
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cipher() -> Fernet:
+    """Fernet cipher for stored tokens, built from ENCRYPTION_KEY on first use"""
+    return Fernet(os.environ["ENCRYPTION_KEY"].encode())
+
 
 def encrypt_token(token: str) -> str:
-    return cipher_suite.encrypt(token.encode()).decode()
+    return get_cipher().encrypt(token.encode()).decode()
 
 
 def decrypt_token(encrypted_token: str) -> str:
-    return cipher_suite.decrypt(encrypted_token.encode()).decode()
+    return get_cipher().decrypt(encrypted_token.encode()).decode()
 
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
+def token_columns(token_info: dict) -> dict:
+    """UserToken columns for a Spotify token_info dict, with both tokens encrypted"""
+    refresh_token = token_info.get("refresh_token")
+    return {
+        "access_token": encrypt_token(token_info["access_token"]),
+        "refresh_token": encrypt_token(refresh_token) if refresh_token else None,
+        "expires_at": token_info.get("expires_at"),
+    }
+
+
+def normalize_search_query(q: str) -> str:
+    return " ".join(q.lower().split())
+
+
+def encode_sync_cursor(updated_at: datetime, user_id: str) -> str:
+    return f"{updated_at.isoformat()}|{user_id}"
+
+
+def decode_sync_cursor(cursor: str):
+    updated_at, _, user_id = cursor.partition("|")
+    return datetime.fromisoformat(updated_at), user_id
+
+
+def clamp_sync_cursor(cursor: Optional[str], now: datetime) -> Optional[str]:
+    """Move a cursor back to SYNC_CURSOR_OVERLAP seconds before `now` if it is past that"""
+    horizon = now - timedelta(seconds=SYNC_CURSOR_OVERLAP)
+    if cursor and decode_sync_cursor(cursor)[0] > horizon:
+        return encode_sync_cursor(horizon, "")
+    return cursor
+
+
+async def get_mappings_etag(db: AsyncSession, user_id: str) -> Optional[str]:
+    """Weak ETag for a user's mappings; changes whenever mappings_version is bumped"""
+    version = await db.scalar(select(UserToken.mappings_version).where(UserToken.user_id == user_id))
+    return None if version is None else f'W/"{user_id}.{version}"'
+
+
+def mappings_cache_headers(etag: Optional[str]) -> dict:
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    return etag is not None and request.headers.get("if-none-match") == etag
+
+
+def mapping_rows_query(user_id: str):
+    # Both columns live in uq_song_mappings_user_trigger_queue, so Postgres can answer
+    # this with an index-only scan
+    return select(SongMapping.trigger_song_id, SongMapping.queue_song_id).where(
+        SongMapping.user_id == user_id
+    )
+
+
+async def insert_mapping_pairs(db: AsyncSession, user_id: str, pairs) -> int:
+    """Insert (trigger, queue) pairs in one statement; returns how many were new"""
+    rows = [
+        {
+            "id": str(uuid4()),
+            "user_id": user_id,
+            "trigger_song_id": trigger_song_id,
+            "queue_song_id": queue_song_id,
+        }
+        for trigger_song_id, queue_song_id in pairs
+    ]
+    # Pairs the user already has hit the unique constraint and are skipped
+    # Passing rows as executemany parameters lets SQLAlchemy reuse the cached statement
+    # and batch it into multi-row VALUES itself ("insertmanyvalues"), instead of compiling
+    # a fresh statement with a bind parameter per column per row
+    result = await db.execute(
+        insert(SongMapping)
+        .on_conflict_do_nothing(constraint="uq_song_mappings_user_trigger_queue")
+        .returning(SongMapping.id),
+        rows,
+    )
+    return len(result.all())
+
+
+async def bump_mappings_version(db: AsyncSession, user_id: str):
+    # Let workers syncing through /users/sync pick up the new mappings
+    await db.execute(
+        update(UserToken)
+        .where(UserToken.user_id == user_id)
+        .values(
+            updated_at=datetime.utcnow(),
+            mappings_version=UserToken.mappings_version + 1,
+        )
+    )
+
+
+class LineTooLongError(ValueError):
+    """An NDJSON line ran past the allowed length before its newline arrived"""
+
+
+async def iter_ndjson_lines(chunks, max_line_bytes):
+    """Yield (line number, line) from an async iterator of byte chunks, skipping blank lines.
+
+    Raises LineTooLongError once a line passes `max_line_bytes`, without buffering the rest.
+    """
+    buffer = bytearray()
+    line_number = 0
+    async for chunk in chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            buffer += chunk[start:end]
+            line_number += 1
+            if len(buffer) > max_line_bytes:
+                raise LineTooLongError(f"Line {line_number} is longer than {max_line_bytes} bytes")
+            if buffer.strip():
+                yield line_number, bytes(buffer)
+            buffer.clear()
+            start = end + 1
+        buffer += chunk[start:]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"Line {line_number + 1} is longer than {max_line_bytes} bytes")
+    if buffer.strip():
+        yield line_number + 1, bytes(buffer)
+
+
+async def request_token_refresh(client: httpx.AsyncClient, refresh_token: str) -> dict:
+    """Exchange a refresh token for a new token_info dict"""
+    response = await client.post(
+        SPOTIFY_TOKEN_URL,
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+        auth=(os.getenv("CLIENT_ID", ""), os.getenv("CLIENT_SECRET", "")),
+    )
+    response.raise_for_status()
+    token_info = response.json()
+    # Spotify only sometimes rotates the refresh token
+    token_info.setdefault("refresh_token", refresh_token)
+    token_info["expires_at"] = int(time.time()) + token_info["expires_in"]
+    return token_info
+
+
+def oauth_error(response: httpx.Response) -> Optional[str]:
+    """The `error` code of an OAuth error response, or None when it has none"""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return body.get("error") if isinstance(body, dict) else None
+
+
+async def refresh_tokens(client: httpx.AsyncClient, db: AsyncSession, users) -> Counter:
+    """Refresh the tokens of `users` (rows with user_id and refresh_token) concurrently.
+
+    Successful refreshes are written back in one executemany; the caller commits.
+    """
+    semaphore = asyncio.Semaphore(TOKEN_REFRESH_CONCURRENCY)
+    stats = Counter()
+
+    async def refresh(user):
+        async with semaphore:
+            try:
+                token_info = await request_token_refresh(client, decrypt_token(user.refresh_token))
+            except httpx.HTTPStatusError as e:
+                # Only invalid_grant means the user revoked access; other 400s (invalid_client
+                # from a missing or rotated CLIENT_SECRET) say nothing about the user's grant
+                if e.response.status_code == 400 and oauth_error(e.response) == "invalid_grant":
+                    # Stop trying until they log in again
+                    stats["revoked"] += 1
+                    return {"user_id": user.user_id, "refresh_token": None}
+                stats["failed"] += 1
+                logger.warning(f"Token refresh failed for user {user.user_id}: {str(e)}")
+                return None
+            except httpx.HTTPError as e:
+                stats["failed"] += 1
+                logger.warning(f"Token refresh failed for user {user.user_id}: {str(e)}")
+                return None
+        stats["refreshed"] += 1
+        return {"user_id": user.user_id, **token_columns(token_info), "updated_at": datetime.utcnow()}
+
+    rows = [row for row in await asyncio.gather(*(refresh(user) for user in users)) if row]
+    if rows:
+        # Bulk UPDATE by primary key; the NOTIFY trigger tells workers about each token
+        await db.execute(update(UserToken), rows)
+        for row in rows:
+            token_info_cache.pop(row["user_id"])
+    return stats
+
+
+async def load_user_token(
+    client: httpx.AsyncClient, db: AsyncSession, user_id: str
+) -> Optional[UserToken]:
+    """Fetch a user's token row, refreshing it first if it expires within TOKEN_REFRESH_AHEAD"""
+    user = await db.get(UserToken, user_id)
+    if (
+        user
+        and user.refresh_token
+        and user.expires_at is not None
+        and user.expires_at - time.time() < TOKEN_REFRESH_AHEAD
+    ):
+        # Needed before the background refresher reaches it
+        token_refresh_stats.update(await refresh_tokens(client, db, [user]))
+        await db.commit()
+        await db.refresh(user)
+    return user
+
+
+async def get_token_info(request: Request, user_id: str) -> Optional[dict]:
+    """The signed-in user's decrypted token_info, from token_info_cache when possible.
+
+    Entries expire TOKEN_EXPIRY_MARGIN seconds before the token does, so the next
+    request reloads the row the refresher (in any process) has renewed by then.
+    """
+    token_info = token_info_cache.get(user_id, None)
+    if token_info:
+        return token_info
+    async with SessionLocal() as db:
+        user = await load_user_token(request.app.state.http_client, db, user_id)
+    if not user or (user.expires_at is not None and user.expires_at <= time.time()):
+        # Unknown user, or a token that couldn't be refreshed (e.g. access was revoked)
+        return None
+    token_info = {
+        "access_token": decrypt_token(user.access_token),
+        "refresh_token": decrypt_token(user.refresh_token) if user.refresh_token else None,
+        "expires_at": user.expires_at,
+    }
+    ttl = TOKEN_INFO_CACHE_TTL
+    if user.expires_at is not None:
+        ttl = min(ttl, user.expires_at - TOKEN_EXPIRY_MARGIN - time.time())
+    if ttl > 0:
+        token_info_cache.set(user_id, token_info, ttl=ttl)
+    return token_info
+
+
+async def refresh_expiring_tokens(client: httpx.AsyncClient):
+    """Background loop renewing tokens that expire within TOKEN_REFRESH_AHEAD seconds"""
+    while True:
+        refreshed = 0
+        try:
+            async with SessionLocal() as db:
+                users = (
+                    await db.execute(
+                        select(UserToken.user_id, UserToken.refresh_token)
+                        .where(
+                            UserToken.refresh_token.is_not(None),
+                            UserToken.expires_at < int(time.time()) + TOKEN_REFRESH_AHEAD,
+                        )
+                        .order_by(UserToken.expires_at)
+                        .limit(TOKEN_REFRESH_BATCH_SIZE)
+                        # Several API processes split the work instead of refreshing twice
+                        .with_for_update(skip_locked=True)
+                    )
+                ).all()
+                if users:
+                    stats = await refresh_tokens(client, db, users)
+                    await db.commit()
+                    token_refresh_stats.update(stats)
+                    logger.info(
+                        f"Refreshed {stats['refreshed']}/{len(users)} expiring tokens "
+                        f"({stats['failed']} failed, {stats['revoked']} revoked)"
+                    )
+                    refreshed = stats["refreshed"]
+        except Exception as e:
+            logger.error(f"Error refreshing tokens: {str(e)}")
+        # Go straight on to the next batch while there is a backlog
+        if refreshed < TOKEN_REFRESH_BATCH_SIZE:
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+
+
+async def remember_tracks(tracks):
+    """Store metadata from Spotify track objects seen outside a request's own transaction"""
     try:
+        async with SessionLocal() as db:
+            if await track_metadata.remember(db, tracks):
+                await db.commit()
+    except Exception as e:
+        # Only an optimization; the relationships endpoint can still fetch these later
+        logger.warning(f"Could not store track metadata: {str(e)}")
+
+
+async def get_mapped_tracks(request: Request, db: AsyncSession, user_id: str, track_ids):
+    """Metadata for `track_ids` by id, fetching unknown ones from Spotify in batches.
+
+    Returns (items, complete); complete is False when some ids could not be resolved
+    right now, e.g. while Spotify is unavailable.
+    """
+    tracks = await track_metadata.lookup(db, track_ids)
+    missing = [track_id for track_id in track_ids if track_id not in tracks]
+    if missing:
+        token_info = await get_token_info(request, user_id)
+        if token_info:
+            tracks.update(
+                await track_metadata.resolve(
+                    db, request.app.state.spotify_client, token_info["access_token"], missing
+                )
+            )
+            await db.commit()
+    return tracks, len(tracks) == len(track_ids)
+
+
+# Database dependency
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # Spotify OAuth setup
-def create_spotify_oauth(request: Optional[Request] = None):
-    cache_handler = FlaskSessionCacheHandler(request.session) if request else None
+def create_spotify_oauth():
+    # Tokens are stored in user_tokens; keep spotipy from caching them anywhere else
     return SpotifyOAuth(
         client_id=os.getenv("CLIENT_ID"),
         client_secret=os.getenv("CLIENT_SECRET"),
         redirect_uri=os.getenv("REDIRECT_URI"),
         scope="user-read-playback-state user-modify-playback-state",
         show_dialog=True,
-        cache_handler=cache_handler,
+        cache_handler=MemoryCacheHandler(),
+        requests_session=oauth_session,
     )
 
 
-# Session management
-def get_session(request: Request) -> dict:
-    return request.session
+# Set by AuthCookieMiddleware from the signed auth cookie
+def get_current_user(request: Request) -> Optional[str]:
+    return request.scope.get("user_id")
+
+
+def require_user(request: Request, user_id: str):
+    """Reject the request unless it is signed in as `user_id`"""
+    current_user = get_current_user(request)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
 
 
 # Auth Endpoints
@@ -159,33 +565,35 @@ async def login():
 
 @api_v1.get("/callback")
 async def callback(
-    request: Request, code: str = None, error: str = None, db: Session = Depends(get_db)
+    request: Request, code: str = None, error: str = None, db: AsyncSession = Depends(get_db)
 ):
     if error:
         return RedirectResponse(url=f"{FRONTEND_URL}?error={error}")
 
     try:
-        auth_manager = create_spotify_oauth(request=request)
+        auth_manager = create_spotify_oauth()
 
         logger.info(f"Received auth code: {code[:5]}...")
-        token_info = auth_manager.get_access_token(code)
+        # spotipy uses blocking requests, so keep it off the event loop
+        token_info = await run_in_threadpool(auth_manager.get_access_token, code)
         logger.info(f"Received access token starting with: {token_info['access_token'][:5]}...")
 
         # Get user ID from Spotify
-        spotify = Spotify(auth_manager=auth_manager)
-        user_info = spotify.me()
-        user_id = user_info["id"]
-
-        session = get_session(request)
-        session["user_id"] = user_id
-        session["token_info"] = token_info
+        response = await request.app.state.spotify_client.request(
+            "GET", "/me", token_info["access_token"]
+        )
+        response.raise_for_status()
+        user_id = response.json()["id"]
 
-        # Encrypt token before storing
-        encrypted_token = encrypt_token(token_info["access_token"])
-        user = UserToken(user_id=user_id, access_token=encrypted_token)
+        # Encrypt tokens before storing
+        user = UserToken(user_id=user_id, **token_columns(token_info))
         logger.info(f"Storing user with Spotify ID: {user_id}")
-        db.merge(user)
-        db.commit()
+        await db.merge(user)
+        await db.commit()
+        token_info_cache.pop(user_id)
+
+        # Signs the user in; AuthCookieMiddleware sets the cookie on this response
+        request.scope["user_id"] = user_id
 
         return RedirectResponse(url=f"{FRONTEND_URL}/dashboard")
     except Exception as e:
@@ -196,42 +604,34 @@ async def callback(
 @api_v1.get("/test-spotify-user")
 async def test_spotify_user(request: Request):
     """Test endpoint to verify Spotify user info"""
-    session = get_session(request)
-    token_info = session.get("token_info")
+    user_id = get_current_user(request)
+    token_info = await get_token_info(request, user_id) if user_id else None
 
     if not token_info:
         return {"error": "No token found"}
 
-    headers = {"Authorization": f"Bearer {token_info['access_token']}"}
-    response = requests.get("https://api.spotify.com/v1/me", headers=headers)
+    try:
+        response = await request.app.state.spotify_client.request(
+            "GET", "/me", token_info["access_token"]
+        )
+    except SpotifyUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
     return {"status_code": response.status_code, "user_info": response.json()}
 
 
 @api_v1.get("/auth/status")
-async def auth_status(request: Request, db: Session = Depends(get_db)):
+async def auth_status(request: Request):
     """Check authentication status"""
-    session = get_session(request)
-    token_info = session.get("token_info")
-
-    if not token_info:
+    user_id = get_current_user(request)
+    if not user_id:
         return AuthStatus(authenticated=False, token_info=None)
 
     try:
-        now = int(datetime.now().timestamp())
-        is_expired = token_info["expires_at"] - now < 60
-
-        if is_expired:
-            sp_oauth = create_spotify_oauth(request=request)
-            token_info = sp_oauth.refresh_access_token(token_info["refresh_token"])
-            session["token_info"] = token_info
-
-            # Update token in database
-            user_id = session["user_id"]
-            user = UserToken(user_id=user_id, access_token=token_info["access_token"])
-            db.merge(user)
-            db.commit()
-
+        # Refreshes the token when it is about to expire
+        token_info = await get_token_info(request, user_id)
+        if not token_info:
+            return AuthStatus(authenticated=False, token_info=None)
         return AuthStatus(authenticated=True, token_info=TokenInfo(**token_info))
 
     except Exception as e:
@@ -241,19 +641,30 @@ async def auth_status(request: Request, db: Session = Depends(get_db)):
 @api_v1.get("/search")
 async def search_tracks(request: Request, q: str):
     """Search for tracks on Spotify"""
-    session = get_session(request)
-    token_info = session.get("token_info")
+    user_id = get_current_user(request)
+    token_info = await get_token_info(request, user_id) if user_id else None
 
     if not token_info:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    try:
-        headers = {"Authorization": f"Bearer {token_info['access_token']}"}
-        response = requests.get(
-            f"https://api.spotify.com/v1/search?q={q}&type=track&limit=10", headers=headers
+    query = normalize_search_query(q)
+
+    async def search_spotify():
+        response = await request.app.state.spotify_client.request(
+            "GET",
+            "/search",
+            token_info["access_token"],
+            params={"q": query, "type": "track", "limit": 10},
         )
         response.raise_for_status()
-        return response.json()
+        results = response.json()
+        await remember_tracks(results.get("tracks", {}).get("items", []))
+        return results
+
+    try:
+        return await search_cache.get_or_load(query, search_spotify)
+    except SpotifyUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -261,80 +672,307 @@ async def search_tracks(request: Request, q: str):
 # Song Relationship Endpoints
 @api_v1.post("/songs/relationships")
 async def save_song_relationships(
-    request: Request, relationships: SongRelationships, db: Session = Depends(get_db)
+    request: Request, relationships: SongRelationships, db: AsyncSession = Depends(get_db)
 ):
     """Save song relationships"""
-    session = get_session(request)
-    user_id = session.get("user_id")
+    user_id = get_current_user(request)
     logger.info(f"Creating relationship for user: {user_id}")
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        # Create mappings for consecutive songs
-        for i in range(len(relationships.songs) - 1):
-            mapping = SongMapping(
-                id=str(uuid4()),
-                user_id=user_id,
-                trigger_song_id=relationships.songs[i].id,
-                queue_song_id=relationships.songs[i + 1].id,
-            )
-            db.add(mapping)
-
-        db.commit()
-        return {"message": "Relationships saved"}
+        # Map each song to the next one, dropping pairs repeated within the chain
+        song_ids = [song.id for song in relationships.songs]
+        pairs = list(dict.fromkeys(zip(song_ids, song_ids[1:])))
+
+        inserted = 0
+        for start in range(0, len(pairs), MAPPING_INSERT_BATCH_SIZE):
+            batch = pairs[start : start + MAPPING_INSERT_BATCH_SIZE]
+            inserted += await insert_mapping_pairs(db, user_id, batch)
+
+        if inserted:
+            await bump_mappings_version(db, user_id)
+        # Names sent with the songs are the client's word, not Spotify's, so they aren't
+        # stored; reads resolve any track search results haven't already stored
+        await db.commit()
+        return {
+            "message": "Relationships saved",
+            "inserted": inserted,
+            "skipped": max(0, len(song_ids) - 1) - inserted,
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_v1.get("/songs/relationships")
-async def get_song_relationships(request: Request, db: Session = Depends(get_db)):
+async def get_song_relationships(request: Request, db: AsyncSession = Depends(get_db)):
     """Get all song relationships for the current user"""
-    session = get_session(request)
-    user_id = session.get("user_id")
+    user_id = get_current_user(request)
 
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        mappings = db.query(SongMapping).filter(SongMapping.user_id == user_id).all()
+        etag = await get_mappings_etag(db, user_id)
+        if is_not_modified(request, etag):
+            return Response(status_code=304, headers=mappings_cache_headers(etag))
+        # Plain column rows skip ORM hydration and pydantic serialization
+        rows = (await db.execute(mapping_rows_query(user_id))).all()
+        queue_song_ids = list(dict.fromkeys(queue_song_id for _, queue_song_id in rows))
+        tracks, complete = await get_mapped_tracks(request, db, user_id, queue_song_ids)
         relationships = {
-            mapping.trigger_song_id: SongItem(
-                id=mapping.queue_song_id,
-                name=None,
-                uri=None,
-            )
-            for mapping in mappings
+            trigger_song_id: tracks.get(queue_song_id)
+            or {"id": queue_song_id, "name": None, "uri": None}
+            for trigger_song_id, queue_song_id in rows
         }
-        return {"relationships": relationships}
+        # The ETag follows mappings_version only, so it may only be attached to a response
+        # whose metadata is complete; a partial one is refetched in full next time
+        headers = mappings_cache_headers(etag if complete else None)
+        return JSONResponse({"relationships": relationships}, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Update token retrieval to decrypt tokens
 @api_v1.get("/users/{user_id}/token")
-async def get_user_token(user_id: str, db: Session = Depends(get_db)):
-    user = db.query(UserToken).filter(UserToken.user_id == user_id).first()
+async def get_user_token(request: Request, user_id: str, db: AsyncSession = Depends(get_db)):
+    # A worker may be about to use a token the background refresher hasn't reached yet
+    user = await load_user_token(request.app.state.http_client, db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"user_id": user.user_id, "access_token": user.access_token}
+    return {"user_id": user.user_id, "access_token": user.access_token, "expires_at": user.expires_at}
 
 
 @api_v1.get("/users/{user_id}/mappings")
-async def get_user_mappings(user_id: str, db: Session = Depends(get_db)):
-    mappings = db.query(SongMapping).filter(SongMapping.user_id == user_id).all()
-    return mappings
+async def get_user_mappings(request: Request, user_id: str, db: AsyncSession = Depends(get_db)):
+    etag = await get_mappings_etag(db, user_id)
+    headers = mappings_cache_headers(etag)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    rows = await db.execute(mapping_rows_query(user_id))
+    mappings = [
+        {"trigger_song_id": trigger_song_id, "queue_song_id": queue_song_id}
+        for trigger_song_id, queue_song_id in rows
+    ]
+    return JSONResponse(mappings, headers=headers)
+
+
+@api_v1.get("/users/{user_id}/mappings/export")
+async def export_user_mappings(user_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Stream all of a user's mappings as NDJSON, one {trigger_song_id, queue_song_id} per line"""
+    require_user(request, user_id)
+    if not await db.get(UserToken, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    async def lines():
+        # The request's session is closed once the response starts, so the export
+        # reads through its own server-side cursor, one chunk at a time
+        async with SessionLocal() as export_db:
+            result = await export_db.stream(
+                mapping_rows_query(user_id).execution_options(yield_per=MAPPING_EXPORT_CHUNK_SIZE)
+            )
+            async for partition in result.partitions():
+                yield "".join(
+                    json.dumps({"trigger_song_id": trigger_song_id, "queue_song_id": queue_song_id})
+                    + "\n"
+                    for trigger_song_id, queue_song_id in partition
+                )
+
+    # X-Accel-Buffering lets nginx pass chunks through as they are produced
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"}
+    )
+
+
+@api_v1.post("/users/{user_id}/mappings/import")
+async def import_user_mappings(user_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Add mappings from an NDJSON body in the export format, inserted in batches as it streams in"""
+    # Public through nginx, and the workers queue whatever is mapped, so only the user may import
+    require_user(request, user_id)
+    if not await db.get(UserToken, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    received = 0
+    inserted = 0
+    batch = []
+    lines = iter_ndjson_lines(request.stream(), MAPPING_IMPORT_MAX_LINE_BYTES)
+    try:
+        async for line_number, line in lines:
+            try:
+                mapping = SongMappingCreate.model_validate_json(line)
+            except ValidationError as e:
+                await db.rollback()
+                raise HTTPException(
+                    status_code=400, detail=f"Invalid mapping on line {line_number}: {e}"
+                )
+            received += 1
+            batch.append((mapping.trigger_song_id, mapping.queue_song_id))
+            if len(batch) >= MAPPING_INSERT_BATCH_SIZE:
+                inserted += await insert_mapping_pairs(db, user_id, batch)
+                batch = []
+    except LineTooLongError as e:
+        await db.rollback()
+        raise HTTPException(status_code=413, detail=str(e))
+    if batch:
+        inserted += await insert_mapping_pairs(db, user_id, batch)
+
+    if inserted:
+        await bump_mappings_version(db, user_id)
+    await db.commit()
+    return {"message": "Mappings imported", "inserted": inserted, "skipped": received - inserted}
 
 
 @api_v1.get("/users")
-async def get_users(db: Session = Depends(get_db)):
-    users = db.query(UserToken).all()
-    return [{"user_id": user.user_id} for user in users]
+async def get_users(db: AsyncSession = Depends(get_db)):
+    user_ids = await db.scalars(select(UserToken.user_id))
+    return [{"user_id": user_id} for user_id in user_ids]
+
+
+@api_v1.get("/users/sync")
+async def sync_users(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=SYNC_MAX_USERS),
+    db: AsyncSession = Depends(get_db),
+):
+    """Page through users changed after `since` with their encrypted tokens.
+
+    Token refreshes move users far more often than their mappings change, so mappings
+    aren't included; workers fetch them from /users/mappings when mappings_version differs
+    from the one they have.
+    """
+    query = select(
+        UserToken.user_id,
+        UserToken.access_token,
+        UserToken.updated_at,
+        UserToken.mappings_version,
+        UserToken.expires_at,
+    )
+    if since:
+        try:
+            since_updated_at, since_user_id = decode_sync_cursor(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync cursor")
+        query = query.where(
+            tuple_(UserToken.updated_at, UserToken.user_id) > (since_updated_at, since_user_id)
+        )
+    # Fetch one extra row to know whether another page follows
+    result = await db.execute(
+        query.order_by(UserToken.updated_at, UserToken.user_id).limit(limit + 1)
+    )
+    users = result.all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    next_cursor = encode_sync_cursor(users[-1].updated_at, users[-1].user_id) if users else since
+    if not has_more:
+        # Later pages must move forward, but the cursor a worker keeps between syncs stays
+        # behind transactions that may still commit rows stamped in the overlap window
+        next_cursor = clamp_sync_cursor(next_cursor, datetime.utcnow())
+    return {
+        "users": [
+            {
+                "user_id": user.user_id,
+                "access_token": user.access_token,
+                "mappings_version": user.mappings_version,
+                "expires_at": user.expires_at,
+            }
+            for user in users
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
+
+
+@api_v1.post("/users/mappings")
+async def get_users_mappings(body: UserMappingsRequest, db: AsyncSession = Depends(get_db)):
+    """Mappings of several users in one call, with the mappings_version they belong to.
+
+    Versions are read before the mappings, so a concurrent change can only make the
+    mappings newer than their version; the worker then fetches them again on its next sync.
+    """
+    result = await db.execute(
+        select(UserToken.user_id, UserToken.mappings_version).where(
+            UserToken.user_id.in_(body.user_ids)
+        )
+    )
+    versions = dict(result.all())
+    mappings = {user_id: [] for user_id in versions}
+    if mappings:
+        rows = await db.execute(
+            select(
+                SongMapping.user_id, SongMapping.trigger_song_id, SongMapping.queue_song_id
+            ).where(SongMapping.user_id.in_(list(mappings)))
+        )
+        for row in rows:
+            mappings[row.user_id].append(
+                {"trigger_song_id": row.trigger_song_id, "queue_song_id": row.queue_song_id}
+            )
+    return {
+        "users": [
+            {
+                "user_id": user_id,
+                "mappings_version": versions[user_id],
+                "mappings": user_mappings,
+            }
+            for user_id, user_mappings in mappings.items()
+        ]
+    }
+
+
+@api_v1.get("/users/events")
+async def user_events():
+    """Server-sent events for user changes, so workers sync on change instead of polling.
+
+    Each event is JSON with a `kind` of user_added, token_refreshed or mappings_changed
+    (plus `user_id`), or resync when events may have been missed. The stream opens with
+    a resync; changes themselves are still fetched through /users/sync.
+    """
+
+    async def events():
+        async with change_broker.subscribe() as queue:
+            yield f"data: {RESYNC_EVENT}\n\n"
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), USER_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keeps idle streams from hitting proxy read timeouts
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_v1.post("/workers/{worker_id}/heartbeat")
+async def worker_heartbeat(worker_id: str, db: AsyncSession = Depends(get_db)):
+    """Renew a queue worker's lease and return every worker holding a live lease"""
+    now = datetime.utcnow()
+    # Expire first: a worker whose own lease lapsed would otherwise have its renewal deleted
+    await db.execute(delete(WorkerLease).where(WorkerLease.expires_at < now))
+    await db.merge(
+        WorkerLease(worker_id=worker_id, expires_at=now + timedelta(seconds=WORKER_LEASE_SECONDS))
+    )
+    await db.commit()
+    workers = await db.scalars(select(WorkerLease.worker_id).order_by(WorkerLease.worker_id))
+    return {"workers": workers.all()}
+
+
+@api_v1.post("/workers/{worker_id}/release")
+async def worker_release(worker_id: str, db: AsyncSession = Depends(get_db)):
+    """Drop a queue worker's lease so its users are rebalanced right away"""
+    await db.execute(delete(WorkerLease).where(WorkerLease.worker_id == worker_id))
+    await db.commit()
+    return {"message": "Lease released"}
 
 
 @api_v1.post("/logout")
 async def logout(request: Request):
-    request.session.clear()
+    # AuthCookieMiddleware clears the cookie
+    request.scope["user_id"] = None
     return {"message": "Logged out successfully"}
 
 
@@ -343,8 +981,40 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@api_v1.get("/metrics/http")
+async def http_metrics():
+    """Outbound request and connection reuse counters for this process"""
+    return http_stats.as_dict()
+
+
+@api_v1.get("/metrics/search-cache")
+async def search_cache_metrics():
+    """Search cache size and hit/miss counters for this process"""
+    return search_cache.as_dict()
+
+
+@api_v1.get("/metrics/token-refresh")
+async def token_refresh_metrics():
+    """Tokens refreshed, failed and revoked by this process"""
+    return dict(token_refresh_stats)
+
+
+@api_v1.get("/metrics/user-events")
+async def user_events_metrics():
+    """LISTEN connection state, open event streams and events published"""
+    return change_broker.as_dict()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
 # Include the router in the app
 app.include_router(api_v1)
 
 if __name__ == "__main__":
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,53 @@
+"""SQLAlchemy models, kept free of app imports so alembic and tools load quickly"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+class UserToken(Base):
+    __tablename__ = "user_tokens"
+    user_id = Column(String, primary_key=True)
+    access_token = Column(String, nullable=False)
+    # Encrypted like access_token; lets the API renew tokens without the user present
+    refresh_token = Column(String)
+    # Epoch seconds, as in Spotify's token_info
+    expires_at = Column(Integer)
+    date_added = Column(DateTime, default=datetime.utcnow)
+    # Bumped whenever the token or the user's mappings change; drives /users/sync cursors
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Incremented on every mapping change so workers can keep their trigger index cached
+    mappings_version = Column(Integer, nullable=False, default=0)
+
+
+class SongMapping(Base):
+    __tablename__ = "song_mappings"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "trigger_song_id",
+            "queue_song_id",
+            name="uq_song_mappings_user_trigger_queue",
+        ),
+    )
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("user_tokens.user_id"))
+    trigger_song_id = Column(String, nullable=False)
+    queue_song_id = Column(String, nullable=False)
+
+
+class WorkerLease(Base):
+    __tablename__ = "worker_leases"
+    worker_id = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+# Spotify track metadata shared by all users, so mappings can be shown by name
+class Track(Base):
+    __tablename__ = "tracks"
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    uri = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [API_DIR, os.path.dirname(API_DIR)]
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import auth
+from auth import AuthCookieMiddleware
+
+
+async def whoami(request: Request):
+    return JSONResponse({"user_id": request.scope.get("user_id")})
+
+
+async def login(request: Request):
+    request.scope["user_id"] = request.query_params["user_id"]
+    return JSONResponse({})
+
+
+async def logout(request: Request):
+    request.scope["user_id"] = None
+    return JSONResponse({})
+
+
+def make_client(**kwargs):
+    app = Starlette(
+        routes=[Route("/me", whoami), Route("/login", login), Route("/logout", logout)]
+    )
+    middleware = AuthCookieMiddleware(app, "secret", max_age=3600, **kwargs)
+    return TestClient(middleware, base_url="https://testserver"), middleware
+
+
+def test_anonymous_requests_get_no_cookie():
+    client, _ = make_client()
+    response = client.get("/me")
+    assert response.json() == {"user_id": None}
+    assert "set-cookie" not in response.headers
+
+
+def test_login_sets_a_cookie_that_signs_in_later_requests():
+    client, _ = make_client()
+    response = client.get("/login", params={"user_id": "alice"})
+    cookie = response.headers["set-cookie"]
+    assert cookie.startswith("auth=alice.")
+    assert "httponly" in cookie and "secure" in cookie and "Max-Age=3600" in cookie
+
+    response = client.get("/me")
+    assert response.json() == {"user_id": "alice"}
+    # A fresh cookie isn't re-issued on every response
+    assert "set-cookie" not in response.headers
+
+
+def test_tampered_or_foreign_cookies_are_ignored():
+    client, middleware = make_client()
+    value = middleware.dump("alice")
+    client.cookies.set("auth", value.replace("alice", "mallory"))
+    assert client.get("/me").json() == {"user_id": None}
+    other = AuthCookieMiddleware(None, "other-secret")
+    client.cookies.set("auth", other.dump("alice"))
+    assert client.get("/me").json() == {"user_id": None}
+
+
+def test_logout_clears_the_cookie():
+    client, _ = make_client()
+    client.get("/login", params={"user_id": "alice"})
+    response = client.get("/logout")
+    assert "Max-Age=0" in response.headers["set-cookie"]
+    assert client.get("/me").json() == {"user_id": None}
+
+
+@pytest.mark.parametrize(
+    "age, user_id, reissued", [(1000, "alice", False), (2000, "alice", True), (4000, None, False)]
+)
+def test_cookie_age(monkeypatch, age, user_id, reissued):
+    client, middleware = make_client()
+    client.cookies.set("auth", middleware.dump("alice"))
+    now = time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + age)
+    response = client.get("/me")
+    assert response.json() == {"user_id": user_id}
+    # Past half its max_age the cookie slides forward
+    assert ("set-cookie" in response.headers) == reissued
+
+
+def test_verified_cookies_skip_the_signature_check(monkeypatch):
+    client, middleware = make_client()
+    client.cookies.set("auth", middleware.dump("alice"))
+    client.get("/me")
+
+    def unsign(*args, **kwargs):
+        raise AssertionError("signature checked again")
+
+    monkeypatch.setattr(middleware.signer, "unsign", unsign)
+    assert client.get("/me").json() == {"user_id": "alice"}
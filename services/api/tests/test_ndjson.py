@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from main import LineTooLongError, iter_ndjson_lines
+
+
+async def chunked(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def read(*chunks, max_line_bytes=100):
+    async def collect():
+        return [item async for item in iter_ndjson_lines(chunked(*chunks), max_line_bytes)]
+
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunks():
+    assert read(b'{"a"', b': 1}\n{"b": 2}\n\n', b'{"c": 3}') == [
+        (1, b'{"a": 1}'),
+        (2, b'{"b": 2}'),
+        (4, b'{"c": 3}'),
+    ]
+
+
+def test_several_lines_in_one_chunk():
+    assert read(b"one\ntwo\nthree\n") == [(1, b"one"), (2, b"two"), (3, b"three")]
+
+
+def test_blank_lines_are_skipped_but_counted():
+    assert read(b"\n  \nx\n") == [(3, b"x")]
+
+
+def test_line_at_the_limit_is_accepted():
+    assert read(b"x" * 10 + b"\n", max_line_bytes=10) == [(1, b"x" * 10)]
+
+
+def test_long_line_fails_before_its_newline_arrives():
+    async def endless():
+        yield b"ok\n"
+        while True:
+            yield b"x" * 64
+
+    async def collect():
+        return [item async for item in iter_ndjson_lines(endless(), 1000)]
+
+    with pytest.raises(LineTooLongError, match="Line 2"):
+        asyncio.run(collect())
+
+
+def test_long_complete_line_fails():
+    with pytest.raises(LineTooLongError, match="Line 1"):
+        read(b"x" * 11 + b"\nok\n", max_line_bytes=10)
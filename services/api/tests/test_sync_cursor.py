@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import SYNC_CURSOR_OVERLAP, clamp_sync_cursor, decode_sync_cursor, encode_sync_cursor
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def test_round_trip():
+    cursor = encode_sync_cursor(NOW, "user|with|bars")
+    assert decode_sync_cursor(cursor) == (NOW, "user|with|bars")
+
+
+def test_round_trip_keeps_microseconds():
+    updated_at = NOW.replace(microsecond=123456)
+    assert decode_sync_cursor(encode_sync_cursor(updated_at, "u"))[0] == updated_at
+
+
+def test_invalid_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_sync_cursor("not a cursor")
+
+
+def test_recent_cursor_is_clamped_to_the_overlap():
+    cursor = encode_sync_cursor(NOW - timedelta(seconds=1), "user1")
+    clamped = clamp_sync_cursor(cursor, NOW)
+    assert decode_sync_cursor(clamped) == (NOW - timedelta(seconds=SYNC_CURSOR_OVERLAP), "")
+
+
+def test_old_cursor_is_kept():
+    cursor = encode_sync_cursor(NOW - timedelta(seconds=SYNC_CURSOR_OVERLAP + 1), "user1")
+    assert clamp_sync_cursor(cursor, NOW) == cursor
+
+
+def test_clamped_cursor_still_covers_rows_in_the_window():
+    # A row committed late with an updated_at inside the window sorts after the cursor
+    clamped = decode_sync_cursor(clamp_sync_cursor(encode_sync_cursor(NOW, "user9"), NOW))
+    late_row = (NOW - timedelta(seconds=SYNC_CURSOR_OVERLAP // 2), "user0")
+    assert late_row > clamped
+
+
+def test_missing_cursor_is_kept():
+    assert clamp_sync_cursor(None, NOW) is None
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+from common.spotify_client import SpotifyUnavailableError
+from tracks import TrackMetadata
+
+
+class FakeDB:
+    """Records inserted track rows; selects find nothing, so lookups rely on the cache"""
+
+    def __init__(self):
+        self.stored = {}
+
+    async def execute(self, statement, rows=None):
+        for row in rows or []:
+            self.stored[row["id"]] = row["name"]
+        return []
+
+
+class FakeSpotify:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+
+    async def request(self, method, path, token, params=None):
+        ids = params["ids"].split(",")
+        self.requests.append(ids)
+        if self.fail:
+            raise SpotifyUnavailableError("Spotify is rate limiting")
+        tracks = [
+            {"id": track_id, "name": f"Track {track_id}", "uri": f"spotify:track:{track_id}"}
+            if not track_id.startswith("unknown")
+            else None
+            for track_id in ids
+        ]
+        return httpx.Response(
+            200, json={"tracks": tracks}, request=httpx.Request(method, "http://spotify.test")
+        )
+
+
+def test_resolve_batches_stores_and_caches():
+    metadata = TrackMetadata(1000, 60)
+    db = FakeDB()
+    spotify = FakeSpotify()
+    ids = [f"t{n}" for n in range(120)] + ["unknown1"]
+    found = asyncio.run(metadata.resolve(db, spotify, "token", ids))
+    assert [len(batch) for batch in spotify.requests] == [50, 50, 21]
+    assert found["t7"] == {"id": "t7", "name": "Track t7", "uri": "spotify:track:t7"}
+    assert found["unknown1"]["name"] is None
+    # Unknown ids are cached but never stored
+    assert "unknown1" not in db.stored and len(db.stored) == 120
+    assert asyncio.run(metadata.lookup(db, ["t7", "unknown1"])).keys() == {"t7", "unknown1"}
+
+
+def test_failed_batches_are_left_out():
+    metadata = TrackMetadata(1000, 60)
+    found = asyncio.run(metadata.resolve(FakeDB(), FakeSpotify(fail=True), "token", ["a", "b"]))
+    assert found == {}
+    assert metadata.stats["failed_batches"] == 1
+
+
+def test_remember_skips_incomplete_and_unchanged_tracks():
+    metadata = TrackMetadata(1000, 60)
+    db = FakeDB()
+    track = {"id": "a", "name": "A", "uri": "spotify:track:a"}
+    assert asyncio.run(metadata.remember(db, [track, {"id": "b", "name": None, "uri": None}])) == 1
+    assert asyncio.run(metadata.remember(db, [track])) == 0
+    renamed = {**track, "name": "A (Remastered)"}
+    assert asyncio.run(metadata.remember(db, [renamed])) == 1
+    assert db.stored == {"a": "A (Remastered)"}
@@ -0,0 +1,137 @@
+"""Track names and URIs: an in-process cache over the tracks table, filled from Spotify"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from common.cache import TTLCache
+from common.spotify_client import SpotifyUnavailableError
+from models import Track
+
+logger = logging.getLogger(__name__)
+
+# Spotify's limit for GET /tracks?ids=
+SPOTIFY_TRACKS_BATCH_SIZE = 50
+# Keeps `IN (...)` lists well under Postgres' bind parameter limit
+LOOKUP_BATCH_SIZE = 1000
+
+
+class TrackMetadata:
+    """Maps track ids to {"id", "name", "uri"} items without a Spotify call per track.
+
+    lookup() reads the cache, then the tracks table. resolve() asks Spotify for
+    whatever is left, SPOTIFY_TRACKS_BATCH_SIZE ids per request. remember() stores
+    tracks seen in search results, so most ids never need resolving. Ids Spotify
+    doesn't know are cached with no name, but not stored.
+
+    The table is shared by every user, so it only holds data from Spotify: search
+    results the API fetched itself and /tracks lookups. Names and URIs sent by
+    clients are never stored; tracks only known that way are resolved instead.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize, ttl)
+        self.stats = Counter()
+
+    async def remember(self, db, tracks) -> int:
+        """Store Spotify tracks (with id, name and uri) not already cached; the caller commits"""
+        new = {}
+        for track in tracks:
+            if not (track.get("id") and track.get("name") and track.get("uri")):
+                continue
+            item = {"id": track["id"], "name": track["name"], "uri": track["uri"]}
+            if self.cache.get(item["id"], None) != item:
+                new[item["id"]] = item
+        if not new:
+            return 0
+        now = datetime.utcnow()
+        statement = insert(Track)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Track.id],
+            set_={
+                "name": statement.excluded.name,
+                "uri": statement.excluded.uri,
+                "updated_at": statement.excluded.updated_at,
+            },
+        )
+        await db.execute(
+            statement,
+            # Sorted so concurrent upserts lock rows in the same order
+            [{**new[track_id], "updated_at": now} for track_id in sorted(new)],
+        )
+        for item in new.values():
+            self.cache.set(item["id"], item)
+        self.stats["stored"] += len(new)
+        return len(new)
+
+    async def lookup(self, db, ids) -> dict:
+        """Items for the ids found in the cache or the tracks table, by id"""
+        found = {}
+        missing = []
+        for track_id in dict.fromkeys(ids):
+            item = self.cache.get(track_id, None)
+            if item is None:
+                missing.append(track_id)
+            else:
+                found[track_id] = item
+        loaded = 0
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            rows = await db.execute(
+                select(Track.id, Track.name, Track.uri).where(
+                    Track.id.in_(missing[start : start + LOOKUP_BATCH_SIZE])
+                )
+            )
+            for track_id, name, uri in rows:
+                item = {"id": track_id, "name": name, "uri": uri}
+                self.cache.set(track_id, item)
+                found[track_id] = item
+                loaded += 1
+        self.stats["lookup_misses"] += len(missing) - loaded
+        return found
+
+    async def resolve(self, db, spotify_client, token, ids) -> dict:
+        """Fetch `ids` from Spotify in concurrent batches and remember them; the caller commits.
+
+        Returns items by id. Ids in batches that failed are left out, so callers can
+        tell a complete answer from a partial one.
+        """
+        ids = list(dict.fromkeys(ids))
+        batches = [
+            ids[start : start + SPOTIFY_TRACKS_BATCH_SIZE]
+            for start in range(0, len(ids), SPOTIFY_TRACKS_BATCH_SIZE)
+        ]
+
+        async def fetch(batch):
+            try:
+                response = await spotify_client.request(
+                    "GET", "/tracks", token, params={"ids": ",".join(batch)}
+                )
+                response.raise_for_status()
+            except (SpotifyUnavailableError, httpx.HTTPError) as e:
+                self.stats["failed_batches"] += 1
+                logger.warning(f"Could not fetch metadata for {len(batch)} tracks: {str(e)}")
+                return batch, None
+            self.stats["fetched_batches"] += 1
+            return batch, response.json()["tracks"]
+
+        found = {}
+        for batch, tracks in await asyncio.gather(*(fetch(batch) for batch in batches)):
+            if tracks is None:
+                continue
+            for track_id, track in zip(batch, tracks):
+                if track:
+                    found[track_id] = {"id": track_id, "name": track["name"], "uri": track["uri"]}
+                else:
+                    # Unknown to Spotify; cached so it isn't asked for again, but not stored
+                    self.stats["unknown"] += 1
+                    found[track_id] = {"id": track_id, "name": None, "uri": None}
+                    self.cache.set(track_id, found[track_id])
+        await self.remember(db, [item for item in found.values() if item["name"]])
+        return found
+
+    def as_dict(self):
+        return {**self.cache.as_dict(), **self.stats}
@@ -0,0 +1,177 @@
+"""End-to-end load benchmark: the API and a queue manager against the Spotify simulator.
+
+Seeds --users synthetic users with --mappings-long chains (skip with
+--skip-seed to reuse the last seeding), starts the simulator and the API
+under gunicorn, then for --duration seconds runs one QueueManager worker
+in-process, with --clients frontend loops calling the API as random
+synthetic users (GET /v1/songs/relationships and uncached searches).
+
+Reports the worker's throughput and schedule lag, upstream calls per user,
+chain breaks, and the frontend requests' latency. Run it before and after
+any performance change to the queue manager or the API.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/run_e2e.py [--users 1000] [--duration 300]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUEUE_MANAGER_DIR = os.path.join(SERVICES_DIR, "queue_manager")
+# Both services have a main module; the queue manager's is the one imported here
+sys.path[:0] = [
+    QUEUE_MANAGER_DIR,
+    os.path.join(SERVICES_DIR, "api", "benchmarks"),
+    SERVICES_DIR,
+]
+
+from main import QueueManager  # noqa: E402
+from harness import ApiServer, auth_cookies, summarize  # noqa: E402
+from spotify_sim import SpotifySimulator  # noqa: E402
+from synthetic_users import seed_synthetic_users, synthetic_user_id  # noqa: E402
+
+
+async def run_worker(manager, duration, cycles):
+    """QueueManager.run() for `duration` seconds, keeping each tick's stats"""
+    deadline = time.monotonic() + duration
+    async with manager.create_client():
+        watcher = asyncio.create_task(manager.watch_changes())
+        last_tick = time.time()
+        try:
+            while time.monotonic() < deadline:
+                await manager.start_due_checks()
+                cycles.append(manager.report_checks(time.time() - last_tick))
+                last_tick = time.time()
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    await asyncio.wait_for(manager.wait_for_tick(), remaining)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            watcher.cancel()
+            await manager.cancel_checks()
+            await manager.release()
+
+
+async def run_frontend(base_url, users, clients, duration):
+    """Latencies of `clients` loops calling the API as random synthetic users"""
+    cookies = [auth_cookies(synthetic_user_id(n))["auth"] for n in range(min(users, 1000))]
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def loop(client):
+        nonlocal errors
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            headers = {"Cookie": f"auth={rng.choice(cookies)}"}
+            if rng.random() < 0.5:
+                request = client.get("/v1/songs/relationships", headers=headers)
+            else:
+                request = client.get(
+                    "/v1/search", params={"q": uuid.uuid4().hex[:8]}, headers=headers
+                )
+            started = time.perf_counter()
+            response = await request
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    if not clients:
+        return latencies, errors
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await asyncio.gather(*(loop(client) for _ in range(clients)))
+    return latencies, errors
+
+
+async def run(args, api, spotify_url):
+    manager = QueueManager(f"{api.base_url}/v1", spotify_url)
+    cycles = []
+    _, (latencies, errors) = await asyncio.gather(
+        run_worker(manager, args.duration, cycles),
+        run_frontend(api.base_url, args.users, args.clients, args.duration),
+    )
+    return manager, cycles, latencies, errors
+
+
+def report(args, manager, cycles, simulator, latencies, errors):
+    checks = sum(stats["users_processed"] for stats in cycles)
+    users = len(manager.users) or 1
+    lag_avg = (
+        sum(stats["lag_avg_s"] * stats["users_processed"] for stats in cycles) / checks
+        if checks
+        else 0.0
+    )
+    api_calls = sum(count for call, count in manager.call_counts.items() if call.startswith("api "))
+    spotify_calls = sum(
+        count for call, count in manager.call_counts.items() if call.startswith("spotify ")
+    )
+    minutes = args.duration / 60
+    sim = simulator.as_dict()
+
+    print(f"users synced        {len(manager.users)} ({len(manager.active_users)} active)")
+    print(
+        f"spotify client      {manager.spotify.bucket.rate:g} req/s "
+        "(SPOTIFY_RATE_LIMIT / SPOTIFY_PROCESSES)"
+    )
+    print(f"checks              {checks} in {len(cycles)} ticks, {checks / args.duration:.1f}/s")
+    print(
+        f"schedule lag        avg {lag_avg:.2f}s, "
+        f"worst tick p95 {max((stats['lag_p95_s'] for stats in cycles), default=0):.2f}s, "
+        f"max {max((stats['lag_max_s'] for stats in cycles), default=0):.2f}s"
+    )
+    print(
+        f"upstream calls      api {api_calls / users / minutes:.2f}/user/min, "
+        f"spotify {spotify_calls / users / minutes:.2f}/user/min "
+        f"({spotify_calls / max(checks, 1):.2f}/check), spotify 429s {sim.get('429', 0)}"
+    )
+    print(f"chains              {sim['breaks']} breaks in {sim['trigger_ends']} trigger plays")
+    print(f"frontend API        {summarize(latencies, args.duration)}  errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mappings", type=int, default=100)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--active-ratio", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=int, default=None)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        asyncio.run(seed_synthetic_users(args.users, args.mappings))
+        print(f"seeded              {time.perf_counter() - started:.1f}s")
+
+    simulator = SpotifySimulator(
+        args.mappings,
+        active_ratio=args.active_ratio,
+        latency=args.latency,
+        rate_limit=args.rate_limit,
+    )
+    spotify_url = simulator.start()
+    try:
+        api = ApiServer(spotify_url, workers=args.api_workers)
+        try:
+            api.wait_ready()
+            manager, cycles, latencies, errors = asyncio.run(run(args, api, spotify_url))
+        finally:
+            api.stop()
+    finally:
+        simulator.stop()
+    report(args, manager, cycles, simulator, latencies, errors)
+
+
+if __name__ == "__main__":
+    main()
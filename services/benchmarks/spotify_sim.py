@@ -0,0 +1,230 @@
+"""Fake Spotify Web API with simulated listeners, for the end-to-end and API load tests.
+
+Covers what the API and the queue manager call: /me, /me/player
+(current_playback), GET and POST /me/player/queue (queue, add_to_queue),
+/search, /tracks and the token endpoint. Users are told apart by bearer
+token ("token-<user_id>", as synthetic_users.py seeds them).
+
+Each user gets a playback clock on first contact: with probability
+`active_ratio` they are listening through their mapping chain (see
+synthetic_users.chain_track), starting part-way into a random track. When a
+track ends the player takes the head of the user's queue, or the user picks
+a random chain track if the queue is empty; a trigger that ends without its
+mapped song next counts as a chain break. Every response can be delayed by
+`latency` seconds, searches and token refreshes by a further
+`search_latency` and `token_latency`, and above `rate_limit` requests per
+second the simulator answers 429 with Retry-After, as Spotify does. Requests
+are counted by method and path in `calls`.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic_users import chain_track
+
+
+class SpotifySimulator:
+    def __init__(
+        self,
+        mappings_per_user=0,
+        active_ratio=0.5,
+        latency=0.0,
+        search_latency=0.0,
+        token_latency=0.0,
+        rate_limit=None,
+        track_seconds=(120, 300),
+        seed=0,
+    ):
+        self.mappings_per_user = mappings_per_user
+        self.active_ratio = active_ratio
+        self.latency = latency
+        self.search_latency = search_latency
+        self.token_latency = token_latency
+        self.rate_limit = rate_limit
+        self.track_seconds = track_seconds
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.rate_window = (0, 0)
+        self.players = {}
+        self.durations = {}
+        self.calls = Counter()
+        self.trigger_ends = 0
+        self.breaks = 0
+        self.server = None
+
+    def start(self):
+        """Serve on a free local port and return the /v1 base URL"""
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.respond(*simulator.handle("GET", self.path, self.headers))
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.respond(*simulator.handle("POST", self.path, self.headers))
+
+            def respond(self, status, body, headers=None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if payload:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # The default backlog of 5 drops connections under concurrent clients
+            request_queue_size = 1024
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def duration(self, track_id):
+        if track_id not in self.durations:
+            self.durations[track_id] = random.Random(f"{self.seed}:{track_id}").uniform(
+                *self.track_seconds
+            )
+        return self.durations[track_id]
+
+    def player(self, user_id):
+        """The user's playback state, created on first contact"""
+        player = self.players.get(user_id)
+        if player is None:
+            rng = random.Random(f"{self.seed}:{user_id}")
+            track_id = chain_track(user_id, rng.randrange(self.mappings_per_user + 1))
+            player = {
+                "rng": rng,
+                "active": rng.random() < self.active_ratio,
+                "track_id": track_id,
+                "started_at": time.monotonic() - rng.uniform(0, self.duration(track_id)),
+                "queue": [],
+            }
+            self.players[user_id] = player
+        return player
+
+    def advance(self, user_id, player):
+        """Play through every track that has ended since the last request"""
+        now = time.monotonic()
+        while player["started_at"] + self.duration(player["track_id"]) <= now:
+            ended_at = player["started_at"] + self.duration(player["track_id"])
+            if player["queue"]:
+                next_track_id = player["queue"].pop(0)
+            else:
+                next_track_id = chain_track(
+                    user_id, player["rng"].randrange(self.mappings_per_user + 1)
+                )
+            position = int(player["track_id"].rsplit("-t", 1)[1])
+            if position < self.mappings_per_user:
+                self.trigger_ends += 1
+                self.breaks += next_track_id != chain_track(user_id, position + 1)
+            player["track_id"] = next_track_id
+            player["started_at"] = ended_at
+
+    def track(self, track_id):
+        return {
+            "id": track_id,
+            "name": f"Track {track_id}",
+            "uri": f"spotify:track:{track_id}",
+            "duration_ms": int(self.duration(track_id) * 1000),
+        }
+
+    def throttled(self):
+        if not self.rate_limit:
+            return False
+        second, count = self.rate_window
+        now = int(time.monotonic())
+        count = count + 1 if now == second else 1
+        self.rate_window = (now, count)
+        return count > self.rate_limit
+
+    def handle(self, method, raw_path, headers):
+        """Return (status, JSON body or None, extra headers) for one request"""
+        url = urlparse(raw_path)
+        path = url.path
+        delay = self.latency
+        if path == "/v1/search":
+            delay += self.search_latency
+        elif path == "/api/token":
+            delay += self.token_latency
+        if delay:
+            # Outside the lock, so slow responses overlap
+            time.sleep(delay)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        with self.lock:
+            self.calls[f"{method} {path}"] += 1
+            if self.throttled():
+                self.calls["429"] += 1
+                return 429, None, {"Retry-After": "1"}
+            if path == "/api/token":
+                return 200, {"access_token": "token-refreshed", "expires_in": 3600}, None
+            if path == "/v1/search":
+                query = params.get("q", "")
+                limit = int(params.get("limit", 10))
+                items = [self.track(f"search-{query}-{i}") for i in range(limit)]
+                return 200, {"tracks": {"items": items}}, None
+            if path == "/v1/tracks":
+                tracks = [self.track(track_id) for track_id in params["ids"].split(",")]
+                return 200, {"tracks": tracks}, None
+
+            user_id = headers.get("Authorization", "").removeprefix("Bearer token-")
+            if path == "/v1/me":
+                return 200, {"id": user_id, "display_name": user_id}, None
+            player = self.player(user_id)
+            if not player["active"]:
+                # Nothing playing; Spotify answers 204 for playback and 404 for queue changes
+                if path == "/v1/me/player" and method == "GET":
+                    return 204, None, None
+                return 404, {"error": {"status": 404, "message": "No active device"}}, None
+            self.advance(user_id, player)
+            if path == "/v1/me/player" and method == "GET":
+                progress = time.monotonic() - player["started_at"]
+                return (
+                    200,
+                    {
+                        "is_playing": True,
+                        "progress_ms": int(progress * 1000),
+                        "item": self.track(player["track_id"]),
+                    },
+                    None,
+                )
+            if path == "/v1/me/player/queue" and method == "GET":
+                return (
+                    200,
+                    {
+                        "currently_playing": self.track(player["track_id"]),
+                        "queue": [self.track(track_id) for track_id in player["queue"]],
+                    },
+                    None,
+                )
+            if path == "/v1/me/player/queue" and method == "POST":
+                player["queue"].append(params["uri"].removeprefix("spotify:track:"))
+                return 204, None, None
+        return 404, {"error": {"status": 404, "message": "Not found"}}, None
+
+    def as_dict(self):
+        return {
+            **self.calls,
+            "users": len(self.players),
+            "trigger_ends": self.trigger_ends,
+            "breaks": self.breaks,
+        }
@@ -0,0 +1,111 @@
+"""Synthetic users for end-to-end load tests, seeded straight into the API's database.
+
+User n is "synthetic-n" with a chain of --mappings mappings over its own
+tracks (synthetic-n-t0 -> synthetic-n-t1 -> ...), which is what the Spotify
+simulator plays through. Its access token encrypts "token-synthetic-n", so
+the simulator can tell users apart by bearer token. Earlier synthetic users
+are deleted first; other users are left alone.
+
+Usage: DATABASE_URL=... python benchmarks/synthetic_users.py [--users 10000] [--mappings 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICES_DIR, "api", "benchmarks"))
+
+from harness import migrate  # noqa: E402
+
+SYNTHETIC_PREFIX = "synthetic-"
+# Rows per executemany; well under Postgres' bind parameter limit at 4 columns
+INSERT_BATCH_SIZE = 10000
+
+
+def synthetic_user_id(n):
+    return f"{SYNTHETIC_PREFIX}{n}"
+
+
+def chain_track(user_id, position):
+    return f"{user_id}-t{position}"
+
+
+def user_rows(first, count, mappings_per_user):
+    """Yield (user row, mapping rows) for users first..first+count-1"""
+    from cryptography.fernet import Fernet
+
+    cipher_suite = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    now = datetime.utcnow()
+    # Far enough out that the API never tries to refresh them during a run
+    expires_at = int(time.time()) + 30 * 86400
+    for n in range(first, first + count):
+        user_id = synthetic_user_id(n)
+        user = {
+            "user_id": user_id,
+            "access_token": cipher_suite.encrypt(f"token-{user_id}".encode()).decode(),
+            "expires_at": expires_at,
+            "date_added": now,
+            "updated_at": now,
+            "mappings_version": 1,
+        }
+        mappings = [
+            {
+                "id": f"{user_id}-m{i}",
+                "user_id": user_id,
+                "trigger_song_id": chain_track(user_id, i),
+                "queue_song_id": chain_track(user_id, i + 1),
+            }
+            for i in range(mappings_per_user)
+        ]
+        yield user, mappings
+
+
+async def seed_synthetic_users(users, mappings_per_user):
+    """Replace all synthetic users with `users` users of `mappings_per_user` mappings each"""
+    from sqlalchemy import delete, insert
+
+    from database import SessionLocal, create_engine
+    from models import SongMapping, UserToken
+
+    migrate()
+    engine = create_engine()
+    try:
+        async with SessionLocal() as db:
+            await db.execute(
+                delete(SongMapping).where(SongMapping.user_id.startswith(SYNTHETIC_PREFIX))
+            )
+            await db.execute(
+                delete(UserToken).where(UserToken.user_id.startswith(SYNTHETIC_PREFIX))
+            )
+            await db.commit()
+
+        users_per_batch = max(1, INSERT_BATCH_SIZE // max(mappings_per_user, 1))
+        for first in range(0, users, users_per_batch):
+            batch = list(user_rows(first, min(users_per_batch, users - first), mappings_per_user))
+            async with SessionLocal() as db:
+                await db.execute(insert(UserToken), [user for user, _ in batch])
+                mappings = [mapping for _, user_mappings in batch for mapping in user_mappings]
+                if mappings:
+                    await db.execute(insert(SongMapping), mappings)
+                await db.commit()
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--mappings", type=int, default=100)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    asyncio.run(seed_synthetic_users(args.users, args.mappings))
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {args.users} users and {args.users * args.mappings} mappings in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compare a fresh HTTP client per request with one pooled keep-alive client.
+
+Starts a local HTTPS server with a throwaway self-signed certificate, so the
+TCP and TLS setup that pooling saves is part of the measurement. Pass --url
+to measure against a real endpoint instead.
+
+Usage: python common/benchmarks/bench_connection_pool.py [--requests 200] [--url URL]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.http_client import ConnectionStats, create_async_client  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"id": "stub"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_self_signed_cert(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return cert_path, key_path
+
+
+def start_server(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*write_self_signed_cert(directory))
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"https://127.0.0.1:{server.server_address[1]}/v1/me"
+
+
+async def timed(client, url):
+    started = time.perf_counter()
+    await client.get(url)
+    return time.perf_counter() - started
+
+
+async def fresh_client_per_request(url, count):
+    latencies = []
+    for _ in range(count):
+        async with httpx.AsyncClient(verify=False) as client:
+            latencies.append(await timed(client, url))
+    return latencies, None
+
+
+async def pooled_client(url, count):
+    stats = ConnectionStats()
+    async with create_async_client(stats=stats, verify=False) as client:
+        latencies = [await timed(client, url) for _ in range(count)]
+    return latencies, stats
+
+
+def report(label, latencies, stats):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    reuse = f"{stats.reuse_ratio:.0%}" if stats else "0%"
+    print(f"{label:<10} p50={p50:7.2f}ms  p99={p99:7.2f}ms  connection reuse={reuse}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        url = args.url
+        if not url:
+            server, url = start_server(directory)
+        for label, bench in [("fresh", fresh_client_per_request), ("pooled", pooled_client)]:
+            report(label, *asyncio.run(bench(url, args.requests)))
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""In-process TTL/LRU cache with optional Redis sharing and in-flight request coalescing"""
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # the shared backend is optional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """Least-recently-used cache holding at most `maxsize` entries for `ttl` seconds each"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=MISSING):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return default
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def items(self):
+        """Unexpired (key, value) pairs, least recently used first, without touching recency"""
+        now = time.monotonic()
+        return [
+            (key, value) for key, (expires_at, value) in self.entries.items() if expires_at > now
+        ]
+
+    def as_dict(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CoalescingCache:
+    """TTLCache front for an async loader.
+
+    Concurrent misses for the same key share one load. When `redis_url` is
+    set, loaded values (which must be JSON-serializable) are also shared
+    between processes through Redis.
+    """
+
+    def __init__(self, maxsize, ttl, redis_url=None, namespace="cache"):
+        self.local = TTLCache(maxsize, ttl)
+        self.namespace = namespace
+        self.inflight = {}
+        self.redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning("redis is not installed; using the in-process cache only")
+            else:
+                self.redis = aioredis.from_url(redis_url)
+
+    async def get_or_load(self, key, load):
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.local.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this caller was cancelled, not the shared load
+                # The leading caller was cancelled mid-load
+                return await load()
+            except Exception:
+                # The shared load failed (possibly for reasons specific to its caller)
+                return await load()
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await self.get_shared(key)
+            if value is MISSING:
+                self.local.stats["loads"] += 1
+                value = await load()
+                await self.set_shared(key, value)
+            self.local.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        finally:
+            if not future.done():
+                # Cancelled (CancelledError isn't an Exception); release the waiters
+                future.cancel()
+            del self.inflight[key]
+
+    async def get_shared(self, key):
+        if not self.redis:
+            return MISSING
+        try:
+            raw = await self.redis.get(f"{self.namespace}:{key}")
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            return MISSING
+        if raw is None:
+            return MISSING
+        self.local.stats["shared_hits"] += 1
+        return json.loads(raw)
+
+    async def set_shared(self, key, value):
+        if not self.redis:
+            return
+        try:
+            await self.redis.set(
+                f"{self.namespace}:{key}", json.dumps(value), ex=int(self.local.ttl)
+            )
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    async def close(self):
+        if self.redis:
+            await self.redis.aclose()
+
+    def as_dict(self):
+        return {**self.local.as_dict(), "inflight": len(self.inflight)}
@@ -0,0 +1,54 @@
+"""Pooled, long-lived HTTP clients with connection reuse accounting"""
+import os
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+
+class ConnectionStats:
+    """Counts requests and the new TCP connections they needed"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+
+    async def on_request(self, request):
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    @property
+    def reuse_ratio(self):
+        if not self.requests:
+            return 0.0
+        return max(0.0, 1 - self.new_connections / self.requests)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": round(self.reuse_ratio, 4),
+        }
+
+
+def create_async_client(transport=None, stats=None, **kwargs):
+    """Build a keep-alive AsyncClient sized from the HTTP_* environment variables"""
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    event_hooks = {"request": [stats.on_request]} if stats else None
+    return httpx.AsyncClient(
+        transport=transport, limits=limits, timeout=timeout, event_hooks=event_hooks, **kwargs
+    )
+
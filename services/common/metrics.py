@@ -0,0 +1,62 @@
+"""Prometheus metrics helpers shared by the API and the queue manager"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Latency buckets for single upstream calls and DB queries, 1ms to 10s
+CALL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StatsCollector:
+    """Publishes the numeric values of an `as_dict()`-style callable as gauges.
+
+    Lets the existing in-process counters (connection reuse, cache stats, ...)
+    be scraped alongside the histograms without instrumenting them twice. With
+    several server processes they only describe the one answering the scrape,
+    so they carry its pid.
+    """
+
+    def __init__(self, prefix, documentation, stats):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            if MULTIPROCESS:
+                gauge = GaugeMetricFamily(name, self.documentation, labels=["pid"])
+                gauge.add_metric([str(os.getpid())], value)
+                yield gauge
+            else:
+                yield GaugeMetricFamily(name, self.documentation, value=value)
+
+
+stats_collectors = []
+
+
+def register_stats(prefix, documentation, stats):
+    collector = StatsCollector(prefix, documentation, stats)
+    stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_metrics():
+    """(body, content type) for a scrape, merging worker processes in multiprocess mode"""
+    registry = REGISTRY
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in stats_collectors:
+            registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
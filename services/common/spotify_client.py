@@ -0,0 +1,194 @@
+"""Rate-limit-aware access to the Spotify Web API, shared by the API and the queue manager"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import Counter
+
+import httpx
+from prometheus_client import Histogram
+
+from common.metrics import CALL_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+SPOTIFY_API_BASE_URL = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "50"))  # requests per second
+SPOTIFY_BURST = int(os.getenv("SPOTIFY_BURST", "100"))
+# The rate limit is Spotify's, for the whole app; each process's bucket gets an
+# equal share, so set this to every process using it (API workers plus queue managers)
+SPOTIFY_PROCESSES = max(1, int(os.getenv("SPOTIFY_PROCESSES", "1")))
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+# Longest Retry-After block a request waits out before failing instead
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "10"))
+
+
+SPOTIFY_REQUEST_DURATION = Histogram(
+    "spotify_request_duration_seconds",
+    "Spotify Web API call latency per attempt, by status (or 'error' for transport failures)",
+    ["method", "endpoint", "status"],
+    buckets=CALL_BUCKETS,
+)
+
+
+class SpotifyUnavailableError(Exception):
+    """Spotify is rate limiting or failing and the request could not be completed"""
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stops calls after `failure_threshold` consecutive 5xx or transport failures.
+
+    Once open, a single trial call is let through every `reset_timeout`
+    seconds; a success closes the breaker again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Half-open: re-arm the timer so only this call goes through
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Spotify circuit breaker opened")
+            self.opened_at = time.monotonic()
+
+
+def parse_retry_after(value, default=1.0):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class SpotifyClient:
+    """Sends Spotify Web API requests through a token bucket and circuit breaker.
+
+    429 responses pause every caller in the process until Retry-After has
+    passed, since Spotify's rate limit applies to the whole app; callers
+    fail at once instead while more than `max_retry_after` seconds remain.
+    5xx responses and transport errors are retried with jittered
+    exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        base_url=SPOTIFY_API_BASE_URL,
+        rate=SPOTIFY_RATE_LIMIT / SPOTIFY_PROCESSES,
+        burst=max(1, SPOTIFY_BURST // SPOTIFY_PROCESSES),
+        max_retries=SPOTIFY_MAX_RETRIES,
+        max_retry_after=SPOTIFY_MAX_RETRY_AFTER,
+        breaker=None,
+    ):
+        self.client = client
+        self.base_url = base_url
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.blocked_until = 0.0
+        self.stats = Counter()
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(8.0, 0.5 * 2**attempt))
+
+    async def request(self, method, path, token, **kwargs) -> httpx.Response:
+        """Send a request for a user; non-retryable responses are returned as-is"""
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        endpoint = httpx.URL(path).path if path.startswith("http") else path
+        headers = {"Authorization": f"Bearer {token}", **kwargs.pop("headers", {})}
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.stats["circuit_open"] += 1
+                raise SpotifyUnavailableError("Spotify circuit breaker is open")
+
+            pause = self.blocked_until - time.monotonic()
+            if pause > self.max_retry_after:
+                self.stats["blocked"] += 1
+                raise SpotifyUnavailableError(f"Spotify is rate limiting for another {pause:.0f}s")
+            if pause > 0:
+                await asyncio.sleep(pause + random.uniform(0, 1))
+            await self.bucket.acquire()
+
+            self.stats["requests"] += 1
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError as e:
+                SPOTIFY_REQUEST_DURATION.labels(method, endpoint, "error").observe(
+                    time.perf_counter() - started
+                )
+                logger.warning(f"Spotify request error: {str(e)}")
+                self.breaker.record_failure()
+                delay = self.backoff(attempt)
+            else:
+                SPOTIFY_REQUEST_DURATION.labels(method, endpoint, response.status_code).observe(
+                    time.perf_counter() - started
+                )
+                if response.status_code == 429:
+                    # Throttling is handled by waiting, not by tripping the breaker
+                    self.stats["rate_limited"] += 1
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                    delay = 0  # the wait happens through blocked_until
+                elif response.status_code >= 500:
+                    self.stats["server_errors"] += 1
+                    self.breaker.record_failure()
+                    delay = self.backoff(attempt)
+                else:
+                    self.breaker.record_success()
+                    return response
+
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+        self.stats["exhausted"] += 1
+        raise SpotifyUnavailableError(
+            f"Spotify request failed after {self.max_retries + 1} attempts"
+        )
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from common.cache import CoalescingCache, TTLCache
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    cache = TTLCache(2, 0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b", None) is None
+    assert [key for key, _ in cache.items()] == ["a", "c"]
+    time.sleep(0.06)
+    assert cache.get("a", None) is None
+    assert cache.stats["evictions"] == 1 and cache.stats["expired"] == 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache = CoalescingCache(10, 60)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", load) for _ in range(5)))
+
+    assert run(scenario()) == ["value"] * 5
+    assert len(loads) == 1
+    assert run(cache.get_or_load("k", load)) == "value"
+    assert len(loads) == 1
+
+
+def test_failed_load_lets_waiters_load_themselves():
+    cache = CoalescingCache(10, 60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError("first load fails")
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(
+            cache.get_or_load("k", load), cache.get_or_load("k", load), return_exceptions=True
+        )
+
+    leader, waiter = run(scenario())
+    assert isinstance(leader, RuntimeError)
+    assert waiter == "value"
+    assert not cache.inflight
+
+
+def test_cancelled_leader_releases_its_waiters():
+    cache = CoalescingCache(10, 60)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "value"
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load("k", slow))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_load("k", fast))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    assert run(scenario()) == "value"
+    assert not cache.inflight
+
+
+def test_cancelled_waiter_does_not_cancel_the_load():
+    cache = CoalescingCache(10, 60)
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load("k", load))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_load("k", load))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert run(scenario()) == "value"
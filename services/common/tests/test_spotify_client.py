@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from common.spotify_client import CircuitBreaker, SpotifyClient, SpotifyUnavailableError
+
+
+def make_client(responses, **kwargs):
+    """SpotifyClient over a mock transport answering with `responses` in turn"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    client = SpotifyClient(
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        base_url="https://spotify.test/v1",
+        rate=1000,
+        burst=1000,
+        **kwargs,
+    )
+    client.backoff = lambda attempt: 0
+    return client, calls
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+
+def test_retries_after_a_short_block():
+    client, calls = make_client(
+        [httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={})]
+    )
+    response = run(client.request("GET", "/me", "token"))
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert calls[0].headers["Authorization"] == "Bearer token"
+    assert client.stats["rate_limited"] == 1
+
+
+def test_long_retry_after_fails_at_once():
+    client, calls = make_client(
+        [httpx.Response(429, headers={"Retry-After": "3600"})], max_retry_after=10
+    )
+    started = time.monotonic()
+    with pytest.raises(SpotifyUnavailableError):
+        run(client.request("GET", "/me", "token"))
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1
+
+    # Later requests don't reach Spotify while the block lasts
+    with pytest.raises(SpotifyUnavailableError):
+        run(client.request("GET", "/me", "token"))
+    assert len(calls) == 1
+    assert client.stats["blocked"] == 2
+
+
+def test_zero_max_retry_after_never_waits():
+    client, calls = make_client(
+        [httpx.Response(429, headers={"Retry-After": "2"})], max_retry_after=0
+    )
+    started = time.monotonic()
+    with pytest.raises(SpotifyUnavailableError):
+        run(client.request("GET", "/me", "token"))
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1
+
+
+def test_client_errors_are_returned_without_retrying():
+    client, calls = make_client([httpx.Response(404)])
+    assert run(client.request("GET", "/me", "token")).status_code == 404
+    assert len(calls) == 1
+
+
+def test_server_errors_are_retried_then_give_up():
+    client, calls = make_client([httpx.Response(503)], max_retries=2)
+    with pytest.raises(SpotifyUnavailableError):
+        run(client.request("GET", "/me", "token"))
+    assert len(calls) == 3
+    assert client.stats["exhausted"] == 1
+
+
+def test_breaker_opens_after_consecutive_failures():
+    client, calls = make_client(
+        [httpx.Response(500)], max_retries=0, breaker=CircuitBreaker(failure_threshold=2)
+    )
+    for _ in range(2):
+        with pytest.raises(SpotifyUnavailableError):
+            run(client.request("GET", "/me", "token"))
+    with pytest.raises(SpotifyUnavailableError, match="circuit breaker"):
+        run(client.request("GET", "/me", "token"))
+    assert len(calls) == 2
+    assert client.stats["circuit_open"] == 1
+
+
+def test_half_open_breaker_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client, calls = make_client([httpx.Response(500), httpx.Response(200, json={})], breaker=breaker)
+    client.max_retries = 0
+    with pytest.raises(SpotifyUnavailableError):
+        run(client.request("GET", "/me", "token"))
+    assert breaker.is_open
+    assert run(client.request("GET", "/me", "token")).status_code == 200
+    assert not breaker.is_open
@@ -0,0 +1,71 @@
+"""Benchmark one QueueManager polling cycle against stubbed upstreams.
+
+Usage: python benchmarks/bench_engine.py [--users 2000] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+async def bench(users, latency, api_concurrency, spotify_concurrency):
+    os.environ["API_CONCURRENCY"] = str(api_concurrency)
+    os.environ["SPOTIFY_CONCURRENCY"] = str(spotify_concurrency)
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    stub = StubServices(manager.cipher_suite, num_users=users, latency=latency)
+    manager.transport = stub.transport()
+    async with manager.create_client():
+        stats = await manager.run_cycle()
+        first_calls = spotify_calls(manager)
+
+        # Check everyone again with playback unchanged
+        for user_id in list(manager.scheduler.due):
+            manager.scheduler.schedule(user_id, 0.0)
+        await manager.run_cycle()
+        repeat_calls = spotify_calls(manager) - first_calls
+    return stats, first_calls / users, repeat_calls / users
+
+
+def spotify_calls(manager):
+    return sum(
+        count for call, count in manager.call_counts.items() if call.startswith("spotify ")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    print(
+        f"{'api/spotify':>12} {'users/s':>10} {'cycle s':>9} {'lag p95 s':>10} "
+        f"{'spotify calls/user first':>25} {'repeat':>7}"
+    )
+    for api_concurrency, spotify_concurrency in [(1, 1), (20, 50), (100, 200)]:
+        stats, first_calls, repeat_calls = asyncio.run(
+            bench(args.users, args.latency, api_concurrency, spotify_concurrency)
+        )
+        print(
+            f"{api_concurrency:>5}/{spotify_concurrency:<6} {stats['users_per_s']:>10.1f} "
+            f"{stats['duration_s']:>9.2f} {stats['lag_p95_s']:>10.2f} "
+            f"{first_calls:>25.2f} {repeat_calls:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
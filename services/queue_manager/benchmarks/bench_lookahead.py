@@ -0,0 +1,144 @@
+"""Polls and chain breaks per user-hour with chain lookahead.
+
+Simulates listeners on a virtual clock: each plays through a chain of
+mappings (A -> B -> C ...), tracks last 90-300s, and when a track ends the
+player takes the head of the Spotify queue, or the user picks a random
+track if the queue is empty. A chain break is a trigger that ends without
+its mapped song playing next. Each user is checked whenever process_user
+asks to be, so the poll counts are what the engine itself schedules.
+Runs once per lookahead depth.
+
+Usage: python benchmarks/bench_lookahead.py [--users 200] [--hours 4] [--depths 1,2,3,5]
+"""
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+import random
+import sys
+
+import httpx
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+class SimulatedPlayers(StubServices):
+    """StubServices whose /me/player and queue follow a virtual clock"""
+
+    def __init__(self, cipher_suite, num_users, seed=0):
+        super().__init__(cipher_suite, num_users=num_users, latency=0, seed=seed)
+        rng = random.Random(seed)
+        self.rng = rng
+        self.now = 0.0
+        self.durations = {}
+        self.successor = {}
+        self.players = {}
+        self.trigger_ends = 0
+        self.breaks = 0
+        for user_id, user in self.users.items():
+            for mapping in user["mappings"]:
+                self.successor[mapping["trigger_song_id"]] = mapping["queue_song_id"]
+                for track_id in (mapping["trigger_song_id"], mapping["queue_song_id"]):
+                    self.durations.setdefault(track_id, rng.uniform(90, 300))
+            tracks = [mapping["trigger_song_id"] for mapping in user["mappings"]]
+            # Start part-way into a track so users aren't in lockstep
+            track_id = rng.choice(tracks)
+            self.players[user_id] = {
+                "tracks": tracks,
+                "track_id": track_id,
+                "started_at": -rng.uniform(0, self.durations[track_id]),
+                "queue": [],
+            }
+
+    def advance(self, player):
+        while player["started_at"] + self.durations[player["track_id"]] <= self.now:
+            ended_at = player["started_at"] + self.durations[player["track_id"]]
+            next_track_id = (
+                player["queue"].pop(0) if player["queue"] else self.rng.choice(player["tracks"])
+            )
+            mapped = self.successor.get(player["track_id"])
+            if mapped:
+                self.trigger_ends += 1
+                self.breaks += next_track_id != mapped
+            player["track_id"] = next_track_id
+            player["started_at"] = ended_at
+
+    def handle_spotify(self, request):
+        user_id = request.headers["Authorization"].removeprefix("Bearer token-")
+        player = self.players[user_id]
+        self.advance(player)
+        path = request.url.path
+        if path == "/v1/me/player":
+            return httpx.Response(
+                200,
+                json={
+                    "is_playing": True,
+                    "progress_ms": int((self.now - player["started_at"]) * 1000),
+                    "item": {
+                        "id": player["track_id"],
+                        "duration_ms": int(self.durations[player["track_id"]] * 1000),
+                    },
+                },
+            )
+        if path == "/v1/me/player/queue" and request.method == "GET":
+            queue = [
+                {"id": track_id, "duration_ms": int(self.durations[track_id] * 1000)}
+                for track_id in player["queue"]
+            ]
+            return httpx.Response(200, json={"currently_playing": None, "queue": queue})
+        if path == "/v1/me/player/queue" and request.method == "POST":
+            self.queue_adds[user_id] += 1
+            player["queue"].append(request.url.params["uri"].removeprefix("spotify:track:"))
+            return httpx.Response(204)
+        return httpx.Response(404)
+
+
+async def simulate(users, hours, depth):
+    os.environ["QUEUE_LOOKAHEAD"] = str(depth)
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    sim = SimulatedPlayers(manager.cipher_suite, users)
+    manager.transport = sim.transport()
+    async with manager.create_client():
+        await manager.sync_users()
+        checks = [(0.0, user_id) for user_id in manager.users]
+        heapq.heapify(checks)
+        while checks[0][0] < hours * 3600:
+            sim.now, user_id = heapq.heappop(checks)
+            delay = await manager.process_user(manager.users[user_id])
+            heapq.heappush(checks, (sim.now + delay, user_id))
+    return sim
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=4)
+    parser.add_argument("--depths", default="1,2,3,5")
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    user_hours = args.users * args.hours
+    print("Polls, queue reads and adds per user-hour; breaks per trigger play")
+    print(f"{'lookahead':<10}{'polls':>8}{'queue reads':>13}{'adds':>8}{'breaks':>9}")
+    for depth in (int(depth) for depth in args.depths.split(",")):
+        sim = asyncio.run(simulate(args.users, args.hours, depth))
+        print(
+            f"{depth:<10}{sim.calls['spotify.stub GET player'] / user_hours:>8.1f}"
+            f"{sim.calls['spotify.stub GET queue'] / user_hours:>13.1f}"
+            f"{sum(sim.queue_adds.values()) / user_hours:>8.1f}"
+            f"{sim.breaks / max(sim.trigger_ends, 1):>9.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Queue adds and queue reads per trigger play.
+
+Runs repeated cycles over stub users sitting on a trigger track (the same
+play, so each mapping should be added once and the queue read once), then
+restarts every active user's track from the top (a new play, so each should
+be added exactly once more), then moves them on to the queued song.
+
+Usage: python benchmarks/bench_queue_ledger.py [--users 2000] [--cycles 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+async def run_cycles(manager, cycles):
+    for _ in range(cycles):
+        # Make every user due now
+        for user_id in list(manager.scheduler.due):
+            manager.scheduler.schedule(user_id, 0.0)
+        await manager.run_cycle()
+
+
+def report(label, stub, before, plays):
+    adds = sum(stub.queue_adds.values()) - before[0]
+    reads = stub.calls["spotify.stub GET queue"] - before[1]
+    print(
+        f"{label:<30}{plays:>6} plays  {adds / plays:.2f} adds/play  "
+        f"{reads / plays:.2f} queue reads/play"
+    )
+    return adds / plays, reads / plays
+
+
+def snapshot(stub):
+    return sum(stub.queue_adds.values()), stub.calls["spotify.stub GET queue"]
+
+
+async def bench(users, cycles):
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    stub = StubServices(manager.cipher_suite, num_users=users, latency=0)
+    manager.transport = stub.transport()
+    # Users on the last track of their chain have nothing to queue
+    triggers = {
+        user_id: {
+            mapping["trigger_song_id"]: mapping["queue_song_id"] for mapping in user["mappings"]
+        }
+        for user_id, user in stub.users.items()
+    }
+    playing = [
+        user_id for user_id, user in stub.users.items() if user["playing"] in triggers[user_id]
+    ]
+    results = {}
+    async with manager.create_client():
+        before = snapshot(stub)
+        await run_cycles(manager, cycles)
+        results["same play"] = report(f"same play, {cycles} cycles", stub, before, len(playing))
+
+        for user_id in playing:
+            stub.users[user_id]["progress_ms"] = 1_000
+        before = snapshot(stub)
+        await run_cycles(manager, cycles)
+        results["replayed"] = report(f"replayed, {cycles} cycles", stub, before, len(playing))
+
+        moved = []
+        for user_id in playing:
+            user = stub.users[user_id]
+            user["playing"] = triggers[user_id][user["playing"]]
+            if user["playing"] in triggers[user_id]:
+                moved.append(user_id)
+        before = snapshot(stub)
+        await run_cycles(manager, cycles)
+        results["next track"] = report(f"next track, {cycles} cycles", stub, before, len(moved))
+    print(f"ledger: {manager.queue_ledger.as_dict()}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+    asyncio.run(bench(args.users, args.cycles))
+
+
+if __name__ == "__main__":
+    main()
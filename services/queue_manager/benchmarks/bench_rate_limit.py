@@ -0,0 +1,56 @@
+"""Drive QueueManager cycles against a stub Spotify that answers 429 above a rate limit.
+
+Compares the client-side token bucket disabled against a bucket set just
+below the stub's limit; both honor Retry-After.
+
+Usage: python benchmarks/bench_rate_limit.py [--users 1000] [--limit 200]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from common.spotify_client import TokenBucket  # noqa: E402
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+async def bench(users, limit, client_rate):
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    manager.spotify.bucket = TokenBucket(client_rate, max(1, int(client_rate / 10)))
+    stub = StubServices(
+        manager.cipher_suite, num_users=users, latency=0.005, spotify_rate_limit=limit
+    )
+    manager.transport = stub.transport()
+    async with manager.create_client():
+        stats = await manager.run_cycle()
+    return stats, stub.calls["spotify 429"], manager.spotify.stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.CRITICAL)
+    logging.getLogger("common.spotify_client").setLevel(logging.CRITICAL)
+
+    print(f"{'client rate':>12} {'users/s':>9} {'cycle s':>8} {'429s':>6} {'retries':>8} {'failed':>7}")
+    for label, client_rate in [("unlimited", 1_000_000), ("bucket", args.limit * 0.9)]:
+        stats, rejected, client_stats = asyncio.run(bench(args.users, args.limit, client_rate))
+        failed = client_stats["circuit_open"] + client_stats["exhausted"]
+        print(
+            f"{label:>12} {stats['users_per_s']:>9.1f} {stats['duration_s']:>8.2f} "
+            f"{rejected:>6} {client_stats['retries']:>8} {failed:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Run several QueueManager workers against one stub API and check user ownership.
+
+Every user must be checked by exactly one worker, and when a worker leaves
+its users must move to the survivors.
+
+Usage: python benchmarks/bench_sharding.py [--users 3000] [--workers 3]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from collections import Counter
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+async def run_round(workers):
+    """Renew every lease, then let each worker check whatever it owns"""
+    for worker in workers:
+        worker.user_last_check.clear()
+        await worker.heartbeat()
+    for worker in workers:
+        await worker.heartbeat()
+        worker.last_heartbeat = worker.last_sync = 0.0
+        # Make every owned user due now
+        for user_id in list(worker.scheduler.due):
+            worker.scheduler.schedule(user_id, 0.0)
+    await asyncio.gather(*(worker.run_cycle() for worker in workers))
+    return Counter(user_id for worker in workers for user_id in worker.user_last_check)
+
+
+def report(label, workers, checks, total_users):
+    owned = ", ".join(f"{worker.worker_id}={len(worker.user_last_check)}" for worker in workers)
+    duplicates = sum(1 for count in checks.values() if count > 1)
+    missing = total_users - len(checks)
+    print(f"{label:<14} {owned}  duplicates={duplicates} missing={missing}")
+    return duplicates == 0 and missing == 0
+
+
+async def bench(users, worker_count):
+    cipher = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    stub = StubServices(cipher, num_users=users, latency=0)
+    transport = stub.transport()
+    workers = []
+    for n in range(worker_count):
+        worker = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, transport=transport)
+        worker.worker_id = f"worker{n}"
+        worker.create_client()
+        workers.append(worker)
+
+    ok = report("all workers", workers, await run_round(workers), users)
+
+    leaving = workers.pop()
+    await leaving.release()
+    before = set(leaving.user_last_check)
+    checks = await run_round(workers)
+    ok = report(f"{leaving.worker_id} left", workers, checks, users) and ok
+    print(f"{len(before)} users moved off {leaving.worker_id}")
+
+    for worker in workers + [leaving]:
+        await worker.client.aclose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    ok = asyncio.run(bench(args.users, args.workers))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Token decrypts per check, and proactive refresh of tokens close to expiry.
+
+Runs repeated cycles over stub users, first with long-lived tokens (every
+check after the first should hit the cache), then with tokens expiring
+inside the refresh margin (each should be refreshed once, with no 401s).
+
+Usage: python benchmarks/bench_token_cache.py [--users 2000] [--cycles 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+from main import QueueManager  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+async def bench(users, cycles, token_ttl):
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    stub = StubServices(manager.cipher_suite, num_users=users, latency=0, token_ttl=token_ttl)
+    manager.transport = stub.transport()
+    async with manager.create_client():
+        for _ in range(cycles):
+            # Make every user due now
+            for user_id in list(manager.scheduler.due):
+                manager.scheduler.schedule(user_id, 0.0)
+            await manager.run_cycle()
+    return manager, stub
+
+
+def time_lookups(manager, lookup):
+    user_ids = list(manager.users)
+    started = time.perf_counter()
+    for user_id in user_ids:
+        lookup(user_id)
+    return (time.perf_counter() - started) / len(user_ids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    manager, _ = asyncio.run(bench(args.users, args.cycles, None))
+    stats = manager.token_cache.as_dict()
+    checks = args.users * args.cycles
+    print(
+        f"long-lived tokens: {stats['decrypts'] / checks:.2f} decrypts/check, "
+        f"hit ratio {stats['hit_ratio']:.2f}"
+    )
+    cached_us = time_lookups(manager, manager.get_user_token)
+    uncached_us = time_lookups(
+        manager, lambda user_id: manager.decrypt_token(manager.users[user_id]["access_token"])
+    )
+    print(f"token lookup: cached {cached_us:.1f}us, decrypt every time {uncached_us:.1f}us")
+
+    expiring_ttl = manager.token_cache.refresh_margin / 2
+    manager, stub = asyncio.run(bench(args.users, args.cycles, expiring_ttl))
+    stats = manager.token_cache.as_dict()
+    print(
+        f"tokens expiring in {expiring_ttl:.0f}s: {stats.get('refreshes', 0)} refreshes, "
+        f"{stats.get('refresh_failures', 0)} failures, "
+        f"{stub.calls['spotify 401']} Spotify 401s, "
+        f"{stats['decrypts'] / checks:.2f} decrypts/check"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Startup load of a restarted worker, cold and from a snapshot.
+
+Runs one worker over stub users until everyone has been checked, snapshots
+it, then starts a new worker three ways: cold (full sync, every user due at
+once), warm right away, and warm after --downtime seconds (every user
+overdue, so they are spread over RESTART_STAGGER). For each it reports API
+and Spotify calls and the busiest second of checks over the first --window
+seconds.
+
+Usage: python benchmarks/bench_warm_restart.py [--users 2000] [--window 12] [--downtime 600]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [QUEUE_MANAGER_DIR, os.path.dirname(QUEUE_MANAGER_DIR)]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Measure the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+os.environ.setdefault("RESTART_STAGGER", "10")
+
+from main import QueueManager  # noqa: E402
+from snapshot import load_snapshot, save_snapshot  # noqa: E402
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices  # noqa: E402
+
+
+def new_manager(stub):
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    manager.transport = stub.transport()
+    return manager
+
+
+async def run_for(manager, seconds):
+    started = time.time()
+    async with manager.create_client():
+        while time.time() - started < seconds:
+            await manager.run_cycle()
+            await asyncio.sleep(min(manager.seconds_until_next_tick(), 0.2))
+    return started
+
+
+def report(label, manager, started):
+    per_second = Counter(
+        int(checked - started) for checked in manager.user_last_check.values() if checked >= started
+    )
+    api_calls = sum(count for call, count in manager.call_counts.items() if call.startswith("api "))
+    spotify_calls = sum(
+        count for call, count in manager.call_counts.items() if call.startswith("spotify ")
+    )
+    print(
+        f"{label:<24}{sum(per_second.values()):>7} checks  "
+        f"busiest second {max(per_second.values(), default=0):>5}  "
+        f"{api_calls:>5} API calls  {spotify_calls:>6} Spotify calls"
+    )
+
+
+def shift_back(state, seconds):
+    """The snapshot as if the worker had been down for `seconds`"""
+    state["written_at"] -= seconds
+    state["due"] = {user_id: due_at - seconds for user_id, due_at in state["due"].items()}
+    return state
+
+
+async def bench(args):
+    cipher_suite = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    stub = StubServices(cipher_suite, num_users=args.users, latency=0)
+    first = new_manager(stub)
+    async with first.create_client():
+        await first.run_cycle()
+
+    path = os.path.join(tempfile.mkdtemp(), "snapshot.json.gz")
+    started = time.perf_counter()
+    save_snapshot(path, first.snapshot_state())
+    saved_in = time.perf_counter() - started
+    started = time.perf_counter()
+    load_snapshot(path)
+    loaded_in = time.perf_counter() - started
+    print(
+        f"snapshot: {os.path.getsize(path) / 1024:.0f} KiB for {args.users} users, "
+        f"saved in {saved_in * 1000:.0f}ms, loaded in {loaded_in * 1000:.0f}ms"
+    )
+
+    cold = new_manager(stub)
+    report("cold start", cold, await run_for(cold, args.window))
+
+    warm = new_manager(stub)
+    warm.restore_state(load_snapshot(path))
+    report("warm, right away", warm, await run_for(warm, args.window))
+
+    late = new_manager(stub)
+    late.restore_state(shift_back(load_snapshot(path), args.downtime))
+    report(f"warm, {args.downtime}s later", late, await run_for(late, args.window))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--window", type=float, default=12)
+    parser.add_argument("--downtime", type=float, default=600)
+    args = parser.parse_args()
+    logging.getLogger("main").setLevel(logging.WARNING)
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""In-process stubs of the API service and the Spotify Web API for benchmarking.
+
+These answer through httpx.MockTransport with playback state the benchmarks
+and tests set directly. Load tests over real HTTP use the Spotify simulator
+in services/benchmarks/spotify_sim.py instead.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+STUB_API_BASE_URL = "http://api.stub/v1"
+STUB_SPOTIFY_BASE_URL = "http://spotify.stub/v1"
+
+
+class StubServices:
+    def __init__(
+        self,
+        cipher_suite,
+        num_users=1000,
+        mappings_per_user=50,
+        active_ratio=0.5,
+        latency=0.05,
+        lease_seconds=30,
+        spotify_rate_limit=None,
+        token_ttl=None,
+        seed=0,
+    ):
+        rng = random.Random(seed)
+        self.cipher_suite = cipher_suite
+        self.latency = latency
+        self.lease_seconds = lease_seconds
+        # Requests per second Spotify accepts before answering 429
+        self.spotify_rate_limit = spotify_rate_limit
+        self.rate_window = (0, 0)
+        self.leases = {}
+        self.calls = Counter()
+        self.queue_adds = Counter()
+        self.users = {}
+        self.version = 0
+        for n in range(num_users):
+            user_id = f"user{n}"
+            tracks = [f"track{n}_{i}" for i in range(mappings_per_user + 1)]
+            self.users[user_id] = {
+                "token": cipher_suite.encrypt(f"token-{user_id}".encode()).decode(),
+                "mappings": [
+                    {
+                        "id": f"{user_id}-{i}",
+                        "user_id": user_id,
+                        "trigger_song_id": tracks[i],
+                        "queue_song_id": tracks[i + 1],
+                    }
+                    for i in range(mappings_per_user)
+                ],
+                "playing": rng.choice(tracks) if rng.random() < active_ratio else None,
+                "progress_ms": 60_000,
+                # Seconds until the token expires; GET /users/{id}/token hands out a new hour
+                "expires_at": time.time() + token_ttl if token_ttl is not None else None,
+            }
+            self.touch(user_id)
+
+    def touch(self, user_id):
+        """Mark a user as changed so the next sync returns it"""
+        self.version += 1
+        self.users[user_id]["version"] = self.version
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency)
+        host = request.url.host
+        path = request.url.path
+        self.calls[f"{host} {request.method} {path.split('/')[-1]}"] += 1
+        if host == "api.stub":
+            return self.handle_api(request)
+        return self.handle_spotify(request)
+
+    def handle_api(self, request):
+        method = request.method
+        params = request.url.params
+        parts = request.url.path.strip("/").split("/")
+        if parts[:2] == ["v1", "workers"] and method == "POST":
+            return httpx.Response(200, json=self.handle_lease(parts[2], parts[3]))
+        if parts == ["v1", "users"]:
+            return httpx.Response(200, json=[{"user_id": user_id} for user_id in self.users])
+        if parts == ["v1", "users", "sync"]:
+            return httpx.Response(200, json=self.sync_page(params))
+        if parts == ["v1", "users", "mappings"] and method == "POST":
+            user_ids = json.loads(request.content)["user_ids"]
+            return httpx.Response(200, json=self.user_mappings(user_ids))
+        user = self.users.get(parts[2]) if len(parts) == 4 else None
+        if not user:
+            return httpx.Response(404, json={"detail": "User not found"})
+        if parts[3] == "token":
+            if user["expires_at"] is not None:
+                user["token"] = self.cipher_suite.encrypt(f"token-{parts[2]}".encode()).decode()
+                user["expires_at"] = time.time() + 3600
+            return httpx.Response(
+                200,
+                json={
+                    "user_id": parts[2],
+                    "access_token": user["token"],
+                    "expires_at": user["expires_at"],
+                },
+            )
+        return httpx.Response(200, json=user["mappings"])
+
+    def handle_spotify(self, request):
+        if self.spotify_rate_limit:
+            second, count = self.rate_window
+            now = int(time.monotonic())
+            count = count + 1 if now == second else 1
+            self.rate_window = (now, count)
+            if count > self.spotify_rate_limit:
+                self.calls["spotify 429"] += 1
+                return httpx.Response(429, headers={"Retry-After": "1"})
+        user_id = request.headers["Authorization"].removeprefix("Bearer token-")
+        user = self.users[user_id]
+        if user["expires_at"] is not None and user["expires_at"] <= time.time():
+            self.calls["spotify 401"] += 1
+            return httpx.Response(401)
+        path = request.url.path
+        if path == "/v1/me/player":
+            if not user["playing"]:
+                return httpx.Response(204)
+            return httpx.Response(
+                200,
+                json={
+                    "is_playing": True,
+                    "progress_ms": user["progress_ms"],
+                    "item": {"id": user["playing"], "duration_ms": 180_000},
+                },
+            )
+        if path == "/v1/me/player/queue" and request.method == "GET":
+            return httpx.Response(200, json={"currently_playing": None, "queue": []})
+        if path == "/v1/me/player/queue" and request.method == "POST":
+            self.queue_adds[user_id] += 1
+            return httpx.Response(204)
+        return httpx.Response(404)
+
+    def sync_page(self, params):
+        since = int(params.get("since", 0))
+        limit = int(params.get("limit", 500))
+        changed = sorted(
+            (
+                (user["version"], user_id)
+                for user_id, user in self.users.items()
+                if user["version"] > since
+            ),
+        )
+        page = changed[:limit]
+        return {
+            "users": [
+                {
+                    "user_id": user_id,
+                    "access_token": self.users[user_id]["token"],
+                    "mappings_version": self.users[user_id]["version"],
+                    "expires_at": self.users[user_id]["expires_at"],
+                }
+                for _, user_id in page
+            ],
+            "next_cursor": str(page[-1][0]) if page else params.get("since"),
+            "has_more": len(changed) > limit,
+        }
+
+    def user_mappings(self, user_ids):
+        return {
+            "users": [
+                {
+                    "user_id": user_id,
+                    "mappings_version": self.users[user_id]["version"],
+                    "mappings": self.users[user_id]["mappings"],
+                }
+                for user_id in user_ids
+                if user_id in self.users
+            ]
+        }
+
+    def handle_lease(self, worker_id, action):
+        now = time.monotonic()
+        if action == "heartbeat":
+            self.leases[worker_id] = now + self.lease_seconds
+        else:
+            self.leases.pop(worker_id, None)
+        self.leases = {worker: expiry for worker, expiry in self.leases.items() if expiry >= now}
+        return {"workers": sorted(self.leases)}
@@ -0,0 +1,24 @@
+def build_lookahead(successors, depth):
+    """Songs to queue when each trigger starts, following the chain up to `depth` hops.
+
+    `successors` maps each trigger to its mapped songs (the per-user successor
+    graph). The first hop is every mapped song, as with no lookahead. Later hops
+    follow the chain only while it doesn't branch, since songs queued after a
+    branch would play in the wrong order, and stop at the first song already
+    on the path, so a cycle is queued at most once around.
+    """
+    chains = {}
+    for trigger, targets in successors.items():
+        chain = list(targets)
+        seen = {trigger, *chain}
+        hop = targets
+        for _ in range(depth - 1):
+            if len(hop) != 1:
+                break
+            hop = successors.get(hop[0], ())
+            if not hop or any(song_id in seen for song_id in hop):
+                break
+            chain.extend(hop)
+            seen.update(hop)
+        chains[trigger] = tuple(chain)
+    return chains
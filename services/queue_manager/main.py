@@ -1,19 +1,134 @@
+import asyncio
+import json
 import logging
 import os
+import random
+import signal
+import socket
 import time
+from collections import Counter
+
+import httpx
 from cryptography.fernet import Fernet
-import requests
-import spotipy
+from prometheus_client import start_http_server
+
+from common.cache import TTLCache
+from common.http_client import ConnectionStats, create_async_client
+from common.metrics import register_stats
+from common.spotify_client import SPOTIFY_API_BASE_URL, SpotifyClient, SpotifyUnavailableError
+from metrics import (
+    API_REQUEST_DURATION,
+    CHECKS_IN_FLIGHT,
+    CYCLE_DURATION,
+    QUEUE_ADDS,
+    SCHEDULE_LAG,
+    USERS_ACTIVE,
+    USERS_OWNED,
+    USERS_PER_CYCLE,
+)
+from lookahead import build_lookahead
+from queue_ledger import QueueLedger
+from scheduler import PollScheduler
+from sharding import HashRing
+from snapshot import load_snapshot, save_snapshot, snapshot_files
+from token_cache import TokenCache
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
+# httpx logs every request at INFO, which drowns out the worker's own logs
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 
 class QueueManager:
-    def __init__(self, api_base_url):
+    def __init__(self, api_base_url, spotify_base_url=SPOTIFY_API_BASE_URL, transport=None):
         self.api_base_url = api_base_url
+        self.spotify_base_url = spotify_base_url
         self.active_users = set()
         self.user_last_check = {}
-        self.check_interval = 30  # seconds between checks for each user
+        self.check_interval = 30  # max seconds between checks for a user who is listening
+        self.min_interval = 5  # min seconds between checks for any user
+        self.max_idle_interval = int(os.getenv("MAX_IDLE_INTERVAL", "300"))
+        self.tick_interval = 5  # max seconds between scheduler ticks
+        self.next_tick_at = 0.0
+        self.scheduler = PollScheduler()
+        # Tasks of the checks running now, by user; a check reschedules its user when done
+        self.checking = {}
+        self.completed_lags = []
+        self.report_interval = int(os.getenv("REPORT_INTERVAL", "30"))
+        self.last_report = 0.0
+        self.idle_streak = {}
+        self.last_sync = 0.0
+
+        # The API pushes user changes over /users/events; while that stream is up the
+        # worker syncs on each event and only polls every SYNC_INTERVAL as a safety net.
+        # Without it, it falls back to polling /users/sync every tick.
+        self.sync_interval = int(os.getenv("SYNC_INTERVAL", "60"))
+        self.events_connected = False
+        self.changes_pending = True
+        self.wakeup = asyncio.Event()
+        self.events_retry_delay = 1.0
+        self.change_events = Counter()
+
+        # Users are partitioned across live workers on a consistent hash ring
+        self.worker_id = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+        self.ring = None
+        self.last_heartbeat = 0.0
+        self.last_cycle_stats = None
+        # Upstream calls by "<service> <method> <path>", for benchmarks and metrics
+        self.call_counts = Counter()
+        # Songs already queued for each user's current play; a trigger play adds each at most once
+        self.queue_ledger = QueueLedger(
+            int(os.getenv("QUEUE_LEDGER_SIZE", "100000")),
+            ttl=int(os.getenv("QUEUE_LEDGER_TTL", "3600")),
+        )
+
+        # Users with their encrypted tokens, kept current via /users/sync
+        self.users = {}
+        # Per-user (mappings_version, {trigger_song_id: (queue_song_id, ...)}), where the
+        # songs for a trigger follow its chain up to QUEUE_LOOKAHEAD hops
+        self.mapping_index = {}
+        self.lookahead = max(1, int(os.getenv("QUEUE_LOOKAHEAD", "1")))
+        # Seconds per track, learned from queue reads, so checks can wait out queued songs
+        self.track_durations = TTLCache(
+            int(os.getenv("TRACK_DURATION_CACHE_SIZE", "100000")), 86400
+        )
+        self.sync_cursor = None
+        self.sync_page_size = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+
+        # Scheduling and cache state is snapshotted to SNAPSHOT_PATH (when set) every
+        # SNAPSHOT_INTERVAL seconds and on shutdown. A restarted worker resumes from it
+        # instead of syncing and checking every user at once; users that fell due while
+        # it was down are spread over RESTART_STAGGER seconds. "{worker_id}" in the path
+        # is replaced with this worker's id to give each worker its own file; a new
+        # worker without one takes over a snapshot whose worker's lease has lapsed.
+        self.snapshot_template = os.getenv("SNAPSHOT_PATH")
+        self.snapshot_path = (
+            self.snapshot_template.replace("{worker_id}", self.worker_id)
+            if self.snapshot_template
+            else None
+        )
+        self.snapshot_interval = int(os.getenv("SNAPSHOT_INTERVAL", "60"))
+        self.snapshot_max_age = int(os.getenv("SNAPSHOT_MAX_AGE", "3600"))
+        self.restart_stagger = float(os.getenv("RESTART_STAGGER", "30"))
+        self.last_snapshot = 0.0
+
+        # Bounded concurrency per upstream so a large user set cannot flood either service
+        self.api_semaphore = asyncio.Semaphore(int(os.getenv("API_CONCURRENCY", "20")))
+        self.spotify_semaphore = asyncio.Semaphore(int(os.getenv("SPOTIFY_CONCURRENCY", "50")))
+
+        # Shared async HTTP client, created when the engine starts
+        self.transport = transport
+        self.client = None
+        self.connection_stats = ConnectionStats()
+        self.spotify = SpotifyClient(base_url=spotify_base_url)
+
+        # Tokens are decrypted once per ciphertext rather than on every check
+        self.token_cache = TokenCache(
+            self.decrypt_token,
+            int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+            refresh_margin=int(os.getenv("TOKEN_REFRESH_MARGIN", "300")),
+        )
+
         encryption_key = os.getenv('ENCRYPTION_KEY')
         if not encryption_key:
             raise ValueError("ENCRYPTION_KEY environment variable is not set")
@@ -30,152 +145,702 @@ class QueueManager:
             logger.error(f"Error decrypting token: {str(e)}")
             return None
 
-    def get_all_users(self):
-        """Fetch all users from the API service"""
+    async def api_request(self, method, path, name, **kwargs):
+        """Call the API service; `name` labels the call in call_counts and metrics"""
+        self.call_counts[f"api {method} {name}"] += 1
+        started = time.perf_counter()
+        status = "error"
         try:
-            response = requests.get(
-                f"{self.api_base_url}/users",
-                timeout=10  # Add timeout
+            async with self.api_semaphore:
+                response = await self.client.request(
+                    method, f"{self.api_base_url}{path}", **kwargs
+                )
+            status = response.status_code
+        finally:
+            API_REQUEST_DURATION.labels(method, name, status).observe(
+                time.perf_counter() - started
             )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching users: {str(e)}")
+        response.raise_for_status()
+        return response.json()
+
+    async def api_get(self, path, params=None, name=None):
+        """GET a path from the API service; `name` groups per-user paths"""
+        return await self.api_request("GET", path, name or path, params=params)
+
+    async def api_post(self, path):
+        """POST to a path on the API service"""
+        return await self.api_request("POST", path, "/workers")
+
+    async def spotify_request(self, method, path, token, **kwargs):
+        """Send a request to the Spotify Web API on behalf of a user"""
+        self.call_counts[f"spotify {method} {path}"] += 1
+        async with self.spotify_semaphore:
+            response = await self.spotify.request(method, path, token, **kwargs)
+        response.raise_for_status()
+        if response.status_code == 204 or not response.content:
+            return None
+        return response.json()
+
+    async def sync_users(self):
+        """Sync users changed since the last cursor from the API service"""
+        changed = []
+        try:
+            while True:
+                params = {"limit": self.sync_page_size}
+                if self.sync_cursor:
+                    params["since"] = self.sync_cursor
+                page = await self.api_get("/users/sync", params=params)
+                # Most changes are token refreshes; mappings are only fetched when their
+                # version moved
+                stale = [
+                    user["user_id"]
+                    for user in page["users"]
+                    if self.mappings_version(user["user_id"]) != user["mappings_version"]
+                ]
+                if stale:
+                    data = await self.api_request(
+                        "POST", "/users/mappings", "/users/mappings", json={"user_ids": stale}
+                    )
+                    for user in data["users"]:
+                        self.update_mapping_index(
+                            user["user_id"], user["mappings_version"], user["mappings"]
+                        )
+                for user in page["users"]:
+                    self.users[user["user_id"]] = user
+                    changed.append(user)
+                if page["next_cursor"]:
+                    self.sync_cursor = page["next_cursor"]
+                if not page["has_more"]:
+                    break
+        except httpx.HTTPError as e:
+            logger.error(f"Error syncing users: {str(e)}")
+        return changed
+
+    async def watch_changes(self):
+        """Follow the API's user change stream, waking the main loop on every event"""
+        delay = self.events_retry_delay
+        while True:
+            try:
+                # Idle streams carry a keepalive every few seconds, so a long read timeout
+                # only trips when the API has gone away
+                async with self.client.stream(
+                    "GET",
+                    f"{self.api_base_url}/users/events",
+                    timeout=httpx.Timeout(10.0, read=60.0),
+                ) as response:
+                    response.raise_for_status()
+                    self.events_connected = True
+                    delay = self.events_retry_delay
+                    logger.info("Following user change events")
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event = json.loads(line[len("data:"):])
+                        # Any event, even one this worker doesn't know, means "sync now"
+                        kind = event.get("kind") if isinstance(event, dict) else None
+                        self.change_events[kind or "unknown"] += 1
+                        self.changes_pending = True
+                        self.wakeup.set()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"User change stream unavailable, polling instead: {str(e)}")
+            except Exception:
+                # Never let the watcher die quietly; the worker would stop reconnecting
+                logger.exception("User change stream failed, polling instead")
+            finally:
+                # Also on cancellation, so sync_if_due falls back to polling
+                self.events_connected = False
+            # Events may have been missed while disconnected
+            self.changes_pending = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.sync_interval)
+
+    async def sync_if_due(self):
+        """Sync on pending change events, or poll when the event stream is down"""
+        sync_interval = self.sync_interval if self.events_connected else self.tick_interval
+        if not self.changes_pending and time.time() - self.last_sync < sync_interval:
+            return
+        self.changes_pending = False
+        self.last_sync = time.time()
+        for user in await self.sync_users():
+            user_id = user["user_id"]
+            scheduled = user_id in self.scheduler or user_id in self.checking
+            if self.owns(user_id) and not scheduled:
+                self.scheduler.schedule(user_id, time.time())
+
+    async def heartbeat(self):
+        """Renew this worker's lease and rebalance when worker membership changes"""
+        try:
+            data = await self.api_post(f"/workers/{self.worker_id}/heartbeat")
+        except httpx.HTTPError as e:
+            logger.error(f"Error renewing worker lease: {str(e)}")
+            return
+
+        workers = tuple(sorted(data["workers"]))
+        if self.ring is not None and self.ring.nodes == workers:
+            return
+        logger.info(f"Worker membership changed, now {len(workers)} workers: {', '.join(workers)}")
+        self.ring = HashRing(workers)
+        self.rebalance()
+
+    async def release(self):
+        """Give up this worker's lease so its users move to the other workers"""
+        try:
+            await self.api_post(f"/workers/{self.worker_id}/release")
+        except httpx.HTTPError as e:
+            logger.error(f"Error releasing worker lease: {str(e)}")
+
+    def owns(self, user_id):
+        return self.ring is not None and self.ring.owner(user_id) == self.worker_id
+
+    def rebalance(self):
+        """Drop users that moved to other workers and schedule the ones that moved here"""
+        now = time.time()
+        for user_id in self.users:
+            if not self.owns(user_id):
+                self.scheduler.remove(user_id)
+                self.token_cache.invalidate(user_id)
+            elif user_id not in self.scheduler and user_id not in self.checking:
+                # Stagger newly acquired users so a rebalance doesn't cause a burst
+                self.scheduler.schedule(user_id, now + random.uniform(0, self.min_interval))
+
+    def snapshot_state(self):
+        """Worker state worth keeping across a restart, as plain data.
+
+        Decrypted tokens are left out; users keep their encrypted ones.
+        """
+        now = time.time()
+        return {
+            "written_at": now,
+            "lookahead": self.lookahead,
+            "sync_cursor": self.sync_cursor,
+            "users": {user_id: dict(user) for user_id, user in self.users.items()},
+            # Index entries are replaced, never mutated, so a shallow copy is enough
+            "mapping_index": dict(self.mapping_index),
+            # Users being checked right now are due again as soon as the worker resumes
+            "due": {**dict.fromkeys(self.checking, now), **self.scheduler.due},
+            "active_users": list(self.active_users),
+            "idle_streak": dict(self.idle_streak),
+            "user_last_check": dict(self.user_last_check),
+            "queue_ledger": self.queue_ledger.dump(),
+        }
+
+    def restore_state(self, state):
+        """Resume from snapshot_state(), staggering the users that fell due in the meantime.
+
+        Everything is read before any of it is applied, so a malformed snapshot raises
+        without leaving the worker half restored.
+        """
+        now = time.time()
+        age = now - state["written_at"]
+        if age > self.snapshot_max_age:
+            logger.info(f"Ignoring snapshot written {age:.0f}s ago")
+            return False
+
+        users = {user_id: dict(user) for user_id, user in state["users"].items()}
+        sync_cursor = None
+        mapping_index = {}
+        if state["lookahead"] == self.lookahead:
+            sync_cursor = state["sync_cursor"]
+            mapping_index = {
+                user_id: (version, {trigger: tuple(songs) for trigger, songs in index.items()})
+                for user_id, (version, index) in state["mapping_index"].items()
+            }
+        # Otherwise the chains were built for another depth; a full sync rebuilds them
+        active_users = set(state["active_users"]) & users.keys()
+        idle_streak = {user_id: int(streak) for user_id, streak in state["idle_streak"].items()}
+        user_last_check = {
+            user_id: float(checked) for user_id, checked in state["user_last_check"].items()
+        }
+        plays = {
+            user_id: {
+                "track_id": play["track_id"],
+                "queued": list(play["queued"]),
+                "started_at": float(play["started_at"]),
+                "progress": float(play["progress"]),
+            }
+            for user_id, play in state["queue_ledger"].items()
+        }
+        due = {user_id: float(due_at) for user_id, due_at in state["due"].items()}
+
+        self.users = users
+        self.sync_cursor = sync_cursor
+        self.mapping_index = mapping_index
+        self.active_users = active_users
+        self.idle_streak = idle_streak
+        self.user_last_check = user_last_check
+        self.queue_ledger.load(plays)
+
+        overdue = sorted(
+            (due_at, user_id)
+            for user_id, due_at in due.items()
+            if user_id in self.users and due_at <= now
+        )
+        for user_id, due_at in due.items():
+            if user_id in self.users and due_at > now:
+                self.scheduler.schedule(user_id, due_at)
+        # Keep their order, so the longest overdue are checked first
+        spacing = self.restart_stagger / len(overdue) if overdue else 0.0
+        for position, (_, user_id) in enumerate(overdue):
+            self.scheduler.schedule(user_id, now + position * spacing)
+        logger.info(
+            f"Resumed {len(self.users)} users from a snapshot written {age:.0f}s ago, "
+            f"{len(overdue)} overdue spread over {self.restart_stagger:g}s"
+        )
+        return True
+
+    def restore_snapshot(self):
+        """Restore from this worker's snapshot, or one a departed worker left behind.
+
+        Returns False when there is no usable snapshot and the worker starts cold.
+        """
+        state = load_snapshot(self.snapshot_path) or self.claim_snapshot()
+        if not state:
+            return False
+        try:
+            restored = self.restore_state(state)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring malformed snapshot {self.snapshot_path}: {str(e)}")
+            return False
+        if restored and self.ring is not None:
+            # A snapshot's due times cover its writer's users; keep the ones owned now
+            self.rebalance()
+        return restored
+
+    def departed_snapshots(self):
+        """Snapshot files of workers missing from the ring, newest first"""
+        if self.ring is None or "{worker_id}" not in self.snapshot_template:
             return []
+        files = snapshot_files(self.snapshot_template)
+        return sorted(
+            (
+                (mtime, path)
+                for worker_id, (path, mtime) in files.items()
+                if worker_id != self.worker_id and worker_id not in self.ring.nodes
+            ),
+            reverse=True,
+        )
 
-    def get_user_token(self, user_id):
-        """Get user's token from the API service"""
+    def claim_snapshot(self):
+        """Take over the newest usable snapshot of a worker whose lease has lapsed.
+
+        Worker ids change when containers are recreated, so this is how workers resume
+        after a deploy. The file is renamed to this worker's path first; the rename is
+        atomic, so two new workers never resume from the same snapshot.
+        """
+        for _, path in self.departed_snapshots():
+            try:
+                os.replace(path, self.snapshot_path)
+            except FileNotFoundError:
+                continue  # claimed by another worker first
+            except OSError as e:
+                logger.error(f"Error claiming snapshot {path}: {str(e)}")
+                continue
+            state = load_snapshot(self.snapshot_path)
+            if state:
+                logger.info(f"Took over snapshot {path}")
+                return state
+        return None
+
+    def prune_snapshots(self):
+        """Delete departed workers' snapshots that are too old to resume from"""
+        cutoff = time.time() - self.snapshot_max_age
+        for mtime, path in self.departed_snapshots():
+            if mtime >= cutoff:
+                continue
+            try:
+                os.unlink(path)
+                logger.info(f"Deleted stale snapshot {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error deleting snapshot {path}: {str(e)}")
+
+    async def write_snapshot(self):
+        """Save a snapshot, serializing off the event loop"""
+        self.last_snapshot = time.time()
+        state = self.snapshot_state()
         try:
-            response = requests.get(
-                f"{self.api_base_url}/users/{user_id}/token",
-                timeout=10  # Add timeout
-            )
-            response.raise_for_status()
-            return self.decrypt_token(response.json()["access_token"])
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching user token: {str(e)}")
+            await asyncio.to_thread(save_snapshot, self.snapshot_path, state)
+        except OSError as e:
+            logger.error(f"Error writing snapshot: {str(e)}")
+
+    async def snapshot_if_due(self):
+        if self.snapshot_path and time.time() - self.last_snapshot >= self.snapshot_interval:
+            await self.write_snapshot()
+            self.prune_snapshots()
+
+    def get_user_token(self, user_id):
+        """Get user's decrypted token from the synced user state"""
+        user = self.users.get(user_id)
+        if not user:
             return None
+        return self.token_cache.get(user_id, user["access_token"], user.get("expires_at"))
 
-    def get_user_mappings(self, user_id):
-        """Fetch all song mappings for a user from the API service"""
+    async def refresh_user_token(self, user_id):
+        """Fetch a user's current token from the API ahead of the synced one expiring"""
         try:
-            response = requests.get(
-                f"{self.api_base_url}/users/{user_id}/mappings",
-                timeout=10  # Add timeout
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching user mappings: {str(e)}")
-            return []
+            data = await self.api_get(f"/users/{user_id}/token", name="/users/{user_id}/token")
+        except httpx.HTTPError as e:
+            self.token_cache.stats["refresh_failures"] += 1
+            logger.warning(f"Error refreshing token for user {user_id}: {str(e)}")
+            return
+        self.token_cache.stats["refreshes"] += 1
+        user = self.users.get(user_id)
+        if user:
+            user["access_token"] = data["access_token"]
+            user["expires_at"] = data.get("expires_at")
 
-    def check_user_active(self, sp):
-        """Check if user has an active Spotify session"""
+    def mappings_version(self, user_id):
+        """Version of the mappings the user's trigger index was built from, if any"""
+        cached = self.mapping_index.get(user_id)
+        return cached[0] if cached else None
+
+    def update_mapping_index(self, user_id, version, mappings):
+        """Rebuild a user's trigger index from their mappings at `version`"""
+        index = {}
+        for mapping in mappings:
+            # dict keys keep insertion order and drop duplicate targets
+            index.setdefault(mapping["trigger_song_id"], {})[mapping["queue_song_id"]] = None
+        successors = {trigger: tuple(targets) for trigger, targets in index.items()}
+        self.mapping_index[user_id] = (
+            version,
+            build_lookahead(successors, self.lookahead) if self.lookahead > 1 else successors,
+        )
+
+    def get_user_mappings(self, user_id):
+        """Get a user's trigger index from the synced user state"""
+        cached = self.mapping_index.get(user_id)
+        return cached[1] if cached else {}
+
+    async def check_user_active(self, token):
+        """Return the user's playback state if they have an active Spotify session"""
         try:
-            playback = sp.current_playback()
-            return playback is not None
+            return await self.spotify_request("GET", "/me/player", token)
+        except SpotifyUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error checking user activity: {str(e)}")
-            return False
+            return None
 
-    def get_current_track(self, sp):
-        """Get the current track ID and next track in queue"""
+    async def get_upcoming_tracks(self, token):
+        """Get the IDs of the tracks in the user's queue, remembering their durations"""
         try:
-            playback = sp.current_playback()
-            if not playback or not playback["item"]:
-                return None, None
+            queue = await self.spotify_request("GET", "/me/player/queue", token)
+            upcoming = [track for track in (queue or {}).get("queue") or [] if track]
+            for track in upcoming:
+                if track.get("duration_ms"):
+                    self.track_durations.set(track["id"], track["duration_ms"] / 1000)
+            return [track["id"] for track in upcoming]
+        except SpotifyUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting queue: {str(e)}")
+            return []
 
-            current_track_id = playback["item"]["id"]
+    async def add_to_queue(self, token, track_id):
+        """Append a track to the user's Spotify queue"""
+        await self.spotify_request(
+            "POST", "/me/player/queue", token, params={"uri": f"spotify:track:{track_id}"}
+        )
 
-            # Get the next track in queue
-            queue = sp.queue()
-            next_track = queue["queue"][0] if queue and queue["queue"] else None
-            next_track_id = next_track["id"] if next_track else None
+    def find_mappings_for_track(self, track_id, mappings):
+        """Find the songs to queue when the given track plays"""
+        return mappings.get(track_id, ())
 
-            return current_track_id, next_track_id
-        except Exception as e:
-            logger.error(f"Error getting current track: {str(e)}")
-            return None, None
+    def next_check_delay(self, user_id, playback, mapped, queued=()):
+        """Seconds until a user should be checked again, based on what they are playing"""
+        if not playback or not playback.get("is_playing") or not playback.get("item"):
+            # Idle or paused: back off exponentially up to max_idle_interval
+            streak = self.idle_streak.get(user_id, 0)
+            self.idle_streak[user_id] = min(streak + 1, 16)
+            return min(self.max_idle_interval, self.check_interval * 2**streak)
 
-    def find_mapping_for_track(self, track_id, mappings):
-        """Find if there's a mapping for the given track"""
-        for mapping in mappings:
-            if mapping["trigger_song_id"] == track_id:
-                return mapping
-        return None
+        self.idle_streak.pop(user_id, None)
+        duration_ms = playback["item"].get("duration_ms") or 0
+        progress_ms = playback.get("progress_ms") or 0
+        remaining = max(0.0, (duration_ms - progress_ms) / 1000)
+        if mapped:
+            # The mapped song is already queued, so nothing can happen before the trigger ends.
+            # With chain lookahead several songs are queued; the check can wait until the last
+            # of them starts, which is still in time to queue the hops after it.
+            ahead = sum(
+                self.track_durations.get(song_id, self.check_interval) for song_id in queued[:-1]
+            )
+            return max(self.min_interval, remaining + ahead + 1)
+        # Not a trigger: check right after the track changes, but no later than
+        # check_interval in case the user skips onto a trigger
+        return max(self.min_interval, min(remaining + 1, self.check_interval))
 
-    def process_user(self, user):
-        """Process a single user's queue"""
+    async def process_user(self, user):
+        """Process a single user's queue and return the delay until their next check"""
         user_id = user["user_id"]
 
         try:
+            if self.token_cache.refresh_due(user_id, user.get("expires_at")):
+                # Swap in a fresh token before Spotify starts rejecting the old one
+                await self.refresh_user_token(user_id)
+
             # Get user's access token
             user_token = self.get_user_token(user_id)
             if not user_token:
                 logger.error(f"Could not get token for user {user_id}")
-                return
-
-            # Initialize Spotify client with decrypted token
-            sp = spotipy.Spotify(auth=user_token)
+                return self.check_interval
 
-            # Rest of the process_user method remains the same
-            if not self.check_user_active(sp):
+            playback = await self.check_user_active(user_token)
+            if not playback:
                 if user_id in self.active_users:
                     logger.info(f"User {user_id} became inactive")
                     self.active_users.remove(user_id)
-                return
+                return self.next_check_delay(user_id, None, False)
 
             if user_id not in self.active_users:
                 logger.info(f"User {user_id} became active")
                 self.active_users.add(user_id)
 
-            current_track_id, next_track_id = self.get_current_track(sp)
+            current_track_id = playback["item"]["id"] if playback.get("item") else None
             if not current_track_id:
-                return
+                return self.next_check_delay(user_id, playback, False)
 
+            # Observed for every track, so leaving a trigger and coming back is a new play
+            queued = self.queue_ledger.observe(user_id, playback)
             mappings = self.get_user_mappings(user_id)
-            mapping = self.find_mapping_for_track(current_track_id, mappings)
+            mapped_song_ids = self.find_mappings_for_track(current_track_id, mappings)
+            pending = [song_id for song_id in mapped_song_ids if song_id not in queued]
+            if not pending:
+                if mapped_song_ids:
+                    # Already queued during this play; no need to read the queue again
+                    self.queue_ledger.stats["queue_reads_skipped"] += 1
+                return self.next_check_delay(user_id, playback, bool(mapped_song_ids), queued)
 
-            if mapping:
-                mapped_song_id = mapping["queue_song_id"]
-                if not next_track_id or next_track_id != mapped_song_id:
-                    try:
-                        sp.add_to_queue(f"spotify:track:{mapped_song_id}")
-                        logger.info(
-                            f"Added mapped song {mapped_song_id} to queue for user {user_id}"
-                        )
-                    except Exception as e:
-                        logger.error(f"Error adding song to queue: {str(e)}")
+            # Only read the queue when there is something we might add to it
+            # Songs carried over from the last play come first, then anything already pending
+            upcoming = (await self.get_upcoming_tracks(user_token))[len(queued) :]
+            handled = True
+            for position, mapped_song_id in enumerate(pending):
+                if position < len(upcoming) and upcoming[position] == mapped_song_id:
+                    # Queued before this worker saw the play (another worker, or the user)
+                    queued.append(mapped_song_id)
+                    continue
+                try:
+                    await self.add_to_queue(user_token, mapped_song_id)
+                    queued.append(mapped_song_id)
+                    QUEUE_ADDS.labels("added").inc()
+                    logger.info(f"Added mapped song {mapped_song_id} to queue for user {user_id}")
+                except SpotifyUnavailableError:
+                    raise
+                except Exception as e:
+                    QUEUE_ADDS.labels("failed").inc()
+                    logger.error(f"Error adding song to queue: {str(e)}")
+                    handled = False
+            return self.next_check_delay(user_id, playback, handled, queued)
+
+        except SpotifyUnavailableError as e:
+            # Spotify is throttling or down; that says nothing about the user's session
+            logger.warning(f"Skipping user {user_id}: {str(e)}")
+            return self.check_interval
 
         except Exception as e:
             logger.error(f"Error processing user {user_id}: {str(e)}")
             if user_id in self.active_users:
                 self.active_users.remove(user_id)
+            return self.check_interval
+
+    async def start_due_checks(self):
+        """Renew the lease, sync, and start a check task for every due user.
+
+        Checks run on their own and reschedule themselves when they finish, so a slow
+        check only delays its own user. Returns the tasks started.
+        """
+        tick_start = time.time()
+        if tick_start - self.last_heartbeat >= self.tick_interval:
+            self.last_heartbeat = tick_start
+            await self.heartbeat()
+        await self.sync_if_due()
+
+        # Until a heartbeat has placed this worker on the ring, it can't tell which of the
+        # users it restored are still its own; checking them all would duplicate the polls
+        # of every other worker
+        due = self.scheduler.pop_due(time.time()) if self.ring is not None else []
+        tasks = []
+        for user_id, due_at in due:
+            # A user is never checked twice at once; their running check reschedules them
+            if user_id in self.checking or user_id not in self.users:
+                continue
+            task = asyncio.create_task(self.check(user_id, due_at))
+            self.checking[user_id] = task
+            tasks.append(task)
+
+        CYCLE_DURATION.observe(time.time() - tick_start)
+        USERS_PER_CYCLE.observe(len(tasks))
+        USERS_OWNED.set(len(self.scheduler) + len(self.checking))
+        USERS_ACTIVE.set(len(self.active_users))
+        CHECKS_IN_FLIGHT.set(len(self.checking))
+        return tasks
+
+    async def check(self, user_id, due_at):
+        """Check one user, then schedule their next check"""
+        started = time.time()
+        try:
+            delay = await self.process_user(self.users[user_id])
+        finally:
+            del self.checking[user_id]
+        finished = time.time()
+        # Lag is how long after its due time the user's check actually completed
+        lag = max(0.0, finished - due_at)
+        self.completed_lags.append(lag)
+        SCHEDULE_LAG.observe(lag)
+        self.user_last_check[user_id] = started
+        # The user may have moved to another worker while being checked
+        if self.owns(user_id):
+            self.scheduler.schedule(user_id, started + delay)
+            if started + delay < self.next_tick_at:
+                # Due before the main loop would next wake up
+                self.wakeup.set()
 
-    def run(self):
+    def report_checks(self, duration):
+        """Lag metrics for the checks completed over the last `duration` seconds"""
+        lags = sorted(self.completed_lags)
+        self.completed_lags = []
+        stats = {
+            "users_total": len(self.users),
+            "users_processed": len(lags),
+            "users_in_flight": len(self.checking),
+            "duration_s": duration,
+            "users_per_s": len(lags) / duration if duration > 0 else 0.0,
+            "lag_avg_s": sum(lags) / len(lags) if lags else 0.0,
+            "lag_p95_s": lags[int(len(lags) * 0.95)] if lags else 0.0,
+            "lag_max_s": lags[-1] if lags else 0.0,
+            "connection_reuse": self.connection_stats.reuse_ratio,
+            "token_cache_hit_ratio": self.token_cache.as_dict()["hit_ratio"],
+        }
+        self.last_cycle_stats = stats
+        if lags and time.time() - self.last_report >= self.report_interval:
+            self.last_report = time.time()
+            logger.info(
+                "Checked %d/%d users in %.2fs (%.1f users/s, %d in flight), "
+                "schedule lag avg=%.2fs p95=%.2fs max=%.2fs, connection reuse %.0f%%, "
+                "token cache hits %.0f%%",
+                stats["users_processed"],
+                stats["users_total"],
+                stats["duration_s"],
+                stats["users_per_s"],
+                stats["users_in_flight"],
+                stats["lag_avg_s"],
+                stats["lag_p95_s"],
+                stats["lag_max_s"],
+                stats["connection_reuse"] * 100,
+                stats["token_cache_hit_ratio"] * 100,
+            )
+        return stats
+
+    async def run_cycle(self):
+        """Start every due user's check, wait for them all and return their lag metrics.
+
+        The main loop never waits on checks; this runs the engine one round at a time
+        for the benchmarks.
+        """
+        cycle_start = time.time()
+        await asyncio.gather(*await self.start_due_checks())
+        return self.report_checks(time.time() - cycle_start)
+
+    def seconds_until_next_tick(self):
+        """Sleep until the next user is due, but wake at least every tick_interval"""
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            return self.tick_interval
+        return max(0.0, min(self.tick_interval, next_due - time.time()))
+
+    async def wait_for_tick(self):
+        """Sleep until the next tick, or until a change event or earlier due check arrives"""
+        timeout = self.seconds_until_next_tick()
+        self.next_tick_at = time.time() + timeout
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def serve_metrics(self, port):
+        """Serve Prometheus metrics, including the existing counters, on `port`"""
+        register_stats(
+            "queue_manager_http_client",
+            "Outbound HTTP requests and connection reuse",
+            self.connection_stats.as_dict,
+        )
+        register_stats(
+            "queue_manager_spotify_client",
+            "Spotify retries, throttling and breaker trips",
+            lambda: self.spotify.stats,
+        )
+        register_stats(
+            "queue_manager_token_cache", "Decrypted token cache counters", self.token_cache.as_dict
+        )
+        register_stats(
+            "queue_manager_queue_ledger", "Plays seen and ledger size", self.queue_ledger.as_dict
+        )
+        register_stats(
+            "queue_manager_change_events", "User change events received", lambda: self.change_events
+        )
+        start_http_server(port)
+
+    async def cancel_checks(self):
+        """Stop the checks still running; their users stay due in the next snapshot"""
+        tasks = list(self.checking.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def create_client(self):
+        """Build the shared keep-alive HTTP client used for both upstreams"""
+        self.client = create_async_client(transport=self.transport, stats=self.connection_stats)
+        self.spotify.client = self.client
+        return self.client
+
+    async def run(self):
         """Main loop to continuously check users and manage queues"""
         logger.info("Starting Spotify Queue Manager")
 
-        while True:
+        async with self.create_client():
+            if self.snapshot_path:
+                # The first heartbeat shows which workers are live, and so whose
+                # snapshots are free to take over
+                self.last_heartbeat = time.time()
+                await self.heartbeat()
+                self.restore_snapshot()
+                self.prune_snapshots()
+            watcher = asyncio.create_task(self.watch_changes())
+            last_tick = time.time()
             try:
-                users = self.get_all_users()
-                current_time = time.time()
-
-                for user in users:
-                    if (
-                        current_time - self.user_last_check.get(user["user_id"], 0)
-                        >= self.check_interval
-                    ):
-                        self.process_user(user)
-                        self.user_last_check[user["user_id"]] = current_time
+                while True:
+                    try:
+                        await self.start_due_checks()
+                        self.report_checks(time.time() - last_tick)
+                        last_tick = time.time()
+                        await self.snapshot_if_due()
+                        await self.wait_for_tick()
 
-                time.sleep(5)
+                    except Exception as e:
+                        logger.error(f"Error in main loop: {str(e)}")
+                        await asyncio.sleep(self.tick_interval)
+            finally:
+                watcher.cancel()
+                await self.cancel_checks()
+                if self.snapshot_path:
+                    await self.write_snapshot()
+                await self.release()
 
-            except Exception as e:
-                logger.error(f"Error in main loop: {str(e)}")
-                time.sleep(5)
 
-if __name__ == "__main__":
+async def main():
     api_base_url = os.getenv("API_BASE_URL", "http://api:8000/api/v1")
     queue_manager = QueueManager(api_base_url)
-    queue_manager.run()
+    queue_manager.serve_metrics(int(os.getenv("METRICS_PORT", "9100")))
+    # Release the worker lease on `docker stop` so users rebalance immediately
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await queue_manager.run()
+    except asyncio.CancelledError:
+        logger.info("Queue Manager stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+"""Prometheus metrics for the queue manager, served on METRICS_PORT"""
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.metrics import CALL_BUCKETS
+
+CYCLE_DURATION = Histogram(
+    "queue_manager_cycle_duration_seconds",
+    "Time for one scheduler tick to renew the lease, sync and start the due checks",
+    buckets=CALL_BUCKETS + (30.0, 60.0),
+)
+USERS_PER_CYCLE = Histogram(
+    "queue_manager_users_per_cycle",
+    "User checks started in one scheduler tick",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000),
+)
+# The polling SLA: a user is checked at most check_interval after they are due
+SCHEDULE_LAG = Histogram(
+    "queue_manager_schedule_lag_seconds",
+    "How long after its due time each user check completed",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0),
+)
+QUEUE_ADDS = Counter(
+    "queue_manager_queue_adds_total",
+    "Mapped tracks sent to users' Spotify queues",
+    ["result"],
+)
+API_REQUEST_DURATION = Histogram(
+    "queue_manager_api_request_duration_seconds",
+    "API service call latency by endpoint and status (or 'error' for transport failures)",
+    ["method", "endpoint", "status"],
+    buckets=CALL_BUCKETS,
+)
+USERS_OWNED = Gauge("queue_manager_users_owned", "Users scheduled on this worker")
+CHECKS_IN_FLIGHT = Gauge("queue_manager_checks_in_flight", "User checks running now")
+USERS_ACTIVE = Gauge("queue_manager_users_active", "Owned users currently playing music")
@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+
+from common.cache import TTLCache
+
+
+class QueueLedger:
+    """Songs queued during each user's current play, so a trigger play adds at most once.
+
+    A play is the track a user is on plus when it started (observation time minus
+    progress_ms). Only each user's latest play is kept: memory is bounded to
+    `maxsize` users (LRU), and entries not observed for `ttl` seconds are dropped.
+
+    A later observation continues the same play when the track matches, progress
+    hasn't gone back, and the start hasn't moved by a whole track length. So a
+    pause keeps the play, while a replay, a seek back to the start, or hearing the
+    track again after something else begins a new one.
+
+    When a new play is of a song queued during the previous one (chain
+    lookahead queues several hops at once), the songs queued after it carry
+    over, so they aren't queued a second time.
+    """
+
+    def __init__(self, maxsize, ttl=3600, tolerance=2.0):
+        self.entries = TTLCache(maxsize, ttl)
+        self.tolerance = tolerance
+        self.stats = Counter()
+
+    def observe(self, user_id, playback, now=None):
+        """Record the user's current play and return the songs queued during it, in order.
+
+        Callers append to the returned list as songs are queued.
+        """
+        now = time.time() if now is None else now
+        item = playback["item"]
+        progress = (playback.get("progress_ms") or 0) / 1000
+        duration = (item.get("duration_ms") or 0) / 1000
+        started_at = now - progress
+
+        play = self.entries.get(user_id, None)
+        if (
+            play is None
+            or play["track_id"] != item["id"]
+            or progress < play["progress"] - self.tolerance
+            or (duration and started_at - play["started_at"] >= duration - self.tolerance)
+        ):
+            queued = []
+            if play is not None and item["id"] in play["queued"]:
+                queued = play["queued"][play["queued"].index(item["id"]) + 1 :]
+                self.stats["carried_over"] += len(queued)
+            play = {"track_id": item["id"], "queued": queued}
+            self.stats["plays"] += 1
+        play["started_at"] = started_at
+        play["progress"] = progress
+        # Re-set on every observation so the TTL counts from the last time it was seen
+        self.entries.set(user_id, play)
+        return play["queued"]
+
+    def dump(self):
+        """Plays by user, least recently seen first, as plain data for a snapshot"""
+        return {
+            user_id: {**play, "queued": list(play["queued"])}
+            for user_id, play in self.entries.items()
+        }
+
+    def load(self, plays):
+        """Restore plays from dump(); their TTL starts over"""
+        for user_id, play in plays.items():
+            self.entries.set(user_id, play)
+
+    def as_dict(self):
+        return {**self.entries.as_dict(), **self.stats}
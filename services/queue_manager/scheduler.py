@@ -0,0 +1,50 @@
+import heapq
+
+
+class PollScheduler:
+    """Min-heap of per-user due times.
+
+    Rescheduling pushes a new entry and leaves the old one in the heap; stale
+    entries are skipped when popped, so every operation stays O(log N).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+
+    def __len__(self):
+        return len(self.due)
+
+    def __contains__(self, user_id):
+        return user_id in self.due
+
+    def schedule(self, user_id, due_at):
+        """Set (or move) a user's next due time"""
+        self.due[user_id] = due_at
+        heapq.heappush(self.heap, (due_at, user_id))
+        # Rebuild once stale entries dominate so memory stays proportional to users
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [(due, uid) for uid, due in self.due.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, user_id):
+        self.due.pop(user_id, None)
+
+    def next_due(self):
+        """Earliest due time, or None when nothing is scheduled"""
+        while self.heap:
+            due_at, user_id = self.heap[0]
+            if self.due.get(user_id) == due_at:
+                return due_at
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now):
+        """Remove and return (user_id, due_at) for every user due at or before now"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_at, user_id = heapq.heappop(self.heap)
+            if self.due.get(user_id) == due_at:
+                del self.due[user_id]
+                due.append((user_id, due_at))
+        return due
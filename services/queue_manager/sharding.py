@@ -0,0 +1,28 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """Consistent hash ring mapping user IDs onto live workers.
+
+    Each worker gets `replicas` virtual nodes so users spread evenly and only
+    about 1/N of them move when a worker joins or leaves.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = tuple(sorted(nodes))
+        self.ring = sorted(
+            (self.hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas)
+        )
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def owner(self, key):
+        """Worker responsible for the given key, or None for an empty ring"""
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.keys, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
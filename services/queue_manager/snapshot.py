@@ -0,0 +1,82 @@
+"""Compact on-disk snapshots of worker state, so a restarted worker resumes where it left off"""
+import gzip
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the snapshot layout changes; older snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path, state):
+    """Write `state` as gzipped JSON, replacing the previous snapshot atomically.
+
+    The data goes to a uniquely named temporary file and is fsynced before the
+    rename, so concurrent writers can't clobber each other's partial files and a
+    crash leaves either the old snapshot or the new one.
+    """
+    data = json.dumps({"version": SNAPSHOT_VERSION, **state}, separators=(",", ":")).encode()
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=1))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def load_snapshot(path):
+    """Read a snapshot written by save_snapshot; None when missing, unreadable or outdated"""
+    try:
+        with open(path, "rb") as f:
+            state = json.loads(gzip.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        # A truncated gzip stream raises EOFError rather than OSError
+        logger.warning(f"Ignoring unreadable snapshot {path}: {str(e)}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+        version = state.get("version") if isinstance(state, dict) else None
+        logger.warning(f"Ignoring snapshot {path} with version {version}")
+        return None
+    return state
+
+
+def snapshot_files(template):
+    """Snapshots on disk for a path template containing "{worker_id}".
+
+    Returns {worker_id: (path, mtime)}; temporary files from save_snapshot are skipped.
+    """
+    directory, name = os.path.split(os.path.abspath(template))
+    prefix, _, suffix = name.partition("{worker_id}")
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    files = {}
+    for file_name in names:
+        if (
+            len(file_name) <= len(prefix) + len(suffix)
+            or not file_name.startswith(prefix)
+            or not file_name.endswith(suffix)
+            or file_name.endswith(".tmp")
+        ):
+            continue
+        path = os.path.join(directory, file_name)
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+        files[file_name[len(prefix) : len(file_name) - len(suffix)]] = (path, mtime)
+    return files
@@ -0,0 +1,22 @@
+import logging
+import os
+import sys
+
+import pytest
+from cryptography.fernet import Fernet
+
+QUEUE_MANAGER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    QUEUE_MANAGER_DIR,
+    os.path.dirname(QUEUE_MANAGER_DIR),
+    os.path.join(QUEUE_MANAGER_DIR, "benchmarks"),
+]
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Test the engine itself, not the client-side Spotify rate limit
+os.environ.setdefault("SPOTIFY_RATE_LIMIT", "1000000")
+os.environ.setdefault("SPOTIFY_BURST", "1000000")
+
+
+@pytest.fixture(autouse=True)
+def quiet_engine():
+    logging.getLogger("main").setLevel(logging.WARNING)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+
+from main import QueueManager
+
+
+def make_manager(handler):
+    manager = QueueManager("http://api.test/v1", transport=httpx.MockTransport(handler))
+    manager.events_retry_delay = 0.01
+    return manager
+
+
+async def watch_until(manager, condition, timeout=5):
+    watcher = asyncio.create_task(manager.watch_changes())
+    deadline = time.monotonic() + timeout
+    try:
+        while not condition():
+            assert not watcher.done(), "watcher stopped"
+            assert time.monotonic() < deadline, "timed out"
+            await asyncio.sleep(0.01)
+    finally:
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+
+
+def test_malformed_events_neither_kill_nor_stall_the_watcher():
+    connects = []
+
+    def handler(request):
+        connects.append(request)
+        body = b'data: {"kind": "user_added"}\n\ndata: {"user_id": "u"}\n\ndata: [1]\n\n'
+        return httpx.Response(200, content=body)
+
+    async def scenario():
+        manager = make_manager(handler)
+        async with manager.create_client():
+            await watch_until(manager, lambda: len(connects) >= 3)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.change_events["user_added"] >= 2
+    assert manager.change_events["unknown"] >= 4
+    assert manager.changes_pending
+    assert not manager.events_connected
+
+
+def test_disconnect_falls_back_to_polling():
+    def handler(request):
+        raise httpx.ConnectError("API is down", request=request)
+
+    async def scenario():
+        manager = make_manager(handler)
+        manager.events_connected = True
+        manager.changes_pending = False
+        async with manager.create_client():
+            await watch_until(manager, lambda: manager.changes_pending)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert not manager.events_connected
+
+
+def test_cancelled_watcher_is_not_left_connected():
+    async def scenario():
+        manager = make_manager(lambda request: httpx.Response(200, content=stream()))
+        async with manager.create_client():
+            watcher = asyncio.create_task(manager.watch_changes())
+            while not manager.events_connected:
+                await asyncio.sleep(0.01)
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        return manager
+
+    async def stream():
+        yield b": keepalive\n\n"
+        await asyncio.sleep(10)
+
+    assert not asyncio.run(scenario()).events_connected
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from main import QueueManager
+from stub_services import STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL, StubServices
+
+
+class SlowUserStub(StubServices):
+    """StubServices where one user's playback takes `delay` seconds to answer"""
+
+    def __init__(self, cipher_suite, slow_user, delay, **kwargs):
+        super().__init__(cipher_suite, latency=0, **kwargs)
+        self.slow_user = slow_user
+        self.delay = delay
+
+    async def handle(self, request):
+        if request.headers.get("Authorization") == f"Bearer token-{self.slow_user}":
+            await asyncio.sleep(self.delay)
+        return await super().handle(request)
+
+
+def make_manager(users=20, delay=2.0):
+    manager = QueueManager(STUB_API_BASE_URL, STUB_SPOTIFY_BASE_URL)
+    stub = SlowUserStub(manager.cipher_suite, "user0", delay, num_users=users)
+    manager.transport = stub.transport()
+    return manager, stub
+
+
+def make_all_due(manager):
+    now = time.time()
+    for user_id in list(manager.scheduler.due):
+        manager.scheduler.schedule(user_id, now)
+
+
+def test_slow_check_does_not_hold_up_other_users():
+    async def scenario():
+        manager, stub = make_manager()
+        async with manager.create_client():
+            tasks = await manager.start_due_checks()
+            assert len(tasks) == 20
+            await asyncio.sleep(0.2)
+            # Everyone but the slow user has been checked and rescheduled
+            assert set(manager.checking) == {"user0"}
+            assert len(manager.scheduler) == 19
+
+            make_all_due(manager)
+            tasks = await manager.start_due_checks()
+            assert len(tasks) == 19
+            await asyncio.gather(*tasks)
+            stats = manager.report_checks(1.0)
+            assert stats["users_processed"] == 38
+            assert stats["users_in_flight"] == 1
+            assert stats["lag_max_s"] < 1.0
+
+            await manager.cancel_checks()
+            assert not manager.checking
+
+    asyncio.run(scenario())
+
+
+def test_user_is_never_checked_twice_at_once():
+    async def scenario():
+        manager, stub = make_manager(users=3, delay=0.5)
+        async with manager.create_client():
+            await manager.start_due_checks()
+            await asyncio.sleep(0.1)
+            # A sync or rebalance must not put the in-flight user back on the schedule
+            manager.changes_pending = True
+            manager.rebalance()
+            await manager.sync_if_due()
+            assert "user0" not in manager.scheduler
+            manager.scheduler.schedule("user0", 0.0)
+            assert await manager.start_due_checks() == []
+            while manager.checking:
+                await asyncio.sleep(0.05)
+            assert stub.calls["spotify.stub GET player"] == 3
+            assert "user0" in manager.scheduler
+
+    asyncio.run(scenario())
+
+
+def test_in_flight_users_are_due_in_the_snapshot():
+    async def scenario():
+        manager, stub = make_manager(users=3, delay=0.5)
+        async with manager.create_client():
+            await manager.start_due_checks()
+            await asyncio.sleep(0.1)
+            state = manager.snapshot_state()
+            await manager.cancel_checks()
+        assert set(state["due"]) == {"user0", "user1", "user2"}
+        assert state["due"]["user0"] <= state["written_at"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+import asyncio
+
+import bench_lookahead
+from lookahead import build_lookahead
+
+
+def test_depth_one_is_the_mapped_songs():
+    successors = {"A": ("B",), "B": ("C",), "X": ("Y", "Z")}
+    assert build_lookahead(successors, 1) == successors
+
+
+def test_follows_a_linear_chain_up_to_depth():
+    successors = {"A": ("B",), "B": ("C",), "C": ("D",), "D": ("E",)}
+    chains = build_lookahead(successors, 3)
+    assert chains["A"] == ("B", "C", "D")
+    assert chains["C"] == ("D", "E")
+    assert chains["D"] == ("E",)
+
+
+def test_cycle_is_queued_at_most_once_around():
+    successors = {"A": ("B",), "B": ("C",), "C": ("A",)}
+    chains = build_lookahead(successors, 5)
+    assert chains["A"] == ("B", "C")
+    assert chains["C"] == ("A", "B")
+    assert build_lookahead({"A": ("A",)}, 3) == {"A": ("A",)}
+
+
+def test_stops_at_a_branch():
+    successors = {"P": ("Q",), "Q": ("R", "S"), "R": ("T",), "X": ("Y", "Z"), "Y": ("W",)}
+    chains = build_lookahead(successors, 3)
+    # The branch itself is queued, but nothing after it
+    assert chains["P"] == ("Q", "R", "S")
+    assert chains["X"] == ("Y", "Z")
+
+
+def test_stops_before_a_song_already_on_the_path():
+    successors = {"A": ("B",), "B": ("C", "A")}
+    assert build_lookahead(successors, 3)["A"] == ("B",)
+
+
+def test_lookahead_reduces_polls_without_more_breaks(monkeypatch):
+    # simulate() sets QUEUE_LOOKAHEAD; this restores it afterwards
+    monkeypatch.setenv("QUEUE_LOOKAHEAD", "1")
+    shallow = asyncio.run(bench_lookahead.simulate(20, 1, 1))
+    deep = asyncio.run(bench_lookahead.simulate(20, 1, 3))
+    assert deep.trigger_ends and shallow.trigger_ends
+    assert deep.calls["spotify.stub GET player"] < shallow.calls["spotify.stub GET player"]
+    assert deep.breaks / deep.trigger_ends <= shallow.breaks / shallow.trigger_ends
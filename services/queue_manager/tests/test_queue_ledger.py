@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import bench_queue_ledger
+from queue_ledger import QueueLedger
+
+
+def playback(track_id, progress_s, duration_s=200):
+    return {
+        "progress_ms": int(progress_s * 1000),
+        "item": {"id": track_id, "duration_ms": int(duration_s * 1000)},
+    }
+
+
+def test_same_play_across_observations():
+    ledger = QueueLedger(10)
+    queued = ledger.observe("u", playback("A", 10), now=100)
+    queued.append("B")
+    assert ledger.observe("u", playback("A", 40), now=130) == ["B"]
+    assert ledger.stats["plays"] == 1
+
+
+def test_pause_keeps_the_play():
+    ledger = QueueLedger(10)
+    ledger.observe("u", playback("A", 10), now=100).append("B")
+    # Paused for longer than the track, still polled while paused
+    for now in range(130, 700, 30):
+        assert ledger.observe("u", playback("A", 10), now=now) == ["B"]
+    assert ledger.observe("u", playback("A", 20), now=710) == ["B"]
+
+
+def test_replay_and_seek_back_start_a_new_play():
+    ledger = QueueLedger(10)
+    ledger.observe("u", playback("A", 100), now=100).append("B")
+    assert ledger.observe("u", playback("A", 1), now=110) == []
+    ledger.observe("u", playback("A", 5), now=114).append("B")
+    # Heard again a whole track length later with no observation in between
+    assert ledger.observe("u", playback("A", 5), now=414) == []
+    assert ledger.stats["plays"] == 3
+
+
+def test_other_track_starts_a_new_play():
+    ledger = QueueLedger(10)
+    ledger.observe("u", playback("A", 10), now=100).append("B")
+    assert ledger.observe("u", playback("X", 1), now=120) == []
+
+
+def test_lookahead_songs_carry_over():
+    ledger = QueueLedger(10)
+    ledger.observe("u", playback("A", 10), now=100).extend(["B", "C", "D"])
+    assert ledger.observe("u", playback("B", 1), now=300) == ["C", "D"]
+    assert ledger.observe("u", playback("C", 1), now=500) == ["D"]
+    assert ledger.stats["carried_over"] == 3
+
+
+def test_users_are_independent_and_bounded():
+    ledger = QueueLedger(2)
+    ledger.observe("u1", playback("A", 10), now=100).append("B")
+    ledger.observe("u2", playback("A", 10), now=100)
+    ledger.observe("u3", playback("A", 10), now=100)
+    # u1 was least recently seen, so its play was evicted
+    assert ledger.observe("u1", playback("A", 20), now=110) == []
+
+
+def test_dump_and_load_round_trip():
+    ledger = QueueLedger(10)
+    ledger.observe("u", playback("A", 10), now=100).extend(["B", "C"])
+    restored = QueueLedger(10)
+    restored.load(ledger.dump())
+    assert restored.observe("u", playback("A", 40), now=130) == ["B", "C"]
+    assert restored.observe("u", playback("B", 1), now=300) == ["C"]
+
+
+def test_trigger_play_is_queued_once():
+    # bench_queue_ledger's scenarios: repeated checks, a replay, the next track
+    results = asyncio.run(bench_queue_ledger.bench(200, 5))
+    for label in ("same play", "replayed", "next track"):
+        adds_per_play, reads_per_play = results[label]
+        assert adds_per_play == pytest.approx(1.0), label
+        assert reads_per_play == pytest.approx(1.0), label
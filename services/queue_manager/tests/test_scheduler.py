@@ -0,0 +1,43 @@
+from scheduler import PollScheduler
+
+
+def test_pop_due_returns_due_users_in_order():
+    scheduler = PollScheduler()
+    scheduler.schedule("b", 20.0)
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("c", 30.0)
+    assert scheduler.next_due() == 10.0
+    assert scheduler.pop_due(25.0) == [("a", 10.0), ("b", 20.0)]
+    assert "a" not in scheduler and "c" in scheduler
+    assert len(scheduler) == 1
+
+
+def test_rescheduled_entries_are_skipped():
+    scheduler = PollScheduler()
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("b", 15.0)
+    scheduler.schedule("a", 50.0)
+    assert scheduler.next_due() == 15.0
+    assert scheduler.pop_due(20.0) == [("b", 15.0)]
+    # Moving a user earlier also wins over its stale later entry
+    scheduler.schedule("a", 5.0)
+    assert scheduler.pop_due(60.0) == [("a", 5.0)]
+    assert scheduler.next_due() is None
+
+
+def test_removed_users_are_never_returned():
+    scheduler = PollScheduler()
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("b", 20.0)
+    scheduler.remove("a")
+    scheduler.remove("missing")
+    assert scheduler.next_due() == 20.0
+    assert scheduler.pop_due(100.0) == [("b", 20.0)]
+
+
+def test_heap_stays_proportional_to_users():
+    scheduler = PollScheduler()
+    for n in range(10_000):
+        scheduler.schedule(f"user{n % 10}", float(n))
+    assert len(scheduler.heap) <= 2 * len(scheduler) + 64
+    assert scheduler.pop_due(9_994.0) == [(f"user{n}", float(9_990 + n)) for n in range(5)]
@@ -0,0 +1,36 @@
+import asyncio
+from collections import Counter
+
+import bench_sharding
+from sharding import HashRing
+
+USERS = [f"user{n}" for n in range(3000)]
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner("user0") is None
+
+
+def test_owner_is_deterministic_and_order_independent():
+    ring = HashRing(["w1", "w2", "w3"])
+    other = HashRing(["w3", "w1", "w2"])
+    assert all(ring.owner(user_id) == other.owner(user_id) for user_id in USERS)
+
+
+def test_users_spread_across_workers():
+    owners = Counter(HashRing(["w1", "w2", "w3"]).owner(user_id) for user_id in USERS)
+    assert set(owners) == {"w1", "w2", "w3"}
+    assert min(owners.values()) > len(USERS) / 3 * 0.7
+
+
+def test_only_the_leaving_workers_users_move():
+    before = HashRing(["w1", "w2", "w3"])
+    after = HashRing(["w1", "w2"])
+    moved = [user_id for user_id in USERS if before.owner(user_id) != after.owner(user_id)]
+    assert moved
+    assert all(before.owner(user_id) == "w3" for user_id in moved)
+
+
+def test_every_user_has_exactly_one_worker():
+    # bench_sharding's scenario: all workers, then one releases its lease
+    assert asyncio.run(bench_sharding.bench(300, 3))
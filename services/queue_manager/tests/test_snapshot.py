@@ -0,0 +1,131 @@
+import gzip
+import os
+import time
+
+import pytest
+
+from main import QueueManager
+from sharding import HashRing
+from snapshot import load_snapshot, save_snapshot, snapshot_files
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    monkeypatch.setenv("SNAPSHOT_PATH", str(tmp_path / "{worker_id}.json.gz"))
+    monkeypatch.setenv("RESTART_STAGGER", "30")
+
+    def make(worker_id="me", live=("me",)):
+        monkeypatch.setenv("WORKER_ID", worker_id)
+        manager = QueueManager("http://api.test/v1")
+        manager.ring = HashRing(live)
+        return manager
+
+    return make
+
+
+def state_for(users, due, written_at=None):
+    return {
+        "written_at": time.time() if written_at is None else written_at,
+        "lookahead": 1,
+        "sync_cursor": "cursor",
+        "users": {user_id: {"user_id": user_id, "access_token": "x"} for user_id in users},
+        "mapping_index": {user_id: [1, {"a": ["b"]}] for user_id in users},
+        "due": due,
+        "active_users": list(users),
+        "idle_streak": {},
+        "user_last_check": {},
+        "queue_ledger": {},
+    }
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "w.json.gz"
+    save_snapshot(path, {"written_at": 1.0, "due": {"u": 2.0}})
+    assert load_snapshot(path) == {"version": 1, "written_at": 1.0, "due": {"u": 2.0}}
+    assert [name for name in os.listdir(tmp_path)] == ["w.json.gz"]
+
+
+def test_missing_truncated_or_foreign_snapshots_load_as_none(tmp_path):
+    path = tmp_path / "w.json.gz"
+    assert load_snapshot(path) is None
+    save_snapshot(path, {"written_at": 1.0})
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+    assert load_snapshot(path) is None
+    path.write_bytes(b"not gzip")
+    assert load_snapshot(path) is None
+    path.write_bytes(gzip.compress(b'{"version": 0}'))
+    assert load_snapshot(path) is None
+    path.write_bytes(gzip.compress(b"[1, 2]"))
+    assert load_snapshot(path) is None
+
+
+def test_overdue_users_are_staggered_longest_overdue_first(make_manager):
+    manager = make_manager()
+    now = time.time()
+    due = {"late": now - 100, "later": now - 200, "future": now + 500}
+    assert manager.restore_state(state_for(due, due))
+    assert manager.scheduler.due["future"] == pytest.approx(now + 500)
+    assert manager.scheduler.due["later"] < manager.scheduler.due["late"]
+    assert manager.scheduler.due["late"] <= time.time() + 30
+    assert manager.sync_cursor == "cursor"
+    assert manager.mapping_index["late"] == (1, {"a": ("b",)})
+
+
+def test_old_snapshot_is_ignored(make_manager):
+    manager = make_manager()
+    assert not manager.restore_state(state_for(["u"], {"u": 0.0}, written_at=time.time() - 7200))
+    assert not manager.users
+
+
+def test_other_lookahead_depth_drops_the_index_and_cursor(make_manager):
+    manager = make_manager()
+    state = state_for(["u"], {"u": time.time()})
+    state["lookahead"] = 3
+    assert manager.restore_state(state)
+    assert manager.mapping_index == {}
+    assert manager.sync_cursor is None
+
+
+def test_malformed_snapshot_leaves_the_worker_cold(make_manager):
+    manager = make_manager()
+    state = state_for(["u"], {"u": "soon"})
+    save_snapshot(manager.snapshot_path, state)
+    assert not manager.restore_snapshot()
+    assert not manager.users and not manager.scheduler
+
+
+def test_restored_users_are_rebalanced_onto_the_ring(make_manager):
+    manager = make_manager(live=("me", "other"))
+    users = [f"user{n}" for n in range(50)]
+    save_snapshot(manager.snapshot_path, state_for(users, dict.fromkeys(users, time.time())))
+    assert manager.restore_snapshot()
+    assert set(manager.scheduler.due) == {u for u in users if manager.ring.owner(u) == "me"}
+
+
+def test_new_worker_takes_over_a_departed_workers_snapshot(make_manager, tmp_path):
+    old = make_manager("old-1")
+    save_snapshot(old.snapshot_path, state_for(["u"], {"u": time.time()}))
+    live = make_manager("live-1")
+    save_snapshot(live.snapshot_path, state_for(["v"], {"v": time.time()}))
+
+    manager = make_manager("new-1", live=("new-1", "live-1"))
+    assert manager.restore_snapshot()
+    assert set(manager.users) == {"u"}
+    # The claimed file now belongs to the new worker; the live worker's is untouched
+    assert set(snapshot_files(manager.snapshot_template)) == {"new-1", "live-1"}
+
+    # Nothing left to claim for the next new worker
+    assert not make_manager("new-2", live=("new-1", "new-2", "live-1")).restore_snapshot()
+
+
+def test_stale_departed_snapshots_are_pruned(make_manager):
+    for worker_id in ("gone-old", "gone-recent", "live-old"):
+        save_snapshot(make_manager(worker_id).snapshot_path, state_for([], {}))
+    stale = time.time() - 7200
+    for worker_id in ("gone-old", "live-old"):
+        os.utime(make_manager(worker_id).snapshot_path, (stale, stale))
+
+    manager = make_manager("me", live=("me", "live-old"))
+    manager.prune_snapshots()
+    assert set(snapshot_files(manager.snapshot_template)) == {"gone-recent", "live-old"}
@@ -0,0 +1,69 @@
+import time
+
+from token_cache import TokenCache
+
+
+class CountingDecrypt:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, ciphertext):
+        self.calls += 1
+        return None if ciphertext == "bad" else f"plain-{ciphertext}"
+
+
+def test_decrypts_once_per_ciphertext():
+    decrypt = CountingDecrypt()
+    cache = TokenCache(decrypt, 10)
+    assert cache.get("u", "c1") == "plain-c1"
+    assert cache.get("u", "c1") == "plain-c1"
+    assert decrypt.calls == 1
+    # The API handed out a new token
+    assert cache.get("u", "c2") == "plain-c2"
+    assert decrypt.calls == 2
+    assert cache.stats["invalidated"] == 1
+
+
+def test_expired_tokens_are_never_returned():
+    decrypt = CountingDecrypt()
+    cache = TokenCache(decrypt, 10)
+    assert cache.get("u", "c1", expires_at=time.time() + 60) == "plain-c1"
+    assert cache.get("u", "c1", expires_at=time.time() - 1) is None
+    assert cache.stats["expired"] == 1
+    assert "u" not in dict(cache.entries.items())
+
+
+def test_undecryptable_tokens_are_not_cached():
+    decrypt = CountingDecrypt()
+    cache = TokenCache(decrypt, 10)
+    assert cache.get("u", "bad") is None
+    assert cache.get("u", "bad") is None
+    assert decrypt.calls == 2
+
+
+def test_bounded_to_maxsize_users():
+    decrypt = CountingDecrypt()
+    cache = TokenCache(decrypt, 2)
+    for user_id in ("a", "b", "c"):
+        cache.get(user_id, user_id)
+    cache.get("a", "a")
+    assert decrypt.calls == 4
+
+
+def test_invalidate_forces_a_decrypt():
+    decrypt = CountingDecrypt()
+    cache = TokenCache(decrypt, 10)
+    cache.get("u", "c1")
+    cache.invalidate("u")
+    cache.get("u", "c1")
+    assert decrypt.calls == 2
+
+
+def test_refresh_due_within_the_margin_at_most_once_per_retry():
+    cache = TokenCache(CountingDecrypt(), 10, refresh_margin=300, refresh_retry=0.05)
+    assert not cache.refresh_due("u", None)
+    assert not cache.refresh_due("u", time.time() + 3600)
+    assert cache.refresh_due("u", time.time() + 100)
+    assert not cache.refresh_due("u", time.time() + 100)
+    time.sleep(0.06)
+    assert cache.refresh_due("u", time.time() + 100)
@@ -0,0 +1,59 @@
+import time
+from collections import Counter
+
+from common.cache import TTLCache
+
+
+class TokenCache:
+    """Decrypted access tokens per user, bounded to `maxsize` users (LRU).
+
+    Each entry remembers the ciphertext it was decrypted from, so a token that
+    changed in the API is decrypted again on next use. Tokens whose expires_at
+    (epoch seconds, when known) has passed are never returned, and
+    refresh_due() flags them `refresh_margin` seconds ahead of time.
+    """
+
+    def __init__(self, decrypt, maxsize, refresh_margin=300, refresh_retry=30):
+        self.decrypt = decrypt
+        self.refresh_margin = refresh_margin
+        # Entries stay valid until the token itself changes
+        self.entries = TTLCache(maxsize, float("inf"))
+        # Users whose token refresh was attempted recently, so an API that has no newer
+        # token yet isn't asked again on every check
+        self.refresh_attempts = TTLCache(maxsize, refresh_retry)
+        self.stats = Counter()
+
+    def get(self, user_id, encrypted_token, expires_at=None):
+        """The decrypted token, or None when it has expired or cannot be decrypted"""
+        if expires_at is not None and expires_at <= time.time():
+            self.entries.pop(user_id)
+            self.stats["expired"] += 1
+            return None
+
+        entry = self.entries.get(user_id, None)
+        if entry is not None:
+            cached_ciphertext, token = entry
+            if cached_ciphertext == encrypted_token:
+                return token
+            self.stats["invalidated"] += 1
+
+        token = self.decrypt(encrypted_token)
+        self.stats["decrypts"] += 1
+        if token is not None:
+            self.entries.set(user_id, (encrypted_token, token))
+        return token
+
+    def refresh_due(self, user_id, expires_at):
+        """Whether to fetch a newer token now; True at most once per refresh_retry seconds"""
+        if expires_at is None or expires_at - time.time() > self.refresh_margin:
+            return False
+        if self.refresh_attempts.get(user_id, None) is not None:
+            return False
+        self.refresh_attempts.set(user_id, True)
+        return True
+
+    def invalidate(self, user_id):
+        self.entries.pop(user_id)
+
+    def as_dict(self):
+        return {**self.entries.as_dict(), **self.stats}